@@ -0,0 +1,154 @@
+"""
+Command line for the channel archive index (archive_index.py).
+
+    python archive.py add INDEX_DIR VIDEO_ID SOURCE       Fingerprint a VOD (URL or local file) and add it to the index
+    python archive.py append INDEX_DIR VIDEO_ID SOURCE    Add the next part of a VOD (or the newly published audio of a stream)
+    python archive.py query INDEX_DIR --clip SOURCE ...   Find which VOD contains the clip, and at what time
+    python archive.py stats INDEX_DIR                     Build time and size of the index, per hour of audio
+
+Results are printed as JSON on stdout, other messages go to stderr.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import librosa
+
+from archive_index import ArchiveIndex
+from cli import classify_source
+from download_en import Download
+from fingerprint import FingerprintIdentifier
+from locator import load_clip, split_long_audio
+from main_en import download_sound_file, filter_warning
+from split_audio_large_segments_en import LargeAudioSplitter
+from time_calculate import time_format
+
+
+def iter_audio_chunks(paths, sr):
+    """
+    Load the split files one at a time, so only one hour of audio is in memory.
+    """
+    for path in paths:
+        audio, _ = librosa.load(path, sr=sr)
+        yield audio
+
+
+def add_command(args):
+    return index_source(args, append=False)
+
+
+def append_command(args):
+    return index_source(args, append=True)
+
+
+def index_source(args, append):
+    if os.path.exists(os.path.join(args.index, "manifest.json")):
+        index = ArchiveIndex.load(args.index)
+    else:
+        index = ArchiveIndex(FingerprintIdentifier(), shard_count=args.shards)
+    with index:
+        source, source_type = classify_source(args.source)
+
+        work_dir = tempfile.mkdtemp(prefix="highlightlocator_archive_")
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                if source_type == "file":
+                    long_voice_path = source
+                    long_voice_time = librosa.get_duration(path=source)
+                else:
+                    audio_path = os.path.join(work_dir, "audio")
+                    long_voice_time = Download(source, audio_path).get_time_info()
+                    long_voice_path = download_sound_file(source, audio_path, 1, source_type)
+                segment_paths = split_long_audio(LargeAudioSplitter, long_voice_path, long_voice_time, args.split_duration,
+                                                 os.path.join(work_dir, "segment", "segments"))
+                chunks = iter_audio_chunks(segment_paths, index.analyzer.sr)
+                if append:
+                    video = index.append_audio(args.video_id, chunks)
+                else:
+                    video = index.add_video(args.video_id, chunks)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        index.save(args.index, compressed=args.format == "compressed")
+        return {"added": video, "index": index.stats()}
+
+
+def query_command(args):
+    with ArchiveIndex.load(args.index) as index:
+        clip, clip_type = classify_source(args.clip)
+        start_time = time_format.str_to_sec(args.start)
+        end_time = time_format.str_to_sec(args.end)
+        sr = index.analyzer.sr
+
+        work_dir = tempfile.mkdtemp(prefix="highlightlocator_archive_")
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                if clip_type == "file":
+                    short_audio_array, _ = load_clip(clip, sr, start_time, end_time)
+                else:
+                    short_voice_path = download_sound_file(clip, os.path.join(work_dir, "audio"), 2, clip_type, start_time, end_time)
+                    short_audio_array, _ = load_clip(short_voice_path, sr)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return index.query(short_audio_array, top=args.top, workers=args.workers, min_margin=args.min_margin)
+
+
+def stats_command(args):
+    with ArchiveIndex.load(args.index) as index:
+        return {"index": index.stats(), "videos": index.videos}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Channel archive index: which VOD contains this clip, and at what time.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="Fingerprint a VOD and add it to the index")
+    add.add_argument("index", help="Index directory (created if it does not exist)")
+    add.add_argument("video_id", help="Identifier returned by queries, for example the video ID")
+    add.add_argument("source", help="VOD URL (YouTube or Twitch) or local media file")
+    add.add_argument("--shards", type=int, default=8, help="Number of shards of a new index (default 8)")
+    add.add_argument("--split-duration", type=int, default=3600, help="Length of the files the VOD is decoded in (default 3600)")
+    add.add_argument("--format", choices=["compressed", "npz"], default="compressed",
+                     help="On-disk format of the shards: varint compressed blocks, or uncompressed numpy arrays")
+    add.set_defaults(run=add_command)
+
+    append = commands.add_parser("append", help="Add the next part of a VOD already in the index (or start a new one)")
+    append.add_argument("index", help="Index directory (created if it does not exist)")
+    append.add_argument("video_id", help="Identifier of the VOD the audio belongs to")
+    append.add_argument("source", help="URL (YouTube or Twitch) or local media file of the new part only")
+    append.add_argument("--shards", type=int, default=8, help="Number of shards of a new index (default 8)")
+    append.add_argument("--split-duration", type=int, default=3600, help="Length of the files the audio is decoded in (default 3600)")
+    append.add_argument("--format", choices=["compressed", "npz"], default="compressed",
+                        help="On-disk format of the shards: varint compressed blocks, or uncompressed numpy arrays")
+    append.set_defaults(run=append_command)
+
+    query = commands.add_parser("query", help="Find the VOD and time of a clip")
+    query.add_argument("index", help="Index directory")
+    query.add_argument("--clip", required=True, help="Highlight video URL (YouTube or Twitch) or local media file")
+    query.add_argument("--start", default="0", help="Start of the clip range, SS, MM:SS or HH:MM:SS (default 0)")
+    query.add_argument("--end", default="10", help="End of the clip range, SS, MM:SS or HH:MM:SS (default 10)")
+    query.add_argument("--top", type=int, default=5, help="Number of candidates to return (default 5)")
+    query.add_argument("--workers", type=int, help="Threads used to search the shards (default: one per shard)")
+    query.add_argument("--min-margin", type=float, default=2.0, help="Required ratio between the best and the second best VOD")
+    query.set_defaults(run=query_command)
+
+    stats = commands.add_parser("stats", help="Show the build time and size of the index")
+    stats.add_argument("index", help="Index directory")
+    stats.set_defaults(run=stats_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    filter_warning()
+    print(json.dumps(args.run(args), indent=2))
+    return 0
+
+
+# Entry point
+if __name__ == "__main__":
+    sys.exit(main())
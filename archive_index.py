@@ -0,0 +1,554 @@
+"""
+Sharded fingerprint index over many streams (VODs) of a channel.
+
+Instead of downloading and scanning candidate VODs one by one, every VOD is fingerprinted once and its
+hashes are stored in a shared index, each posting tagged with the video it comes from. A query fingerprints
+the clip and answers "which VOD, at what time" with one lookup.
+
+Layout:
+    - Hashkeys are packed into int64 (fingerprint.pack_hashkey) and distributed over shards by hashkey.
+    - Each shard keeps its unique hashkeys sorted, and for every hashkey the postings (video index, frame).
+    - A query binary searches its hashkeys in each shard (log of the archive size per hashkey, not linear)
+      and the shards are searched in parallel.
+    - Votes are counted per (video, frame offset), exactly like the offset histogram of FingerprintIdentifier.identify.
+    - On disk every shard is one compressed file (compressed_postings.py): varint deltas in blocks with a directory
+      and checksums. A loaded shard stays on disk, and a query decodes only the blocks of its hashkeys.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from compressed_postings import CompressedRun, write_compressed_run
+from fingerprint import FingerprintIdentifier, expand_ranges, unpack_hashkey
+from time_calculate import time_format
+
+
+class StreamFingerprinter:
+    """
+    Fingerprint a long audio chunk by chunk on one continuous frame axis.
+
+    The audio is processed in blocks of block_seconds (the dB normalization is done per block, like the
+    sliding windows of the locator). Samples that do not fill a whole frame are kept for the next chunk,
+    and the peaks of the last fan_value_frames frames are kept so that pairs crossing a block or chunk
+    boundary are generated exactly once.
+
+    args:
+        analyzer: FingerprintIdentifier, Provides the STFT, peak detection and pairing parameters
+        block_seconds: float, Length of the blocks the audio is processed in
+
+    methods:
+        feed(audio): Add the next chunk of audio, return the (hashes, times) of the completed blocks.
+        flush(): Process the audio that is left, return its (hashes, times).
+        get_state() / set_state(state): The position reached, to continue the stream later (see ArchiveIndex.append_audio).
+    """
+
+    def __init__(self, analyzer, block_seconds=180):
+        self.analyzer = analyzer
+        self.block_frames = max(1, int(block_seconds * analyzer.sr / analyzer.hop_length))
+        self.leftover = np.zeros(0, dtype=np.float32)
+        self.next_frame = 0
+        self.tail_peaks = []
+        self.samples = 0
+
+    def feed(self, audio):
+        hop = self.analyzer.hop_length
+        block_samples = self.block_frames * hop + self.analyzer.n_fft - hop
+        self.leftover = np.concatenate([self.leftover, np.asarray(audio, dtype=np.float32)])
+        self.samples += len(audio)
+        results = []
+        while len(self.leftover) >= block_samples:
+            results.append(self._process(self.leftover[:block_samples], self.block_frames))
+            self.leftover = self.leftover[self.block_frames * hop:]
+        return _concatenate(results)
+
+    def flush(self):
+        hop = self.analyzer.hop_length
+        if len(self.leftover) < self.analyzer.n_fft:
+            return _concatenate([])
+        frames = 1 + (len(self.leftover) - self.analyzer.n_fft) // hop
+        result = self._process(self.leftover, frames)
+        self.leftover = self.leftover[frames * hop:]
+        return result
+
+    def _process(self, block_audio, frames):
+        analyzer = self.analyzer
+        block_start = self.next_frame
+        peaks = analyzer.detect_peaks_2d(analyzer.spectrogram_db(block_audio))
+        peaks = [(f, t + block_start, v) for f, t, v in peaks if t < frames]
+        hashes, times = analyzer.fingerprint_arrays(self.tail_peaks + peaks)
+        # Pairs whose target is in the tail were already generated with the previous block
+        _, _, dts = unpack_hashkey(hashes)
+        new = times + dts >= block_start
+        self.next_frame += frames
+        self.tail_peaks = [peak for peak in self.tail_peaks + peaks
+                           if peak[1] >= self.next_frame - analyzer.fan_value_frames]
+        return hashes[new], times[new]
+
+    def get_state(self):
+        """
+        Return the position reached as a dictionary of arrays and numbers.
+        After flush() the only audio left is the start of the next frame, so a stream continued from this
+        state stays on the same frame axis, and the tail peaks pair with the first peaks of the new audio.
+        """
+        return {
+            "leftover": self.leftover,
+            "next_frame": self.next_frame,
+            "samples": self.samples,
+            "tail_peaks": np.array(self.tail_peaks, dtype=np.float64).reshape(-1, 3),
+        }
+
+    def set_state(self, state):
+        self.leftover = np.asarray(state["leftover"], dtype=np.float32)
+        self.next_frame = int(state["next_frame"])
+        self.samples = int(state["samples"])
+        self.tail_peaks = [(int(f), int(t), float(v)) for f, t, v in state["tail_peaks"]]
+
+
+class PostingRun:
+    """
+    Postings sorted and grouped by hashkey, never modified once built.
+    keys: sorted unique hashkeys, offsets: postings of keys[i] are [offsets[i], offsets[i+1]),
+    video_ids / frames: the postings.
+    """
+
+    def __init__(self, keys=None, offsets=None, video_ids=None, frames=None):
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else keys
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self.video_ids = np.zeros(0, dtype=np.int32) if video_ids is None else video_ids
+        self.frames = np.zeros(0, dtype=np.int32) if frames is None else frames
+
+    @classmethod
+    def from_postings(cls, hashes, video_ids, frames):
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        keys, starts = np.unique(hashes, return_index=True)
+        return cls(keys, np.r_[starts, len(hashes)].astype(np.int64), video_ids[order], frames[order])
+
+    @classmethod
+    def merge(cls, runs):
+        if len(runs) == 1:
+            return runs[0]
+        # Runs loaded from compressed files (CompressedRun) are decoded here
+        arrays = [run.to_arrays() for run in runs]
+        return cls.from_postings(np.concatenate([np.repeat(run["keys"], np.diff(run["offsets"])) for run in arrays]),
+                                 np.concatenate([run["video_ids"] for run in arrays]),
+                                 np.concatenate([run["frames"] for run in arrays]))
+
+    def lookup(self, hashes, times):
+        """
+        Return (video_ids, frame_offsets) of every posting that shares a hashkey with the query,
+        frame_offsets being the posting frame minus the query anchor time.
+        """
+        video_ids, frames, query_times = self.lookup_times(hashes, times)
+        return video_ids, frames - query_times
+
+    def lookup_times(self, hashes, times):
+        """
+        Return (video_ids, frames, query_times) of every posting that shares a hashkey with the query,
+        query_times being the anchor time of the query pair that found it.
+        """
+        index = np.searchsorted(self.keys, hashes)
+        found = index < len(self.keys)
+        found[found] = self.keys[index[found]] == hashes[found]
+        index, times = index[found], times[found]
+        starts = self.offsets[index]
+        counts = self.offsets[index + 1] - starts
+        postings = expand_ranges(starts, counts)
+        return self.video_ids[postings], self.frames[postings], np.repeat(times, counts)
+
+    def nbytes(self):
+        return self.keys.nbytes + self.offsets.nbytes + self.video_ids.nbytes + self.frames.nbytes
+
+    def to_arrays(self):
+        return {"keys": self.keys, "offsets": self.offsets, "video_ids": self.video_ids, "frames": self.frames}
+
+
+class ArchiveShard:
+    """
+    The postings of the hashkeys assigned to one shard.
+
+    New postings are first collected unsorted (add), then sealed into a small sorted run, so an append
+    only sorts its own postings. Queries search every run; merge() combines the runs into one in the
+    background, and the list of runs is replaced in one assignment so queries never wait for it.
+    Only one merge runs at a time, a second one waits: two merges of overlapping runs would drop postings.
+    Runs read from a compressed file (CompressedRun) keep it memory mapped; once replaced they are only closed by
+    save() or close(), a query that started before the replacement may still be reading them.
+    """
+
+    def __init__(self):
+        self.runs = []
+        self.pending = []
+        self.retired = []
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+
+    def add(self, hashes, video_index, frames):
+        self.pending.append((hashes, np.full(len(hashes), video_index, dtype=np.int32), frames.astype(np.int32)))
+
+    def seal(self):
+        """
+        Sort the pending postings into a new run (cost proportional to the pending postings only).
+        """
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        run = PostingRun.from_postings(*(np.concatenate([p[i] for p in pending]) for i in range(3)))
+        with self.lock:
+            self.runs = self.runs + [run]
+
+    def merge(self):
+        """
+        Merge the current runs into one. Runs sealed while merging are kept after the merged one.
+        """
+        with self.merge_lock:
+            with self.lock:
+                runs = self.runs
+            if len(runs) < 2:
+                return
+            merged = PostingRun.merge(runs)
+            self.replace_runs([merged] + self.runs[len(runs):])
+
+    def replace_runs(self, runs):
+        """
+        Replace the runs, the compressed runs that are not kept are closed by the next save() or close().
+        """
+        with self.lock:
+            kept = {id(run) for run in runs}
+            self.retired += [run for run in self.runs if isinstance(run, CompressedRun) and id(run) not in kept]
+            self.runs = runs
+
+    def close_retired(self):
+        with self.lock:
+            retired, self.retired = self.retired, []
+        for run in retired:
+            run.close()
+
+    def close(self):
+        """
+        Release the files of the compressed runs, the shard cannot be queried afterwards.
+        """
+        self.close_retired()
+        with self.lock:
+            runs, self.runs = self.runs, []
+        for run in runs:
+            if isinstance(run, CompressedRun):
+                run.close()
+
+    def finalize(self):
+        self.seal()
+        self.merge()
+
+    def lookup(self, hashes, times):
+        hits = [run.lookup(hashes, times) for run in self.runs]
+        if not hits:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        return np.concatenate([h[0] for h in hits]), np.concatenate([h[1] for h in hits])
+
+    def lookup_times(self, hashes, times):
+        hits = [run.lookup_times(hashes, times) for run in self.runs]
+        if not hits:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        return tuple(np.concatenate([h[i] for h in hits]) for i in range(3))
+
+    def nbytes(self):
+        return sum(run.nbytes() for run in self.runs)
+
+    def to_arrays(self):
+        return PostingRun.merge(self.runs).to_arrays() if self.runs else PostingRun().to_arrays()
+
+    def save(self, path):
+        """
+        Write the shard as a compressed file, unless it is still exactly the file it was loaded from.
+        """
+        run = PostingRun.merge(self.runs) if self.runs else PostingRun()
+        if isinstance(run, CompressedRun) and os.path.abspath(run.path) == os.path.abspath(path):
+            return
+        # A replaced run may still map the file about to be replaced (which fails on Windows)
+        self.close_retired()
+        write_compressed_run(path, run)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        shard = cls()
+        shard.runs = [PostingRun(arrays["keys"], arrays["offsets"], arrays["video_ids"], arrays["frames"])]
+        return shard
+
+    @classmethod
+    def from_file(cls, path):
+        shard = cls()
+        shard.runs = [CompressedRun(path)]
+        return shard
+
+
+class ArchiveIndex:
+    """
+    Fingerprint index of many videos, sharded by hashkey.
+
+    args:
+        analyzer: FingerprintIdentifier, Fingerprint parameters (a default one is created if None)
+        shard_count: int, Number of shards
+        block_seconds: float, Length of the blocks long audio is fingerprinted in
+        max_runs: int, Merge the runs of a shard in the background once it has more than this many
+
+    methods:
+        add_video(video_id, chunks): Fingerprint a video given as consecutive audio chunks and add it.
+        append_audio(video_id, chunks): Fingerprint only the new audio of a video (next part, ongoing stream) and add it.
+        finalize(): Merge all postings of every shard into one run (called by save).
+        wait_for_merge(): Wait for the background merge to finish.
+        query(sample_audio, top, workers): Find the videos and times that match a clip.
+        save(directory, compressed) / load(directory): Store the index on disk (compressed shards, or numpy arrays).
+        stats(): Build time and size, in total and per hour of audio.
+        close(): Release the files of a loaded index (also at the end of a with block).
+    """
+
+    def __init__(self, analyzer=None, shard_count=8, block_seconds=180, max_runs=4):
+        self.analyzer = analyzer or FingerprintIdentifier()
+        self.shard_count = shard_count
+        self.block_seconds = block_seconds
+        self.max_runs = max_runs
+        self.shards = [ArchiveShard() for _ in range(shard_count)]
+        self.videos = []
+        self.video_index = {}
+        self.streams = {}
+        self.disk_bytes = None
+        self.merge_thread = None
+
+    def add_video(self, video_id, chunks):
+        """
+        Fingerprint a video and add its postings to the shards.
+        args:
+            video_id: str, Identifier returned by queries (for example the YouTube/Twitch video ID)
+            chunks: Iterable[ndarray], Consecutive parts of the audio at analyzer.sr (for example the split hour files)
+        """
+        if video_id in self.video_index:
+            raise ValueError(f"Video already in the index : {video_id}")
+        return self.append_audio(video_id, chunks)
+
+    def append_audio(self, video_id, chunks):
+        """
+        Add audio that follows what is already indexed for the video, or start a new video.
+        Only the new audio is fingerprinted: the stream continues from the saved frame position, so the
+        new postings get their global frame and the pairs crossing the join are generated once.
+        The new postings become a small sorted run of each shard and are searchable right away;
+        runs are merged in the background.
+        args:
+            video_id: str, Identifier returned by queries
+            chunks: Iterable[ndarray], Consecutive parts of the new audio at analyzer.sr
+        """
+        build_start = time.perf_counter()
+        fingerprinter = StreamFingerprinter(self.analyzer, self.block_seconds)
+        if video_id in self.video_index:
+            video_index = self.video_index[video_id]
+            if video_index not in self.streams:
+                raise ValueError(f"No stream position saved for this video, it cannot be continued : {video_id}")
+            fingerprinter.set_state(self.streams[video_index])
+        else:
+            video_index = len(self.videos)
+            self.videos.append({"video_id": video_id, "seconds": 0.0, "hashes": 0, "build_seconds": 0.0, "parts": 0})
+            self.video_index[video_id] = video_index
+
+        hash_count = 0
+        for chunk in chunks:
+            hash_count += self._add_postings(video_index, *fingerprinter.feed(chunk))
+        hash_count += self._add_postings(video_index, *fingerprinter.flush())
+        for shard in self.shards:
+            shard.seal()
+        self.streams[video_index] = fingerprinter.get_state()
+
+        video = self.videos[video_index]
+        video["seconds"] = fingerprinter.samples / self.analyzer.sr
+        video["hashes"] += hash_count
+        video["build_seconds"] += time.perf_counter() - build_start
+        video["parts"] = video.get("parts", 0) + 1
+        self._start_merge()
+        return video
+
+    def _add_postings(self, video_index, hashes, times):
+        shard_of = hashes % self.shard_count
+        for shard_number, shard in enumerate(self.shards):
+            selected = shard_of == shard_number
+            if np.any(selected):
+                shard.add(hashes[selected], video_index, times[selected])
+        return len(hashes)
+
+    def _start_merge(self):
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            return
+        if all(len(shard.runs) <= self.max_runs for shard in self.shards):
+            return
+        self.merge_thread = threading.Thread(target=self._merge_runs, daemon=True)
+        self.merge_thread.start()
+
+    def _merge_runs(self):
+        for shard in self.shards:
+            shard.merge()
+
+    def wait_for_merge(self):
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+
+    def finalize(self):
+        # The background merge must not replace the runs of a shard while it is finalized
+        self.wait_for_merge()
+        for shard in self.shards:
+            shard.finalize()
+
+    def close(self):
+        self.wait_for_merge()
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def query(self, sample_audio, top=5, workers=None, min_margin=2.0):
+        """
+        Find where a clip occurs in the archive.
+        Chance coincidences add up over a large archive, so besides reaching analyzer.min_count the best
+        candidate must also score at least min_margin times the best candidate of any other video.
+        Returns a dictionary with:
+            found: bool, True if the best candidate reaches analyzer.min_count and the margin
+            candidates: list of {video_id, offset_seconds, timestamp, score}, best first (at most `top`)
+            query_seconds: float, Time taken by the lookup
+        args:
+            sample_audio: ndarray, Clip audio at analyzer.sr
+            top: int, Number of candidates to return
+            workers: int, Threads used to search the shards (default: one per shard)
+            min_margin: float, Required ratio between the best and the second best video
+        """
+        query_start = time.perf_counter()
+        analyzer = self.analyzer
+        peaks = analyzer.detect_peaks_2d(analyzer.spectrogram_db(sample_audio))
+        hashes, times = analyzer.fingerprint_arrays(peaks)
+        shard_of = hashes % self.shard_count
+
+        def search_shard(shard_number):
+            selected = shard_of == shard_number
+            return self.shards[shard_number].lookup(hashes[selected], times[selected])
+
+        with ThreadPoolExecutor(max_workers=workers or self.shard_count) as executor:
+            hits = list(executor.map(search_shard, range(self.shard_count)))
+        video_ids = np.concatenate([h[0] for h in hits]).astype(np.int64)
+        frame_offsets = np.concatenate([h[1] for h in hits]).astype(np.int64)
+
+        candidates = []
+        runner_up = 0
+        if len(video_ids):
+            # Offset histogram per video: count the votes of every (video, frame offset)
+            votes, counts = np.unique((video_ids << 32) | (frame_offsets & 0xFFFFFFFF), return_counts=True)
+            vote_videos = votes >> 32
+            vote_offsets = (votes & 0xFFFFFFFF).astype(np.uint32).astype(np.int32)
+            order = np.lexsort((-counts, vote_videos))
+            first = np.r_[True, vote_videos[order][1:] != vote_videos[order][:-1]]
+            best = order[first]
+            best = best[np.argsort(-counts[best], kind="stable")]
+            runner_up = int(counts[best[1]]) if len(best) > 1 else 0
+            for i in best[:top]:
+                offset_seconds = max(0, int(vote_offsets[i])) * analyzer.hop_length / analyzer.sr
+                candidates.append({
+                    "video_id": self.videos[int(vote_videos[i])]["video_id"],
+                    "offset_seconds": offset_seconds,
+                    "timestamp": time_format.sec_to_time(int(offset_seconds)),
+                    "score": int(counts[i]),
+                })
+        return {
+            "found": bool(candidates) and candidates[0]["score"] >= max(analyzer.min_count, min_margin * runner_up),
+            "candidates": candidates,
+            "query_seconds": time.perf_counter() - query_start,
+        }
+
+    def stats(self):
+        hours = sum(video["seconds"] for video in self.videos) / 3600
+        build_seconds = sum(video["build_seconds"] for video in self.videos)
+        size = self.disk_bytes if self.disk_bytes is not None else sum(shard.nbytes() for shard in self.shards)
+        return {
+            "videos": len(self.videos),
+            "hours": hours,
+            "hashes": sum(video["hashes"] for video in self.videos),
+            "build_seconds": build_seconds,
+            "bytes": size,
+            "build_seconds_per_hour": build_seconds / hours if hours else None,
+            "bytes_per_hour": size / hours if hours else None,
+            "runs": max((len(shard.runs) for shard in self.shards), default=0),
+        }
+
+    def save(self, directory, compressed=True):
+        """
+        Write the index to a directory.
+        args:
+            directory: str, Index directory (created if it does not exist)
+            compressed: bool, Write the shards in the compressed format (compressed_postings.py),
+                or as uncompressed numpy arrays (the format of earlier versions)
+        """
+        self.wait_for_merge()
+        self.finalize()
+        os.makedirs(directory, exist_ok=True)
+        manifest = {
+            "analyzer": self.analyzer.get_params(),
+            "shard_count": self.shard_count,
+            "block_seconds": self.block_seconds,
+            "format": "compressed" if compressed else "npz",
+            "videos": self.videos,
+        }
+        for shard_number, shard in enumerate(self.shards):
+            if compressed:
+                shard.save(os.path.join(directory, f"shard_{shard_number:03d}.hlx"))
+            else:
+                arrays = shard.to_arrays()
+                np.savez(os.path.join(directory, f"shard_{shard_number:03d}.npz"), **arrays)
+                # Keep the postings in memory, a compressed file the shard was loaded from is removed below
+                shard.replace_runs([PostingRun(**arrays)])
+                shard.close_retired()
+        # The shards of the other format are left over from an earlier save
+        for name in os.listdir(directory):
+            if name.startswith("shard_") and name.endswith(".npz" if compressed else ".hlx"):
+                os.remove(os.path.join(directory, name))
+        # The manifest is written last, it names the format of the shards
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        # Stream positions, so the videos can be continued after a reload
+        streams = {}
+        for video_index, state in self.streams.items():
+            for name, value in state.items():
+                streams[f"{name}_{video_index}"] = value
+        np.savez(os.path.join(directory, "streams.npz"), **streams)
+        self.disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        index = cls(FingerprintIdentifier(**manifest["analyzer"]), manifest["shard_count"], manifest["block_seconds"])
+        for shard_number in range(index.shard_count):
+            # Indexes written before the compressed format have no "format" and numpy shards
+            if manifest.get("format", "npz") == "compressed":
+                index.shards[shard_number] = ArchiveShard.from_file(os.path.join(directory, f"shard_{shard_number:03d}.hlx"))
+                continue
+            with np.load(os.path.join(directory, f"shard_{shard_number:03d}.npz")) as arrays:
+                index.shards[shard_number] = ArchiveShard.from_arrays({name: arrays[name] for name in arrays.files})
+        index.videos = manifest["videos"]
+        index.video_index = {video["video_id"]: i for i, video in enumerate(index.videos)}
+        streams_path = os.path.join(directory, "streams.npz")
+        if os.path.exists(streams_path):
+            with np.load(streams_path) as arrays:
+                for video_index in range(len(index.videos)):
+                    if f"next_frame_{video_index}" in arrays.files:
+                        index.streams[video_index] = {name: arrays[f"{name}_{video_index}"]
+                                                      for name in ("leftover", "next_frame", "samples", "tail_peaks")}
+        index.disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        return index
+
+
+def _concatenate(results):
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
@@ -0,0 +1,4 @@
+"""
+Benchmarks for HighlightLocator.
+Run them from the repository root, for example: python -m benchmarks.density
+"""
@@ -0,0 +1,78 @@
+"""
+Query latency of the channel archive index against the size of the archive.
+
+The archive is grown step by step with synthetic streams. After each step the benchmark queries
+clips cut from streams already in the archive plus one clip that is in none of them, and reports
+the mean query time, the accuracy, and the build time and size per hour of audio.
+Query time should grow much slower than the archive (binary search per hashkey, not a scan).
+
+    python -m benchmarks.archive [--steps 4] [--videos-per-step 4] [--stream-seconds 300] [--json archive.json]
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from archive_index import ArchiveIndex
+from benchmarks.fixtures import distort, make_stream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=4, help="Number of times the archive is grown")
+    parser.add_argument("--videos-per-step", type=int, default=4, help="Number of streams added at each step")
+    parser.add_argument("--stream-seconds", type=int, default=300)
+    parser.add_argument("--clip-seconds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    rng = np.random.default_rng(args.seed)
+    index = ArchiveIndex()
+    streams = []
+    negative = distort(make_stream(args.clip_seconds, args.seed + 99991, sr, dense_sections=0, silent_sections=0), 1)
+    rows = []
+    print(f"{'videos':>7}{'hours':>8}{'query ms':>10}{'correct':>9}{'build s/h':>11}{'MB/h':>8}")
+    for step in range(args.steps):
+        for _ in range(args.videos_per_step):
+            stream = make_stream(args.stream_seconds, args.seed * 1000 + len(streams), sr)
+            index.add_video(f"vod{len(streams)}", [stream])
+            streams.append(stream)
+        index.finalize()
+
+        query_seconds = []
+        correct = 0
+        for video in rng.choice(len(streams), size=min(4, len(streams)), replace=False):
+            offset = int(rng.uniform(0, args.stream_seconds - args.clip_seconds))
+            clip = distort(streams[video][offset * sr:(offset + args.clip_seconds) * sr], int(video))
+            result = index.query(clip)
+            query_seconds.append(result["query_seconds"])
+            best = result["candidates"][0] if result["candidates"] else None
+            correct += bool(result["found"] and best["video_id"] == f"vod{video}"
+                            and abs(best["offset_seconds"] - offset) <= 1.0)
+        result = index.query(negative)
+        query_seconds.append(result["query_seconds"])
+        correct += not result["found"]
+
+        stats = index.stats()
+        rows.append({
+            "videos": stats["videos"],
+            "hours": stats["hours"],
+            "query_ms": 1000 * float(np.mean(query_seconds)),
+            "correct": correct,
+            "queries": len(query_seconds),
+            "build_seconds_per_hour": stats["build_seconds_per_hour"],
+            "bytes_per_hour": stats["bytes_per_hour"],
+        })
+        row = rows[-1]
+        print(f"{row['videos']:>7}{row['hours']:>8.2f}{row['query_ms']:>10.1f}{correct:>6}/{row['queries']}"
+              f"{row['build_seconds_per_hour']:>11.1f}{row['bytes_per_hour'] / 1e6:>8.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
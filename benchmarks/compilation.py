@@ -0,0 +1,100 @@
+"""
+Compilation mode (compilation.py) against one search per clip.
+
+A synthetic compilation is made of --clips distorted clips of one stream, separated by short noise
+transitions. Compilation mode fingerprints the stream once and the compilation once; the baseline
+cuts every clip out at its known boundaries and searches the stream for each with
+locator.search_long_audio, as a user would do by hand. The table shows the total seconds of each,
+how many clips were mapped to the right original time (within 1 second), and for compilation mode
+the mean error of the reported clip start in the compilation.
+
+    python -m benchmarks.compilation [--stream-seconds 900] [--clips 8] [--json compilation.json]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import distort, make_stream
+from benchmarks.scan_order import write_segments
+from compilation import index_originals, locate_compilation
+from fingerprint import FingerprintIdentifier
+from locator import search_long_audio, window_geometry
+
+
+def make_compilation(stream, sr, clips, seed, min_seconds=4, max_seconds=20):
+    """
+    Return (compilation, truth): the clips of the stream with noise transitions, and the
+    (compilation_start, compilation_end, original_start) of every clip.
+    """
+    rng = np.random.default_rng(seed)
+    parts, truth, position = [], [], 0.0
+    for index in range(clips):
+        length = rng.uniform(min_seconds, max_seconds)
+        start = rng.uniform(0, len(stream) / sr - length)
+        transition = rng.standard_normal(int(rng.uniform(0.3, 1.5) * sr)).astype(np.float32) * 0.05
+        clip = distort(stream[int(start * sr):int((start + length) * sr)], seed * 100 + index)
+        parts += [transition, clip]
+        position += len(transition) / sr
+        truth.append((position, position + len(clip) / sr, start))
+        position += len(clip) / sr
+    return np.concatenate(parts), truth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream-seconds", type=int, default=900)
+    parser.add_argument("--split-seconds", type=int, default=3600)
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    analyzer = FingerprintIdentifier(sr=sr)
+    stream = make_stream(args.stream_seconds, args.seed, sr)
+    compilation, truth = make_compilation(stream, sr, args.clips, args.seed)
+    rows = []
+
+    start = time.perf_counter()
+    index = index_originals(analyzer, [("original", [stream])])
+    result = locate_compilation(index, [compilation])
+    seconds = time.perf_counter() - start
+    correct, start_errors = 0, []
+    for clip_start, clip_end, original_start in truth:
+        # The run covering the middle of the clip
+        middle = (clip_start + clip_end) / 2
+        run = next((run for run in result["clips"] if run["compilation_start"] <= middle <= run["compilation_end"]), None)
+        if run is not None and abs(run["original_start"] - run["compilation_start"] - (original_start - clip_start)) <= 1:
+            correct += 1
+            start_errors.append(abs(run["compilation_start"] - clip_start))
+    rows.append({"mode": "compilation", "seconds": seconds, "correct": correct, "clips": len(truth),
+                 "runs": len(result["clips"]), "mean_start_error": float(np.mean(start_errors)) if start_errors else None})
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_segments(stream, sr, args.split_seconds, directory, "stream")
+        start = time.perf_counter()
+        correct = 0
+        for clip_start, clip_end, original_start in truth:
+            clip = compilation[int(clip_start * sr):int(clip_end * sr)]
+            found = search_long_audio(clip, len(clip) / sr, paths, args.split_seconds, sr, analyzer,
+                                      geometry=window_geometry(len(clip) / sr))
+            correct += found["found"] and abs(found["offset_seconds"] - original_start) <= 1
+        rows.append({"mode": "per clip", "seconds": time.perf_counter() - start, "correct": correct, "clips": len(truth),
+                     "runs": None, "mean_start_error": None})
+
+    print(f"{'mode':<13}{'seconds':>9}{'correct':>10}{'runs':>6}{'start error':>13}")
+    for row in rows:
+        runs = "" if row["runs"] is None else row["runs"]
+        error = "" if row["mean_start_error"] is None else f"{row['mean_start_error']:.2f} s"
+        print(f"{row['mode']:<13}{row['seconds']:>9.2f}{row['correct']:>7}/{row['clips']}{runs:>6}{error:>13}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
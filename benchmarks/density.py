@@ -0,0 +1,83 @@
+"""
+Hash count against accuracy for the constellation density controls of FingerprintIdentifier.
+
+For every configuration the benchmark searches each fixture stream with locator.search_long_audio
+and reports the number of peaks and pairs (hashes) generated, the search time and how many
+fixtures were answered correctly, with the reduction relative to the unlimited baseline.
+
+    python -m benchmarks.density [--cases 4] [--json density.json]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.fixtures import is_correct, make_cases, write_stream
+from fingerprint import FingerprintIdentifier
+from instrumentation import Instrumentation
+from locator import search_long_audio
+
+CONFIGS = {
+    "baseline": {},
+    "frame5": {"max_peaks_per_frame": 5},
+    "frame3": {"max_peaks_per_frame": 3},
+    "band10": {"max_peaks_per_band": 10},
+    "band5": {"max_peaks_per_band": 5},
+    "targets2": {"max_targets_per_anchor": 2},
+    "frame5_targets2": {"max_peaks_per_frame": 5, "max_targets_per_anchor": 2},
+}
+
+
+def run(cases, configs):
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [write_stream(case, directory) for case in cases]
+        for name, options in configs.items():
+            instrumentation = Instrumentation()
+            correct = 0
+            start = time.perf_counter()
+            for case, path in zip(cases, paths):
+                # A callable builds fresh options for every case (for example a new learning stoplist)
+                case_options = options() if callable(options) else options
+                analyzer = FingerprintIdentifier(sr=case["sr"], instrumentation=instrumentation, **case_options)
+                result = search_long_audio(case["clip"], len(case["clip"]) / case["sr"], [path],
+                                           sr=case["sr"], analyzer=analyzer, instrumentation=instrumentation)
+                correct += is_correct(case, result)
+            counters = instrumentation.report()["counters"]
+            rows.append({
+                "config": name,
+                "options": repr(options) if callable(options) else options,
+                "peaks": counters.get("peaks", 0),
+                "pairs": counters.get("pairs", 0),
+                "votes": counters.get("votes", 0),
+                "votes_skipped": counters.get("votes_skipped", 0),
+                "seconds": time.perf_counter() - start,
+                "correct": correct,
+                "cases": len(cases),
+            })
+    baseline_pairs = rows[0]["pairs"] or 1
+    for row in rows:
+        row["pair_reduction"] = 1 - row["pairs"] / baseline_pairs
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=4, help="Number of positive fixtures (one negative is added)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    rows = run(make_cases(args.cases, seed=args.seed), CONFIGS)
+    print(f"{'config':<18}{'peaks':>9}{'pairs':>9}{'reduction':>11}{'seconds':>9}{'correct':>9}")
+    for row in rows:
+        print(f"{row['config']:<18}{row['peaks']:>9}{row['pairs']:>9}{row['pair_reduction']:>10.0%}"
+              f"{row['seconds']:>9.2f}{row['correct']:>6}/{row['cases']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
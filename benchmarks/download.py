@@ -0,0 +1,132 @@
+"""
+Parallel fragment download against a local HTTP fixture server.
+
+The server limits the speed of every connection (like a CDN throttling single connections), fails a
+fraction of the requests, and serves the same random file as a progressive file with byte range support
+and as an HLS playlist of segments. The file is downloaded over a single connection and with adaptive
+concurrency; the benchmark checks the downloaded bytes and reports the speed, the retries and the
+concurrency the controller settled on.
+
+    python -m benchmarks.download [--megabytes 24] [--connection-speed 2] [--failure-rate 0.02]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fragment_download import FragmentDownloader
+
+
+def make_handler(data, segment_size, connection_speed, failure_rate, seed):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    segment_count = (len(data) + segment_size - 1) // segment_size
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_throttled(self, body):
+            # Send in small pieces, at most connection_speed bytes per second on this connection
+            piece = 64 * 1024
+            for start in range(0, len(body), piece):
+                self.wfile.write(body[start:start + piece])
+                time.sleep(len(body[start:start + piece]) / connection_speed)
+
+        def failing(self):
+            with rng_lock:
+                return rng.random() < failure_rate
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+
+        def do_GET(self):
+            if self.failing():
+                self.send_error(503)
+                return
+            if self.path == "/audio.m4a":
+                start, end = 0, len(data) - 1
+                if "Range" in self.headers:
+                    first, last = self.headers["Range"].split("=")[1].split("-")
+                    start, end = int(first), min(int(last), len(data) - 1)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    self.send_response(200)
+                body = data[start:end + 1]
+            elif self.path == "/audio.m3u8":
+                lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:10"]
+                for index in range(segment_count):
+                    lines += ["#EXTINF:10.0,", f"segments/{index}.ts"]
+                lines.append("#EXT-X-ENDLIST")
+                body = "\n".join(lines).encode("utf-8")
+                self.send_response(200)
+            elif self.path.startswith("/segments/"):
+                index = int(self.path.split("/")[-1].split(".")[0])
+                body = data[index * segment_size:(index + 1) * segment_size]
+                self.send_response(200)
+            else:
+                self.send_error(404)
+                return
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.send_throttled(body)
+
+    return FixtureHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=24)
+    parser.add_argument("--connection-speed", type=float, default=2, help="MB/s of each connection")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="Fraction of the requests answered with 503")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data = random.Random(args.seed).randbytes(int(args.megabytes * 1024 * 1024))
+    handler = make_handler(data, 1024 * 1024, args.connection_speed * 1e6, args.failure_rate, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    work_dir = tempfile.mkdtemp(prefix="highlightlocator_download_")
+
+    formats = {
+        "progressive": {"url": f"{base_url}/audio.m4a", "protocol": "http"},
+        "hls": {"url": f"{base_url}/audio.m3u8", "protocol": "m3u8_native"},
+    }
+    modes = {
+        "single": {"initial_concurrency": 1, "max_concurrency": 1},
+        "adaptive": {"initial_concurrency": 2, "max_concurrency": args.max_concurrency},
+    }
+    try:
+        print(f"{'format':<13}{'mode':<10}{'MB/s':>8}{'seconds':>9}{'retries':>9}{'final conc.':>13}  bytes")
+        for format_name, info in formats.items():
+            for mode_name, options in modes.items():
+                path = os.path.join(work_dir, f"{format_name}_{mode_name}.m4a")
+                downloader = FragmentDownloader(retries=8, fragment_size=1024 * 1024, **options)
+                stats = downloader.download_info(info, path)
+                if stats is None:
+                    print(f"{format_name:<13}{mode_name:<10}  failed")
+                    continue
+                with open(path, "rb") as f:
+                    identical = f.read() == data
+                final = stats["concurrency"][-1] if stats["concurrency"] else options["initial_concurrency"]
+                print(f"{format_name:<13}{mode_name:<10}{stats['speed'] / 1e6:>8.2f}{stats['seconds']:>9.2f}"
+                      f"{stats['fragment_retries']:>9}{final:>13}  {'identical' if identical else 'DIFFERENT'}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic benchmark fixtures: long "streams" with a clip cut out at a known offset.
+
+The streams are made of random harmonic notes, with optional loud sections where many notes and
+noise bursts overlap (the case that produces the most peaks), silent stretches and a short
+"alert sound" repeated at a fixed interval (the case that produces the most repeated hashes).
+The clip is distorted with gain and background noise, like a re-encoded highlight video.
+Everything is generated from a seed, so the fixtures are identical on every run.
+"""
+
+import os
+
+import numpy as np
+import soundfile as sf
+
+
+def make_stream(seconds, seed, sr=16000, dense_sections=2, silent_sections=1, jingle_every=None):
+    """
+    Generate a synthetic stream.
+    args:
+        seconds: int, Length of the stream
+        seed: int, Random seed
+        sr: int, Sampling rate
+        dense_sections: int, Number of 20 second sections with many overlapping notes and noise bursts
+        silent_sections: int, Number of 20 second sections that only contain a very low noise floor
+        jingle_every: float, Insert the same 2 second jingle every this many seconds (None for no jingle)
+    """
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * sr), dtype=np.float64)
+
+    def add_notes(start, end, count, level):
+        for _ in range(count):
+            note_start = rng.uniform(start, end)
+            length = rng.uniform(0.08, 0.5)
+            i0 = int(note_start * sr)
+            i1 = min(len(audio), int((note_start + length) * sr))
+            if i1 <= i0:
+                continue
+            t = np.arange(i1 - i0) / sr
+            base = rng.uniform(80, 2000)
+            envelope = np.exp(-t * rng.uniform(2, 12))
+            for harmonic in range(1, 4):
+                if base * harmonic < sr / 2:
+                    audio[i0:i1] += level / harmonic * envelope * np.sin(2 * np.pi * base * harmonic * t)
+
+    add_notes(0, seconds, int(seconds * 5), 0.3)
+    for _ in range(dense_sections):
+        start = rng.uniform(0, max(0, seconds - 20))
+        add_notes(start, start + 20, 20 * 40, 0.4)
+        for _ in range(40):
+            i0 = min(len(audio), int(rng.uniform(start, start + 20) * sr))
+            i1 = min(len(audio), i0 + int(0.05 * sr))
+            audio[i0:i1] += 0.5 * rng.standard_normal(i1 - i0)
+    if jingle_every:
+        jingle = make_stream(2, seed + 7919, sr, dense_sections=0, silent_sections=0) * 0.8
+        for start in np.arange(jingle_every / 2, seconds - 2, jingle_every):
+            i0 = int(start * sr)
+            audio[i0:i0 + len(jingle)] += jingle
+    audio += 0.003 * rng.standard_normal(len(audio))
+    for _ in range(silent_sections):
+        i0 = int(rng.uniform(0, max(0, seconds - 20)) * sr)
+        i1 = min(len(audio), i0 + 20 * sr)
+        audio[i0:i1] = 0.0005 * rng.standard_normal(i1 - i0)
+
+    audio /= np.max(np.abs(audio))
+    return audio.astype(np.float32)
+
+
+def distort(clip, seed, gain=0.7, snr_db=20):
+    """
+    Apply a gain change and add white noise at the given signal to noise ratio.
+    """
+    rng = np.random.default_rng(seed)
+    clip = clip * gain
+    noise_power = np.mean(clip ** 2) / (10 ** (snr_db / 10))
+    return (clip + np.sqrt(noise_power) * rng.standard_normal(len(clip))).astype(np.float32)
+
+
+def make_cases(count=4, stream_seconds=180, clip_seconds=15, seed=0, sr=16000, negatives=1, **stream_options):
+    """
+    Return a list of labelled cases, each a dictionary with:
+        name, stream (ndarray), clip (ndarray), clip_offset (float seconds, None for negative cases), sr
+    Negative cases use a clip cut from a different stream, so the correct answer is "not found".
+    stream_options are passed to make_stream.
+    """
+    cases = []
+    rng = np.random.default_rng(seed)
+    for index in range(count):
+        stream = make_stream(stream_seconds, seed * 1000 + index, sr, **stream_options)
+        offset = float(int(rng.uniform(0, stream_seconds - clip_seconds)))
+        clip = stream[int(offset * sr):int((offset + clip_seconds) * sr)]
+        cases.append({
+            "name": f"case{index}",
+            "stream": stream,
+            "clip": distort(clip, seed * 1000 + index),
+            "clip_offset": offset,
+            "sr": sr,
+        })
+    for index in range(negatives):
+        other = make_stream(clip_seconds + 5, seed * 1000 + 500 + index, sr, dense_sections=0, silent_sections=0)
+        cases.append({
+            "name": f"negative{index}",
+            "stream": make_stream(stream_seconds, seed * 1000 + 900 + index, sr, **stream_options),
+            "clip": distort(other[:clip_seconds * sr], seed * 1000 + 500 + index),
+            "clip_offset": None,
+            "sr": sr,
+        })
+    return cases
+
+
+def write_stream(case, directory):
+    """
+    Write the stream of a case to a wav file (the locator searches files) and return its path.
+    """
+    path = os.path.join(directory, f"{case['name']}.wav")
+    sf.write(path, case["stream"], case["sr"])
+    return path
+
+
+def is_correct(case, result, tolerance=1.0):
+    """
+    Return True if the search result agrees with the label of the case.
+    """
+    if case["clip_offset"] is None:
+        return not result["found"]
+    return result["found"] and abs(result["offset_seconds"] - case["clip_offset"]) <= tolerance
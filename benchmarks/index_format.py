@@ -0,0 +1,85 @@
+"""
+On-disk size and query latency of the compressed archive index format against the uncompressed one.
+
+An archive of synthetic streams is built once and saved twice: with numpy shards (uncompressed, the format of
+earlier versions) and with compressed shards (compressed_postings.py). Both are loaded back and queried with
+the same clips (cut from the streams, plus one clip that is in none of them). The table shows the bytes per
+hour of audio, the compression ratio, the mean query time after loading, and that both formats give the same
+answers. The load time is shown too: a compressed shard only reads its block directory when it is opened.
+
+    python -m benchmarks.index_format [--videos 8] [--stream-seconds 600] [--queries 16] [--json index_format.json]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from archive_index import ArchiveIndex
+from benchmarks.fixtures import distort, make_stream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=8)
+    parser.add_argument("--stream-seconds", type=int, default=600)
+    parser.add_argument("--clip-seconds", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    rng = np.random.default_rng(args.seed)
+    index = ArchiveIndex()
+    streams = []
+    for video in range(args.videos):
+        stream = make_stream(args.stream_seconds, args.seed * 1000 + video, sr)
+        index.add_video(f"vod{video}", [stream])
+        streams.append(stream)
+    clips = []
+    for query in range(args.queries):
+        video = int(rng.integers(len(streams)))
+        offset = int(rng.uniform(0, args.stream_seconds - args.clip_seconds))
+        clips.append(distort(streams[video][offset * sr:(offset + args.clip_seconds) * sr], query))
+    clips.append(distort(make_stream(args.clip_seconds, args.seed + 99991, sr, dense_sections=0, silent_sections=0), 1))
+    hours = args.videos * args.stream_seconds / 3600
+
+    rows = []
+    answers = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, compressed in (("npz", False), ("compressed", True)):
+            path = os.path.join(directory, name)
+            index.save(path, compressed=compressed)
+            shard_bytes = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path) if file.startswith("shard_"))
+            start = time.perf_counter()
+            loaded = ArchiveIndex.load(path)
+            load_seconds = time.perf_counter() - start
+            query_seconds = []
+            answers[name] = []
+            for clip in clips:
+                result = loaded.query(clip)
+                query_seconds.append(result["query_seconds"])
+                answers[name].append([(c["video_id"], c["offset_seconds"], c["score"]) for c in result["candidates"]])
+            rows.append({"format": name, "bytes_per_hour": shard_bytes / hours, "load_seconds": load_seconds,
+                         "query_ms": 1000 * float(np.mean(query_seconds))})
+            # Release the memory mapped shard files before the directory is removed
+            loaded = None
+
+    uncompressed = rows[0]["bytes_per_hour"]
+    print(f"{'format':<12}{'MB/h':>8}{'ratio':>7}{'load ms':>9}{'query ms':>10}")
+    for row in rows:
+        row["ratio"] = uncompressed / row["bytes_per_hour"]
+        print(f"{row['format']:<12}{row['bytes_per_hour'] / 1e6:>8.2f}{row['ratio']:>6.2f}x"
+              f"{1000 * row['load_seconds']:>9.1f}{row['query_ms']:>10.1f}")
+    print("Same answers:", answers["npz"] == answers["compressed"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "same_answers": answers["npz"] == answers["compressed"]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
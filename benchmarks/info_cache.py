@@ -0,0 +1,83 @@
+"""
+Video information cache (info_cache.py) against one extraction per use.
+
+A stub extractor stands in for YoutubeDL.extract_info: it sleeps --extract-seconds (the network round trip) and
+returns the information of a video whose only format is served by a local HTTP server. Every run does what one
+locate of a YouTube original does with it: get_time_info, then download_youtube_m4a. Without the cache every use
+extracts again (ttl_seconds below zero); with it the first run extracts once and the next runs, like new processes,
+read the entry from the cache directory. The table shows the extractions, the hit rate and the seconds per run.
+
+    python -m benchmarks.info_cache [--runs 5] [--extract-seconds 1.5]
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from download_en import Download
+from info_cache import InfoCache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--extract-seconds", type=float, default=1.5, help="Simulated duration of one extraction")
+    parser.add_argument("--kilobytes", type=int, default=512, help="Size of the served audio file")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="info_cache_")
+    with open(os.path.join(directory, "audio.m4a"), "wb") as f:
+        f.write(os.urandom(args.kilobytes * 1024))
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *_: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    extractions = []
+
+    def extractor(url):
+        extractions.append(url)
+        time.sleep(args.extract_seconds)
+        return {"id": "abcdefghijk", "title": "fixture", "extractor": "youtube", "extractor_key": "Youtube",
+                "webpage_url": url, "duration": 3600,
+                "formats": [{"format_id": "140", "url": f"http://127.0.0.1:{server.server_address[1]}/audio.m4a",
+                             "ext": "m4a", "acodec": "mp4a.40.2", "vcodec": "none", "abr": 128, "asr": 44100,
+                             "protocol": "http", "filesize": args.kilobytes * 1024}]}
+
+    url = "https://www.youtube.com/watch?v=abcdefghijk"
+    rows = []
+    try:
+        for name, ttl_seconds in (("no cache", -1), ("info cache", 3600)):
+            extractions.clear()
+            cache_directory = os.path.join(directory, f"cache_{ttl_seconds}")
+            hits = lookups = 0
+            start = time.perf_counter()
+            for run in range(args.runs):
+                # A new cache object per run reads the entries of the earlier runs from disk, like a new process
+                cache = InfoCache(cache_directory, ttl_seconds=ttl_seconds, extractor=extractor)
+                download = Download(url, os.path.join(directory, "audio"), info_cache=cache)
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                    download.get_time_info()
+                    download.download_youtube_m4a()
+                stats = cache.stats()
+                hits += stats["memory_hits"] + stats["disk_hits"]
+                lookups += stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            rows.append({"name": name, "extractions": len(extractions), "hit_rate": hits / lookups,
+                         "seconds_per_run": (time.perf_counter() - start) / args.runs})
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{'mode':<12}{'extractions':>12}{'hit rate':>10}{'s/run':>8}")
+    for row in rows:
+        print(f"{row['name']:<12}{row['extractions']:>12}{100 * row['hit_rate']:>9.0f}%{row['seconds_per_run']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
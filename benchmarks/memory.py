@@ -0,0 +1,67 @@
+"""
+Predicted against measured peak RSS of the memory budget aware search.
+
+A synthetic stream is written as a 44.1 kHz stereo file (like a downloaded m4a) and the clip is searched in it with
+cli.py --memory-budget, once per budget, each run in its own process so the peak RSS of one run does not leak into
+the next. The table shows the plan the governor chose (split duration, window, workers), its predicted peak and the
+peak RSS the run actually reached. Splitting needs ffmpeg on the PATH when the original is longer than a split file.
+
+    python -m benchmarks.memory [--stream-seconds 900] [--budgets 400,800,1600,auto]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from benchmarks.fixtures import distort, make_stream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream-seconds", type=int, default=900)
+    parser.add_argument("--clip-seconds", type=int, default=15)
+    parser.add_argument("--budgets", default="400,800,1600,auto", help="Comma separated budgets in MB, or auto")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sr, source_sr = 16000, 44100
+    work_dir = tempfile.mkdtemp(prefix="highlightlocator_memory_")
+    try:
+        stream = make_stream(args.stream_seconds, args.seed, sr)
+        offset = args.stream_seconds // 2
+        clip = distort(stream[offset * sr:(offset + args.clip_seconds) * sr], args.seed)
+        original_path = os.path.join(work_dir, "original.wav")
+        clip_path = os.path.join(work_dir, "clip.wav")
+        upsampled = librosa.resample(stream.astype(np.float32), orig_sr=sr, target_sr=source_sr)
+        sf.write(original_path, np.stack([upsampled, upsampled], axis=1), source_sr, subtype="PCM_16")
+        sf.write(clip_path, clip, sr)
+
+        print(f"{'budget':>8}{'split s':>9}{'window s':>10}{'workers':>9}{'predicted MB':>14}{'actual MB':>11}  result")
+        for budget in args.budgets.split(","):
+            command = [sys.executable, "cli.py", "--clip", clip_path, "--start", "0", "--end", str(args.clip_seconds),
+                       "--original", original_path, "--memory-budget", budget]
+            completed = subprocess.run(command, capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            output = json.loads(completed.stdout)
+            resources = output.get("resources")
+            if resources is None:
+                print(f"{budget:>8}  {output['status']}: {output['error']}")
+                continue
+            correct = output["offset_seconds"] is not None and abs(output["offset_seconds"] - offset) < 1
+            print(f"{budget:>8}{resources['split_duration']:>9}{resources['segment_length']:>10}{resources['workers']:>9}"
+                  f"{resources['predicted_peak_mb']:>14.0f}{resources['actual_peak_mb']:>11.0f}  "
+                  f"{output['status']}{'' if correct else ' (wrong offset)'}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
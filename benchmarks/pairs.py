@@ -0,0 +1,128 @@
+"""
+Regression check of the array based pair generation and vote against the original Python loops.
+
+For every fixture stream and configuration, the peaks of each sliding window are paired by
+FingerprintIdentifier.fingerprint_arrays and by the original two-pointer loop (kept below as the reference),
+and the two (hash, anchor time) lists must be identical, in the same order. identify is compared with the
+original dictionary vote the same way. The script prints the time of both versions and exits with
+status 1 if anything differs.
+
+    python -m benchmarks.pairs [--cases 3] [--stream-seconds 300]
+"""
+
+import argparse
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks.fixtures import make_cases
+from fingerprint import FingerprintIdentifier, pack_hashkey
+
+CONFIGS = {
+    "default": {},
+    "fan_1": {"fan_value_frames": 1},
+    "fan_15": {"fan_value_frames": 15},
+    "targets_3": {"max_targets_per_anchor": 3},
+    "dense_caps": {"max_peaks_per_frame": 4, "max_targets_per_anchor": 2},
+    "max_hash_8": {"max_hash_occurrences": 8},
+    "max_hash_4_weight": {"max_hash_occurrences": 4, "stoplist_mode": "weight"},
+}
+
+
+def reference_pairs(analyzer, peaks):
+    """
+    The original pairing loop: the second pointer is never moved back.
+    """
+    peaks_sorted = sorted(peaks, key=lambda x:x[1])
+    n_peaks = len(peaks_sorted)
+    j = 0
+    for i in range(n_peaks):
+        freqA, timeA, valA = peaks_sorted[i]
+        if j < i+1:
+            j = i+1
+        targets = []
+        while j < n_peaks:
+            freqB, timeB, valB = peaks_sorted[j]
+            dt = timeB - timeA
+            if dt > analyzer.fan_value_frames:
+                break
+            if dt> 0:
+                targets.append((freqB, dt, valB))
+            j+=1
+        if analyzer.max_targets_per_anchor is not None and len(targets) > analyzer.max_targets_per_anchor:
+            strongest = sorted(range(len(targets)), key=lambda k: -targets[k][2])[:analyzer.max_targets_per_anchor]
+            targets = [targets[k] for k in sorted(strongest)]
+        for freqB, dt, valB in targets:
+            yield (freqA, freqB, dt), timeA
+
+
+def reference_identify(analyzer, ref_audio, sample_audio):
+    """
+    The original dictionary based vote.
+    """
+    ref_fp = defaultdict(list)
+    for hashkey, timeA in reference_pairs(analyzer, analyzer.detect_peaks_2d(analyzer.spectrogram_db(ref_audio))):
+        ref_fp[hashkey].append(timeA)
+    offset_map = defaultdict(float)
+    for hashkey, sample_offset in reference_pairs(analyzer, analyzer.detect_peaks_2d(analyzer.spectrogram_db(sample_audio))):
+        if hashkey in ref_fp:
+            ref_offsets = ref_fp[hashkey]
+            weight = analyzer.hash_weight(hashkey, len(ref_offsets))
+            if weight == 0:
+                continue
+            for ref_offset in ref_offsets:
+                offset_map[ref_offset - sample_offset] += weight
+    if not offset_map:
+        return (False, 0, None)
+    best_off, best_count = max(offset_map.items(), key=lambda x: x[1])
+    best_count = int(round(best_count))
+    return (best_count >= analyzer.min_count, best_count, best_off)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=3)
+    parser.add_argument("--stream-seconds", type=int, default=300)
+    parser.add_argument("--window-seconds", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    cases = make_cases(args.cases, stream_seconds=args.stream_seconds, clip_seconds=10, seed=args.seed, jingle_every=6)
+    failures = 0
+    print(f"{'config':<20}{'pairs':>10}{'loop s':>9}{'array s':>9}{'identify':>10}  result")
+    for name, options in CONFIGS.items():
+        analyzer = FingerprintIdentifier(sr=cases[0]["sr"], **options)
+        pair_count, loop_seconds, array_seconds, identify_same, same = 0, 0.0, 0.0, True, True
+        for case in cases:
+            sr = case["sr"]
+            step = args.window_seconds * sr
+            for start in range(0, len(case["stream"]), step):
+                window = case["stream"][start:start + step]
+                if len(window) < analyzer.n_fft:
+                    continue
+                peaks = analyzer.detect_peaks_2d(analyzer.spectrogram_db(window))
+
+                begin = time.perf_counter()
+                expected = list(reference_pairs(analyzer, peaks))
+                loop_seconds += time.perf_counter() - begin
+                begin = time.perf_counter()
+                hashes, times = analyzer.fingerprint_arrays(peaks)
+                array_seconds += time.perf_counter() - begin
+
+                pair_count += len(expected)
+                expected_hashes = pack_hashkey(*np.array([h for h, t in expected], dtype=np.int64).reshape(-1, 3).T)
+                expected_times = np.array([t for h, t in expected], dtype=np.int64)
+                same &= np.array_equal(hashes, expected_hashes) and np.array_equal(times, expected_times)
+                identify_same &= analyzer.identify_pairs(window, analyzer.query_pairs(case["clip"])) == \
+                    reference_identify(analyzer, window, case["clip"])
+        ok = same and identify_same
+        failures += not ok
+        print(f"{name:<20}{pair_count:>10}{loop_seconds:>9.2f}{array_seconds:>9.2f}{str(identify_same):>10}  "
+              f"{'identical' if ok else 'DIFFERENT'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Bloom filter prefilter of the reference pairs (hash_filter.py) against grouping every reference pair.
+
+The windows of a synthetic stream are identified with one clip, with and without the prefilter, and then with
+--batch clips: one identify_pairs per clip against one identify_batch with a combined filter. The table shows the
+milliseconds per window, in total and in the hashing step that pairs and groups the reference (the part the filter
+changes, the STFT and the peak detection are the same in every mode), the hit rate of the filter (reference pairs
+that passed / pairs tested) and the false positive rate (pairs that passed without being in a clip / pairs tested).
+Every configuration must give the same (is_match, best_count, best_offset) as the plain vote; the script exits with
+status 1 otherwise.
+
+    python -m benchmarks.prefilter [--stream-seconds 1200] [--window-seconds 150] [--batch 8]
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import distort, make_stream
+from fingerprint import FingerprintIdentifier
+from hash_filter import HashFilter
+from instrumentation import Instrumentation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream-seconds", type=int, default=1200)
+    parser.add_argument("--window-seconds", type=int, default=150)
+    parser.add_argument("--clip-seconds", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    rng = np.random.default_rng(args.seed)
+    stream = make_stream(args.stream_seconds, args.seed, sr)
+    windows = [stream[start * sr:(start + args.window_seconds) * sr]
+               for start in range(0, args.stream_seconds - args.window_seconds + 1, args.window_seconds)]
+    clips = []
+    for index in range(args.batch):
+        start = int(rng.uniform(0, args.stream_seconds - args.clip_seconds))
+        clips.append(distort(stream[start * sr:(start + args.clip_seconds) * sr], index))
+    plain = FingerprintIdentifier(sr=sr, prefilter=False)
+    queries = [plain.query_pairs(clip) for clip in clips]
+    # Warm up, the first identification of a process is much slower
+    plain.identify_pairs(windows[0], queries[0])
+
+    def run(name, prefilter, identify):
+        instrumentation = Instrumentation()
+        analyzer = FingerprintIdentifier(sr=sr, prefilter=prefilter, instrumentation=instrumentation)
+        start = time.perf_counter()
+        results = [identify(analyzer, window) for window in windows]
+        seconds = time.perf_counter() - start
+        summary = instrumentation.report()
+        counters = summary["counters"]
+        tested = counters.get("filter_pairs", 0)
+        row = {"name": name, "ms": 1000 * seconds / len(windows),
+               "hashing_ms": 1000 * summary["spans"]["hashing"]["total"] / len(windows),
+               "hit_rate": counters.get("filter_passed", 0) / tested if tested else None,
+               "false_rate": (counters.get("filter_passed", 0) - counters.get("filter_matched", 0)) / tested if tested else None}
+        return row, results
+
+    rows = []
+    single_filter = HashFilter(queries[0][0])
+    baseline = None
+    same = True
+    for name, prefilter, identify in (
+            ("1 clip, no filter", False, lambda analyzer, window: [analyzer.identify_pairs(window, queries[0])]),
+            ("1 clip, filter", True, lambda analyzer, window: [analyzer.identify_pairs(window, queries[0], single_filter)]),
+            (f"{args.batch} clips, no filter", False,
+             lambda analyzer, window: [analyzer.identify_pairs(window, query) for query in queries]),
+            (f"{args.batch} clips, filter each", True,
+             lambda analyzer, window: [analyzer.identify_pairs(window, query) for query in queries]),
+            (f"{args.batch} clips, batch", True, lambda analyzer, window: analyzer.identify_batch(window, queries))):
+        row, results = run(name, prefilter, identify)
+        rows.append(row)
+        if len(results[0]) == 1:
+            same &= results == [[plain.identify_pairs(window, queries[0])] for window in windows]
+        elif baseline is None:
+            baseline = results
+        else:
+            same &= results == baseline
+
+    print(f"{'mode':<24}{'ms/window':>10}{'hashing ms':>11}{'hit rate':>10}{'false pos':>11}")
+    for row in rows:
+        hit = "" if row["hit_rate"] is None else f"{100 * row['hit_rate']:.2f}%"
+        false = "" if row["false_rate"] is None else f"{100 * row['false_rate']:.2f}%"
+        print(f"{row['name']:<24}{row['ms']:>10.1f}{row['hashing_ms']:>11.1f}{hit:>10}{false:>11}")
+    print("Same results:", same)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
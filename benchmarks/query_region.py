@@ -0,0 +1,95 @@
+"""
+Voting with the most distinctive part of a long clip (FingerprintIdentifier query_seconds) against the whole clip.
+
+Clips of --clip-seconds are cut from a synthetic stream (with a jingle repeating every --jingle-every seconds) and
+distorted; every clip is identified in a window of --window-seconds that contains it and in one that does not. The
+table shows, per query_seconds, the pairs that vote, the milliseconds per window (in total and in the hashing and
+voting steps, the ones the query size changes), the lowest score of a window with the clip, the highest score of
+a window without it (the jingle is in both, so a clip has chance votes there), and the largest error of the clip
+start found (best_offset mapped back to seconds) against its true start. The script exits with status 1 if a clip
+is missed or a start is off by more than one second.
+
+    python -m benchmarks.query_region [--clip-seconds 180] [--window-seconds 480] [--clips 4]
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import distort, make_stream
+from fingerprint import FingerprintIdentifier
+from instrumentation import Instrumentation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream-seconds", type=int, default=1500)
+    parser.add_argument("--clip-seconds", type=int, default=180)
+    parser.add_argument("--window-seconds", type=int, default=480)
+    parser.add_argument("--clips", type=int, default=4)
+    parser.add_argument("--jingle-every", type=int, default=45)
+    parser.add_argument("--query-seconds", type=float, nargs="+", default=[60, 30, 15])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    rng = np.random.default_rng(args.seed)
+    stream = make_stream(args.stream_seconds, args.seed, sr, jingle_every=args.jingle_every)
+    cases = []
+    for index in range(args.clips):
+        clip_start = int(rng.uniform(0, args.stream_seconds - args.clip_seconds))
+        clip = distort(stream[clip_start * sr:(clip_start + args.clip_seconds) * sr], index)
+        # A window holding the clip somewhere inside, and the window furthest away from it
+        window_start = int(np.clip(clip_start - rng.uniform(0, args.window_seconds - args.clip_seconds),
+                                   0, args.stream_seconds - args.window_seconds))
+        other_start = 0 if clip_start > args.stream_seconds / 2 else args.stream_seconds - args.window_seconds
+        cases.append({"clip": clip, "clip_start": clip_start, "window_start": window_start,
+                      "window": stream[window_start * sr:(window_start + args.window_seconds) * sr],
+                      "other": stream[other_start * sr:(other_start + args.window_seconds) * sr]})
+    # Warm up, the first identification of a process is much slower
+    FingerprintIdentifier(sr=sr).identify(cases[0]["window"][:30 * sr], cases[0]["clip"][:10 * sr])
+
+    rows = []
+    passed = True
+    for query_seconds in [None] + args.query_seconds:
+        instrumentation = Instrumentation()
+        analyzer = FingerprintIdentifier(sr=sr, query_seconds=query_seconds, instrumentation=instrumentation)
+        pair_counts, positives, negatives, errors = [], [], [], []
+        seconds = 0.0
+        for case in cases:
+            pairs = analyzer.query_pairs(case["clip"])
+            pair_counts.append(len(pairs[0]))
+            start = time.perf_counter()
+            is_match, best_count, best_offset = analyzer.identify_pairs(case["window"], pairs)
+            _, other_count, _ = analyzer.identify_pairs(case["other"], pairs)
+            seconds += time.perf_counter() - start
+            positives.append(best_count if is_match else 0)
+            negatives.append(other_count)
+            passed &= is_match
+            if best_offset is not None:
+                found_start = case["window_start"] + best_offset * analyzer.hop_length / sr
+                errors.append(abs(found_start - case["clip_start"]))
+            else:
+                errors.append(float("inf"))
+        passed &= max(errors) <= 1.0
+        spans = instrumentation.report()["spans"]
+        windows = 2 * len(cases)
+        rows.append({"name": "whole clip" if query_seconds is None else f"{query_seconds:g} s",
+                     "pairs": int(np.mean(pair_counts)), "ms": 1000 * seconds / windows,
+                     "hashing_ms": 1000 * spans["hashing"]["total"] / windows,
+                     "voting_ms": 1000 * spans["voting"]["total"] / windows,
+                     "min_score": min(positives), "max_other": max(negatives), "error": max(errors)})
+
+    print(f"{'query':<12}{'pairs':>8}{'ms/window':>11}{'hashing ms':>12}{'voting ms':>11}"
+          f"{'min score':>11}{'max other':>11}{'start error s':>15}")
+    for row in rows:
+        print(f"{row['name']:<12}{row['pairs']:>8}{row['ms']:>11.1f}{row['hashing_ms']:>12.1f}{row['voting_ms']:>11.1f}"
+              f"{row['min_score']:>11}{row['max_other']:>11}{row['error']:>15.3f}")
+    print("All clips located:", passed)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
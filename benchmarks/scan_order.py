@@ -0,0 +1,98 @@
+"""
+Time to match against the position of the clip in the stream, for each scan order (scan_order.py).
+
+Every stream is quiet background with a few loud, busy sections (decoys), and the clip is cut out of
+another loud section placed at a given fraction of the stream, like a highlight of a long recording.
+The stream is written as split files of --split-seconds, then searched with locator.search_long_audio
+in time order and in loudness order. The "quiet" row cuts the clip out of the quiet background instead,
+the worst case of the loudness order, which then has to search everything else first.
+The table shows the mean seconds until the search returned and how many fixtures were answered correctly.
+
+    python -m benchmarks.scan_order [--stream-seconds 1800] [--split-seconds 600] [--positions 0.1,0.3,0.5,0.7,0.9]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.fixtures import distort, make_stream
+from fingerprint import FingerprintIdentifier
+from locator import search_long_audio
+from scan_order import SCAN_ORDERS
+
+
+def make_highlight_stream(seconds, seed, sr, position, decoys=3, highlight_seconds=40, quiet=False):
+    """
+    Return (stream, clip, clip_offset): a quiet stream with loud sections, the clip cut at position (fraction)
+    out of a loud section, or out of the quiet background if quiet.
+    """
+    rng = np.random.default_rng(seed)
+    stream = make_stream(seconds, seed, sr, dense_sections=0, silent_sections=0) * 0.25
+    clip_offset = float(int(position * seconds))
+    starts = [float(start) for start in rng.uniform(0, seconds - highlight_seconds, decoys)]
+    if not quiet:
+        starts.append(max(0.0, clip_offset - highlight_seconds / 2))
+    for index, start in enumerate(starts):
+        section = make_stream(highlight_seconds, seed * 100 + index, sr, dense_sections=0, silent_sections=0)
+        i0 = int(start * sr)
+        stream[i0:i0 + len(section)] = section[:len(stream) - i0] * 0.9
+    return stream, stream[int(clip_offset * sr):int((clip_offset + 15) * sr)], clip_offset
+
+
+def write_segments(stream, sr, split_seconds, directory, name):
+    paths = []
+    for index, start in enumerate(range(0, len(stream), split_seconds * sr)):
+        path = os.path.join(directory, f"{name}_{index:03d}.wav")
+        sf.write(path, stream[start:start + split_seconds * sr], sr)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stream-seconds", type=int, default=1800)
+    parser.add_argument("--split-seconds", type=int, default=600)
+    parser.add_argument("--positions", default="0.1,0.3,0.5,0.7,0.9", help="Comma separated positions of the clip (fractions)")
+    parser.add_argument("--cases", type=int, default=2, help="Streams per position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    rows = []
+    positions = [(float(value), False) for value in args.positions.split(",")] + [(0.5, True)]
+    print(f"{'position':>9}  {'order':<10}{'mean seconds':>13}{'windows':>9}{'correct':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for position, quiet in positions:
+            streams = []
+            for index in range(args.cases):
+                seed = args.seed * 1000 + index * 17 + int(position * 100) + (500 if quiet else 0)
+                stream, clip, clip_offset = make_highlight_stream(args.stream_seconds, seed, sr, position, quiet=quiet)
+                paths = write_segments(stream, sr, args.split_seconds, directory, f"stream_{seed}")
+                streams.append((paths, distort(clip, seed), clip_offset))
+            for name, scan_order in SCAN_ORDERS.items():
+                seconds, windows, correct = 0.0, 0, 0
+                for paths, clip, clip_offset in streams:
+                    start = time.perf_counter()
+                    result = search_long_audio(clip, len(clip) / sr, paths, args.split_seconds, sr, FingerprintIdentifier(sr=sr),
+                                               scan_order=None if scan_order is None else scan_order())
+                    seconds += time.perf_counter() - start
+                    windows += result["windows_searched"]
+                    correct += result["found"] and abs(result["offset_seconds"] - clip_offset) <= 1
+                label = "quiet" if quiet else f"{position:.0%}"
+                rows.append({"position": position, "quiet": quiet, "order": name, "mean_seconds": seconds / len(streams),
+                             "windows": windows / len(streams), "correct": correct, "cases": len(streams)})
+                print(f"{label:>9}  {name:<10}{seconds / len(streams):>13.2f}{windows / len(streams):>9.1f}"
+                      f"{correct:>6}/{len(streams)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Votes cast and skipped by the hash popularity stoplist, against accuracy.
+
+The 10 minute fixture streams contain an alert sound repeated every 6 seconds, the kind of content
+whose hashkeys occur thousands of times in a long stream. The 10 second clips give several sliding
+windows per stream, so the per stream stoplist has enough windows to learn from. For every configuration the benchmark reports
+the votes cast, the votes skipped, the search time and how many fixtures were answered correctly.
+
+    python -m benchmarks.stoplist [--cases 3] [--json stoplist.json]
+"""
+
+import argparse
+import json
+
+from benchmarks.density import run
+from benchmarks.fixtures import make_cases
+from stoplist import HashStoplist
+
+CONFIGS = {
+    "baseline": {},
+    "window_max8_skip": {"max_hash_occurrences": 8},
+    "window_max4_skip": {"max_hash_occurrences": 4},
+    "window_max4_weight": {"max_hash_occurrences": 4, "stoplist_mode": "weight"},
+    "stream_stoplist_skip": lambda: {"stoplist": HashStoplist(max_document_fraction=0.3)},
+    "stream_stoplist_weight": lambda: {"stoplist": HashStoplist(max_document_fraction=0.3), "stoplist_mode": "weight"},
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=3, help="Number of positive fixtures (one negative is added)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    cases = make_cases(args.cases, stream_seconds=600, clip_seconds=10, seed=args.seed, jingle_every=6)
+    rows = run(cases, CONFIGS)
+    print(f"{'config':<22}{'votes':>9}{'skipped':>9}{'seconds':>9}{'correct':>9}")
+    for row in rows:
+        print(f"{row['config']:<22}{row['votes']:>9}{row['votes_skipped']:>9}{row['seconds']:>9.2f}"
+              f"{row['correct']:>6}/{row['cases']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
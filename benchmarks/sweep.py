@@ -0,0 +1,185 @@
+"""
+Parameter sweep of FingerprintIdentifier: throughput, memory and accuracy of every configuration, and the Pareto front.
+
+The defaults of n_fft, hop_length, peak_threshold, peak_neighborhood, fan_value_frames and min_count come from
+manual testing. This tool searches a labelled fixture set with every configuration of a grid (or a random sample of
+it) using locator.search_long_audio, and records for each one:
+    throughput:  seconds of original searched per second of computation
+    memory_mb:   peak memory allocated while one sliding window is identified (tracemalloc)
+    recall:      fraction of the clips found at the right offset (within 1 second)
+    false_rate:  fraction of the searches that reported a match at a wrong offset, or in an original without the clip
+The Pareto-optimal configurations (no other configuration is at least as good on all four and better on one) are
+printed, with the fastest one meeting --min-recall and --max-false-rate.
+
+Fixtures are synthetic (benchmarks.fixtures) unless --fixtures gives a JSON list of labelled local files:
+    [{"clip": "clip.wav", "start": 5, "end": 15, "original": "vod.m4a", "offset": 3723.0}, ...]
+where start / end (optional) cut the clip out of its file and offset is null when the clip is not in the original.
+
+    python -m benchmarks.sweep [--random 24] [--grid] [--cases 4] [--fixtures labels.json] [--min-recall 1] [--json sweep.json]
+"""
+
+import argparse
+import itertools
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+
+import librosa
+
+from benchmarks.fixtures import make_cases, write_stream
+from fingerprint import FingerprintIdentifier
+from locator import load_clip, search_long_audio, window_geometry
+
+# Values of every parameter tried by the sweep, the first configuration is always the default one
+SPACE = {
+    "n_fft": [2048, 1024, 4096],
+    "hop_length": [512, 256, 1024],
+    "peak_threshold": [-30.0, -40.0, -20.0],
+    "peak_neighborhood": [3, 2, 5],
+    "fan_value_frames": [5, 3, 10],
+    "min_count": [8, 6, 12],
+}
+
+METRICS = {"throughput": 1, "memory_mb": -1, "recall": 1, "false_rate": -1}
+
+
+def configurations(space, sample=None, seed=0):
+    """
+    Return the configurations of the grid, or the default one plus `sample` random ones without repetition.
+    """
+    default = {name: values[0] for name, values in space.items()}
+    if sample is None:
+        return [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    rng = random.Random(seed)
+    configs = [default]
+    seen = {tuple(default.values())}
+    total = 1
+    for values in space.values():
+        total *= len(values)
+    while len(configs) < min(sample + 1, total):
+        config = {name: rng.choice(values) for name, values in space.items()}
+        if tuple(config.values()) not in seen:
+            seen.add(tuple(config.values()))
+            configs.append(config)
+    return configs
+
+
+def synthetic_fixtures(cases, stream_seconds, clip_seconds, seed, directory):
+    fixtures = []
+    for case in make_cases(cases, stream_seconds=stream_seconds, clip_seconds=clip_seconds, seed=seed):
+        fixtures.append({"clip": case["clip"], "original": write_stream(case, directory), "offset": case["clip_offset"]})
+    return fixtures
+
+
+def file_fixtures(path, sr):
+    with open(path, encoding="utf-8") as f:
+        labels = json.load(f)
+    fixtures = []
+    for label in labels:
+        clip, _ = load_clip(label["clip"], sr, label.get("start"), label.get("end"))
+        fixtures.append({"clip": clip, "original": label["original"], "offset": label.get("offset")})
+    return fixtures
+
+
+def window_memory_mb(analyzer, clip, original, seconds):
+    """
+    Peak memory allocated while one window of `seconds` of the original is identified.
+    """
+    audio, _ = librosa.load(original, sr=analyzer.sr, duration=seconds)
+    pairs = analyzer.query_pairs(clip)
+    tracemalloc.start()
+    try:
+        analyzer.identify_pairs(audio, pairs)
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def evaluate(config, fixtures, sr):
+    analyzer = FingerprintIdentifier(sr=sr, **config)
+    found, wrong, positives, searched_seconds, compute_seconds = 0, 0, 0, 0.0, 0.0
+    for fixture in fixtures:
+        clip_seconds = len(fixture["clip"]) / sr
+        start = time.perf_counter()
+        result = search_long_audio(fixture["clip"], clip_seconds, [fixture["original"]], sr=sr, analyzer=analyzer,
+                                   geometry=window_geometry(clip_seconds))
+        compute_seconds += time.perf_counter() - start
+        searched_seconds += librosa.get_duration(path=fixture["original"])
+        correct_offset = result["found"] and fixture["offset"] is not None and abs(result["offset_seconds"] - fixture["offset"]) <= 1
+        positives += fixture["offset"] is not None
+        found += correct_offset
+        wrong += result["found"] and not correct_offset
+    segment_length, overlap = window_geometry(len(fixtures[0]["clip"]) / sr)
+    return {
+        **config,
+        "throughput": searched_seconds / compute_seconds,
+        "memory_mb": window_memory_mb(analyzer, fixtures[0]["clip"], fixtures[0]["original"], segment_length + 2 * overlap),
+        "recall": found / positives if positives else 1.0,
+        "false_rate": wrong / len(fixtures),
+    }
+
+
+def pareto_front(rows):
+    """
+    Return the rows that no other row dominates on METRICS.
+    """
+    def dominates(a, b):
+        at_least = all(a[name] * sign >= b[name] * sign for name, sign in METRICS.items())
+        better = any(a[name] * sign > b[name] * sign for name, sign in METRICS.items())
+        return at_least and better
+    return [row for row in rows if not any(dominates(other, row) for other in rows if other is not row)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid", action="store_true", help="Evaluate the whole grid (729 configurations) instead of a random sample")
+    parser.add_argument("--random", type=int, default=24, help="Number of random configurations besides the default one")
+    parser.add_argument("--fixtures", help="JSON list of labelled local files (see above), instead of synthetic fixtures")
+    parser.add_argument("--cases", type=int, default=4, help="Number of positive synthetic fixtures (one negative is added)")
+    parser.add_argument("--stream-seconds", type=int, default=300)
+    parser.add_argument("--clip-seconds", type=int, default=10)
+    parser.add_argument("--min-recall", type=float, default=1.0, help="Accuracy target: minimum recall")
+    parser.add_argument("--max-false-rate", type=float, default=0.0, help="Accuracy target: maximum false-match rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write every row to this JSON file")
+    args = parser.parse_args(argv)
+
+    sr = 16000
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        if args.fixtures:
+            fixtures = file_fixtures(args.fixtures, sr)
+        else:
+            fixtures = synthetic_fixtures(args.cases, args.stream_seconds, args.clip_seconds, args.seed, directory)
+        for config in configurations(SPACE, None if args.grid else args.random, args.seed):
+            rows.append(evaluate(config, fixtures, sr))
+
+    names = list(SPACE)
+    header = "".join(f"{name:>{len(name) + 2}}" for name in names) + f"{'throughput':>12}{'memory MB':>11}{'recall':>8}{'false':>7}"
+
+    def line(row):
+        return "".join(f"{row[name]:>{len(name) + 2}}" for name in names) + \
+            f"{row['throughput']:>11.0f}x{row['memory_mb']:>11.0f}{row['recall']:>8.0%}{row['false_rate']:>7.0%}"
+
+    front = sorted(pareto_front(rows), key=lambda row: -row["throughput"])
+    print(f"Pareto front ({len(front)} of {len(rows)} configurations):")
+    print(header)
+    for row in front:
+        print(line(row))
+    print("\nDefault configuration:")
+    print(line(rows[0]))
+    eligible = [row for row in rows if row["recall"] >= args.min_recall and row["false_rate"] <= args.max_false_rate]
+    if eligible:
+        print(f"\nFastest configuration with recall >= {args.min_recall:.0%} and false-match rate <= {args.max_false_rate:.0%}:")
+        print(line(max(eligible, key=lambda row: row["throughput"])))
+    else:
+        print("\nNo configuration meets the accuracy targets")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "pareto_front": front}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
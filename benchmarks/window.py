@@ -0,0 +1,76 @@
+"""
+Accuracy and search time of the window planning policies (window_policy.py).
+
+For several clip lengths, every fixture stream is searched with locator.search_long_audio using the
+geometry chosen by each policy. The benchmark reports the window the policy chose, the number of
+windows searched, the time (planning included) and how many fixtures were answered correctly.
+
+    python -m benchmarks.window [--cases 3] [--stream-seconds 1200] [--clip-seconds 5,15,60] [--json window.json]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.fixtures import is_correct, make_cases, write_stream
+from fingerprint import FingerprintIdentifier
+from locator import search_long_audio
+from window_policy import WINDOW_POLICIES
+
+
+def run(cases, policies):
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [write_stream(case, directory) for case in cases]
+        for name, policy in policies.items():
+            correct, windows, seconds, lengths = 0, 0, 0.0, set()
+            for case, path in zip(cases, paths):
+                analyzer = FingerprintIdentifier(sr=case["sr"])
+                clip_seconds = len(case["clip"]) / case["sr"]
+                start = time.perf_counter()
+                plan = policy.plan(case["clip"], clip_seconds, analyzer)
+                result = search_long_audio(case["clip"], clip_seconds, [path], sr=case["sr"], analyzer=analyzer,
+                                           geometry=(plan["segment_length"], plan["overlap"]))
+                seconds += time.perf_counter() - start
+                windows += result["windows_searched"]
+                lengths.add((plan["segment_length"], plan["overlap"]))
+                correct += is_correct(case, result)
+            rows.append({
+                "policy": name,
+                "geometry": sorted(lengths),
+                "windows": windows,
+                "seconds": seconds,
+                "correct": correct,
+                "cases": len(cases),
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=3, help="Number of positive fixtures per clip length (one negative is added)")
+    parser.add_argument("--stream-seconds", type=int, default=1200)
+    parser.add_argument("--clip-seconds", default="5,15,60", help="Comma separated clip lengths")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the rows to this JSON file")
+    args = parser.parse_args(argv)
+
+    policies = {name: policy() for name, policy in WINDOW_POLICIES.items()}
+    all_rows = []
+    print(f"{'clip s':>7}  {'policy':<8}{'segment, overlap':<22}{'windows':>8}{'seconds':>9}{'correct':>9}")
+    for clip_seconds in [int(value) for value in args.clip_seconds.split(",")]:
+        cases = make_cases(args.cases, stream_seconds=args.stream_seconds, clip_seconds=clip_seconds, seed=args.seed)
+        for row in run(cases, policies):
+            row["clip_seconds"] = clip_seconds
+            all_rows.append(row)
+            geometry = " ".join(f"{length},{overlap}" for length, overlap in row["geometry"])
+            print(f"{clip_seconds:>7}  {row['policy']:<8}{geometry:<22}{row['windows']:>8}{row['seconds']:>9.2f}"
+                  f"{row['correct']:>6}/{row['cases']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(all_rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Checkpoint of a search, so a scan interrupted in hour 6 of an 8 hour original resumes where it stopped.
+
+A network error, running out of memory or Ctrl-C used to lose everything: the menus delete ./audio and ./segment
+when the search fails, and the next attempt downloads, splits and fingerprints the original again.
+ScanCheckpoint records the progress of one query in a JSON file, written atomically after every step:
+    - the downloaded original (path, duration and size, the file is reused if it is still there and complete),
+    - the split files (reused if they all still exist),
+    - the window plan and the memory plan (a remeasured plan could move the windows or change the split files),
+    - every searched window without a match, with its best count.
+locator.search_long_audio skips the recorded windows, and split files whose windows are all recorded are not
+even decoded again. Matching windows are never recorded: they are searched again, which also refines the offset.
+
+The checkpoint belongs to one query, identified by the result cache key (result_cache.cache_key: clip audio,
+original identity and matcher parameters). A checkpoint of another query, or of the same query with other split
+files or another window geometry, is discarded. The caller clears it once the search has finished.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class ScanCheckpoint:
+    """
+    Progress of the search of one query, kept in a JSON file.
+
+    args:
+        path: str, Checkpoint file
+        key: str, Identity of the query (result_cache.cache_key), a file of another query is discarded
+        save_interval: float, Seconds between two writes of the window results (the other steps are written at once)
+
+    methods:
+        get(name) / set(name, value): Read / record a value of the query, such as the window plan.
+        original(): Return (path, seconds) of the recorded download if the file is still complete, else None.
+        record_original(path, seconds): Record the downloaded original.
+        segments(split_duration): Return the recorded split files if they all still exist, else None.
+        record_segments(paths, split_duration): Record the split files.
+        start_scan(split_duration, segment_length, overlap): Keep the window results only if the windows are the same.
+        window_count(segment_index, seg_start): Best count of a recorded window, or None.
+        record_window(segment_index, seg_start, best_count): Record a window without a match.
+        segment_done(segment_index) / record_segment(segment_index): Whether every window of a split file was searched.
+        save(): Write the checkpoint now.
+        clear(): Delete the checkpoint, once the search has finished (cleared is then True).
+    """
+
+    def __init__(self, path, key, save_interval=2.0):
+        self.path = path
+        self.key = key
+        self.save_interval = save_interval
+        self.last_save = 0.0
+        self.cleared = False
+        self.state = self._load()
+        self.resumed = self.state is not None
+        if self.state is None:
+            self.state = {"version": 1, "key": key, "values": {}, "original": None, "segments": None,
+                          "scan": None, "windows": {}, "segments_done": []}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get("version") != 1 or state.get("key") != self.key:
+            return None
+        return state
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.state, updated=time.time()), f)
+        os.replace(temporary_path, self.path)
+        self.last_save = time.monotonic()
+
+    def clear(self):
+        self.cleared = True
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, name):
+        return self.state["values"].get(name)
+
+    def set(self, name, value):
+        self.state["values"][name] = value
+        self.save()
+
+    def original(self):
+        original = self.state["original"]
+        if original is None or not os.path.isfile(original["path"]) or os.path.getsize(original["path"]) != original["size"]:
+            return None
+        return original["path"], original["seconds"]
+
+    def record_original(self, path, seconds):
+        self.state["original"] = {"path": path, "seconds": seconds, "size": os.path.getsize(path)}
+        self.save()
+
+    def segments(self, split_duration):
+        segments = self.state["segments"]
+        if segments is None or segments["split_duration"] != split_duration:
+            return None
+        # The last split file may legitimately be missing (see locator.search_long_audio)
+        if not all(os.path.exists(path) for path in segments["paths"][:-1]):
+            return None
+        return segments["paths"]
+
+    def record_segments(self, paths, split_duration):
+        self.state["segments"] = {"paths": list(paths), "split_duration": split_duration}
+        self.save()
+
+    def start_scan(self, split_duration, segment_length, overlap):
+        scan = [split_duration, segment_length, overlap]
+        if self.state["scan"] != scan:
+            self.state["scan"] = scan
+            self.state["windows"] = {}
+            self.state["segments_done"] = []
+            self.save()
+
+    def window_count(self, segment_index, seg_start):
+        return self.state["windows"].get(f"{segment_index}:{seg_start:.3f}")
+
+    def record_window(self, segment_index, seg_start, best_count):
+        self.state["windows"][f"{segment_index}:{seg_start:.3f}"] = best_count
+        if time.monotonic() - self.last_save >= self.save_interval:
+            self.save()
+
+    def segment_done(self, segment_index):
+        return segment_index in self.state["segments_done"]
+
+    def record_segment(self, segment_index):
+        self.state["segments_done"].append(segment_index)
+        self.save()
@@ -0,0 +1,621 @@
+"""
+Headless command line for HighlightLocator.
+
+Unlike main_en.py it never prompts: every input comes from the arguments and the result is written
+to stdout as one JSON document, so many locates can be started in parallel by a job scheduler.
+Each run works in its own temporary directory, therefore parallel runs do not share ./audio or ./segment.
+Everything else the pipeline prints (download progress, splitter messages) goes to stderr.
+The JSON result includes the total seconds of every stage and the work counters; --report writes the
+full instrumentation report and --trace a Chrome trace timeline of every span.
+Matches are kept in the result cache (result_cache.py), a repeated query is answered without downloading the original.
+The information yt-dlp extracts for a video is cached for an hour (info_cache.py), "info_cache" gives its hit rate.
+With --compilation the clip is a highlight compilation: every clip in it is located in one pass (compilation.py)
+and the result lists them under "clips".
+With --checkpoint and a --work-dir, a search that fails or is interrupted keeps its progress (checkpoint.py),
+and running the same command again resumes it without downloading or searching again what was done.
+With --time-budget the search stops after that many seconds and reports the best match or best guess so far,
+with "complete" false and the fraction of the original covered; with --checkpoint a new run refines it.
+
+Example:
+    python cli.py --clip https://youtu.be/xxxx --start 1:05 --end 1:20 --original https://www.twitch.tv/videos/123
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import librosa
+
+from checkpoint import ScanCheckpoint
+from compilation import index_originals, locate_compilation
+from distributed import ScanCoordinator, parse_address, start_local_workers
+from download_en import Download
+from fingerprint import FingerprintIdentifier
+from info_cache import shared_info_cache
+from instrumentation import Instrumentation, peak_rss_mb
+from stoplist import HashStoplist
+from locator import list_media_files, load_clip, search_long_audio, split_long_audio
+from low_information import LowInformationDetector
+from main_en import download_sound_file, filter_warning, is_valid_twitch_url, is_valid_youtube_url
+from resource_governor import ResourceGovernor
+from result_cache import ResultCache, cache_key, default_cache_path, original_identity, search_params
+from scan_order import SCAN_ORDERS
+from window_policy import WINDOW_POLICIES
+from split_audio_large_segments_en import LargeAudioSplitter
+from time_calculate import time_format
+
+# Exit codes
+EXIT_FOUND = 0          # The clip was located
+EXIT_NOT_FOUND = 1      # The whole original was searched without a match
+EXIT_USAGE = 2          # Invalid arguments (same code argparse uses)
+EXIT_ERROR = 3          # Download, decoding or processing failed
+EXIT_INCOMPLETE = 4     # The time budget ran out before a match, the result holds the best guess so far
+
+
+def classify_source(source, allow_directory=False):
+    """
+    Return (source, source_type) where source_type is youtube, twitch, file or directory.
+    Raise ValueError if the source is neither a supported URL nor an existing file (or directory of media files).
+    args:
+        source: str, URL or local path given on the command line
+        allow_directory: bool, Accept a directory, whose media files are searched one after another
+    """
+    if is_valid_twitch_url(source):
+        return source.split('&')[0], "twitch"
+    if is_valid_youtube_url(source):
+        return source.split('&')[0], "youtube"
+    if os.path.isfile(source):
+        return source, "file"
+    if allow_directory and os.path.isdir(source):
+        if not list_media_files(source):
+            raise ValueError(f"No media files in the directory : {source}")
+        return source, "directory"
+    raise ValueError(f"Not a YouTube/Twitch URL or an existing file : {source}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Locate a highlight clip inside the original video without any prompt and print the result as JSON.")
+    parser.add_argument("--clip", required=True, help="Highlight video URL (YouTube or Twitch) or local media file")
+    parser.add_argument("--start", default="0", help="Start of the clip range, SS, MM:SS or HH:MM:SS (default 0)")
+    parser.add_argument("--end", help="End of the clip range, SS, MM:SS or HH:MM:SS (default 10, the whole clip with --compilation)")
+    parser.add_argument("--original", required=True,
+                        help="Original video URL (YouTube or Twitch), local media file, or a directory of media files searched as a batch")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    parser.add_argument("--work-dir", help="Directory for downloaded and split files (default: a new temporary directory)")
+    parser.add_argument("--keep-files", action="store_true", help="Do not delete the working directory afterwards")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="Record the progress in the --work-dir, so running the same command again resumes an interrupted search")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS",
+                        help="Stop searching after this many seconds (counted from the start, downloads included) and "
+                             "report the best match or best guess so far; with --checkpoint a new run continues the search")
+    parser.add_argument("--report", help="Write the instrumentation report (spans, counters, peak RSS) to this JSON file")
+    parser.add_argument("--trace", help="Write a Chrome trace (chrome://tracing, Perfetto) of every span to this file")
+    parser.add_argument("--result-cache", metavar="PATH",
+                        help="Result cache file (default ~/.cache/highlightlocator/results.json, or $HIGHLIGHTLOCATOR_RESULT_CACHE)")
+    parser.add_argument("--result-cache-ttl", type=float, default=30, metavar="DAYS",
+                        help="Cached results older than this are searched again (default 30)")
+    parser.add_argument("--no-result-cache", action="store_true", help="Neither read nor write the result cache")
+    parser.add_argument("--compilation", action="store_true",
+                        help="The clip is a compilation of several clips: locate every one of them in a single run")
+    parser.add_argument("--min-run-seconds", type=float, default=2.0,
+                        help="Shortest clip of a compilation that is reported, in seconds (default 2)")
+
+    search = parser.add_argument_group("search options")
+    search.add_argument("--split-duration", type=int, default=3600, help="Length of each split file in seconds (default 3600)")
+    search.add_argument("--window-policy", choices=sorted(WINDOW_POLICIES), default="fixed",
+                        help="How the sliding window is sized: fixed (the original multipliers of the clip duration) or "
+                             "auto (from the measured cost per window and the clip's fingerprint density), default fixed")
+    search.add_argument("--scan-order", choices=sorted(SCAN_ORDERS), default="time",
+                        help="Order of the windows: time (from the start of the original) or loudness (loud, busy windows "
+                             "first, stopping at the first match of at least --confident-count), default time")
+    search.add_argument("--memory-budget", metavar="MB|auto",
+                        help="Choose the split duration, window length and parallel workers to fit this memory budget "
+                             "(auto: the cgroup limit or the available memory); overrides --split-duration")
+    search.add_argument("--sr", type=int, default=16000, help="Sampling rate used for fingerprinting (default 16000)")
+    search.add_argument("--n-fft", type=int, default=2048)
+    search.add_argument("--hop-length", type=int, default=512)
+    search.add_argument("--peak-threshold", type=float, default=-30.0)
+    search.add_argument("--peak-neighborhood", type=int, default=3)
+    search.add_argument("--fan-value-frames", type=int, default=5)
+    search.add_argument("--min-count", type=int, default=8)
+    search.add_argument("--max-peaks-per-frame", type=int, help="Keep only the N strongest peaks of each frame")
+    search.add_argument("--max-peaks-per-band", type=int, help="Keep only the N strongest peaks per frequency band per second")
+    search.add_argument("--max-targets-per-anchor", type=int, help="Pair each anchor only with its N strongest targets")
+    search.add_argument("--max-hash-occurrences", type=int, help="Treat hashkeys found more than N times in a window as uninformative")
+    search.add_argument("--stream-stoplist", type=float, metavar="FRACTION",
+                        help="Learn hashkey popularity over the searched windows, hashkeys in more than FRACTION of them are uninformative")
+    search.add_argument("--stoplist", help="Hashkey popularity file of an archive (HashStoplist.save)")
+    search.add_argument("--skip-low-information", action="store_true",
+                        help="Leave silent and noise-only regions of the original out of the search")
+    search.add_argument("--stoplist-mode", choices=["skip", "weight"], default="skip",
+                        help="Drop the votes of uninformative hashkeys, or down-weight them (default skip)")
+    search.add_argument("--query-seconds", type=float, default=0, metavar="SECONDS",
+                        help="A longer clip votes only with its most distinctive SECONDS (dense, with few repeated "
+                             "hashkeys), which makes every window cheaper; 0 votes with the whole clip (default 0)")
+
+    distributed = parser.add_argument_group("distributed scan (see distributed.py)")
+    distributed.add_argument("--listen", metavar="HOST:PORT",
+                             help="Hand the windows out to workers (python distributed.py worker --connect HOST:PORT); "
+                                  "use --work-dir on a directory the workers can read")
+    distributed.add_argument("--local-workers", type=int, default=0, help="Also start N workers in this process")
+    distributed.add_argument("--windows-per-job", type=int, default=8, help="Number of sliding windows per job (default 8)")
+    distributed.add_argument("--confident-count", type=int,
+                             help="A match with at least this score cancels the remaining jobs, or ends a loudness "
+                                  "ordered scan (default --min-count)")
+    distributed.add_argument("--worker-timeout", type=float, default=120.0,
+                             help="Seconds of silence after which a busy worker is considered dead (default 120)")
+    return parser
+
+
+def resolve_inputs(args):
+    """
+    Validate the arguments that describe the query and return them in normalized form.
+    Raise ValueError if any of them is invalid.
+    args:
+        args: argparse.Namespace, Parsed command line arguments
+    """
+    clip, clip_type = classify_source(args.clip)
+    original, original_type = classify_source(args.original, allow_directory=True)
+    start_time = time_format.str_to_sec(args.start)
+    # A compilation is used whole unless --end is given
+    end = args.end if args.end is not None or args.compilation else "10"
+    end_time = None if end is None else time_format.str_to_sec(end)
+    if start_time < 0 or (end_time is not None and end_time <= start_time):
+        raise ValueError("Start time must be less than end time!")
+    if args.memory_budget not in (None, "auto"):
+        try:
+            if float(args.memory_budget) <= 0:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"--memory-budget must be a positive number of MB or auto : {args.memory_budget}") from None
+    if (args.listen or args.local_workers) and (args.skip_low_information or args.stoplist or args.stream_stoplist is not None):
+        raise ValueError("--skip-low-information and the stoplists are not supported by the distributed scan")
+    if (args.listen or args.local_workers) and args.scan_order != "time":
+        raise ValueError("--scan-order is not supported by the distributed scan")
+    if args.compilation and (args.listen or args.local_workers):
+        raise ValueError("--compilation is not supported by the distributed scan")
+    if args.checkpoint and not args.work_dir:
+        raise ValueError("--checkpoint needs a --work-dir that is kept between the runs")
+    if args.checkpoint and (args.listen or args.local_workers or args.compilation):
+        raise ValueError("--checkpoint is not supported by the distributed scan nor by --compilation")
+    if args.query_seconds < 0:
+        raise ValueError(f"--query-seconds must not be negative : {args.query_seconds}")
+    if args.time_budget is not None and args.time_budget <= 0:
+        raise ValueError(f"--time-budget must be a positive number of seconds : {args.time_budget}")
+    if args.time_budget is not None and (args.listen or args.local_workers or args.compilation):
+        raise ValueError("--time-budget is not supported by the distributed scan nor by --compilation")
+    return {
+        "clip": clip,
+        "clip_type": clip_type,
+        "original": original,
+        "original_type": original_type,
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+
+
+def build_analyzer(args, instrumentation):
+    """
+    Return the FingerprintIdentifier described by the search options.
+    args:
+        args: argparse.Namespace, Parsed command line arguments
+        instrumentation: Instrumentation, Receives the spans and counters of the fingerprinting
+    """
+    stoplist = None
+    if args.stoplist:
+        stoplist = HashStoplist.load(args.stoplist)
+    elif args.stream_stoplist is not None:
+        stoplist = HashStoplist(max_document_fraction=args.stream_stoplist)
+    return FingerprintIdentifier(
+        sr=args.sr,
+        n_fft=args.n_fft,
+        hop_length=args.hop_length,
+        peak_threshold=args.peak_threshold,
+        peak_neighborhood=args.peak_neighborhood,
+        fan_value_frames=args.fan_value_frames,
+        min_count=args.min_count,
+        max_peaks_per_frame=args.max_peaks_per_frame,
+        max_peaks_per_band=args.max_peaks_per_band,
+        max_targets_per_anchor=args.max_targets_per_anchor,
+        max_hash_occurrences=args.max_hash_occurrences,
+        stoplist=stoplist,
+        stoplist_mode=args.stoplist_mode,
+        query_seconds=args.query_seconds or None,
+        instrumentation=instrumentation,
+    )
+
+
+def search_options(args):
+    """
+    Return the search options that can change the answer, for the result cache key (see result_cache.search_params).
+    args:
+        args: argparse.Namespace, Parsed command line arguments
+    """
+    stoplist = None
+    if args.stoplist:
+        status = os.stat(args.stoplist)
+        stoplist = f"{os.path.abspath(args.stoplist)}:{status.st_size}:{status.st_mtime_ns}"
+    return {
+        "window_policy": args.window_policy,
+        "scan_order": args.scan_order,
+        "confident_count": args.confident_count,
+        "skip_low_information": args.skip_low_information,
+        "stoplist": stoplist,
+        "stream_stoplist": args.stream_stoplist,
+        "query_seconds": args.query_seconds,
+    }
+
+
+def search_original(args, analyzer, short_audio_array, short_voice_time, long_voice_path, long_voice_time, segment_prefix,
+                    instrumentation, window_plan, checkpoint=None, deadline=None):
+    """
+    Split one original into one hour files, search the clip in it and return the search result dictionary.
+    args:
+        args: argparse.Namespace, Parsed command line arguments
+        analyzer: FingerprintIdentifier, Fingerprint recognizer shared by every window
+        short_audio_array: ndarray, Short audio signal
+        short_voice_time: float, Duration of the short audio in seconds
+        long_voice_path: str, Path of the long audio
+        long_voice_time: float, Duration of the long audio in seconds
+        segment_prefix: str, Prefix path for the split files
+        instrumentation: Instrumentation, Receives the spans and counters of every stage
+        window_plan: dict, Sliding window chosen by the window policy (see window_policy.py)
+        checkpoint: ScanCheckpoint, Progress of this search, the split files and searched windows it holds are reused
+        deadline: float, time.monotonic() value at which the search stops (see locator.search_long_audio)
+    """
+    geometry = (window_plan["segment_length"], window_plan["overlap"])
+    split_duration, local_workers, resources = args.split_duration, args.local_workers, None
+    if args.memory_budget:
+        # A resumed search keeps its plan: the memory free now differs from the first run, a new plan would change
+        # the split files and the windows and throw the recorded progress away
+        resources = checkpoint.get("resources") if checkpoint is not None else None
+        if resources is None:
+            # Parallel workers use the distributed scan, which is only chosen when nothing else asks for a mode
+            # (it records no checkpoint either)
+            parallel = not (args.listen or args.local_workers or args.skip_low_information or args.stoplist
+                            or args.stream_stoplist is not None or args.scan_order != "time" or deadline is not None
+                            or checkpoint is not None)
+            governor = ResourceGovernor(None if args.memory_budget == "auto" else float(args.memory_budget),
+                                        cpu_count=None if parallel else 1, sr=args.sr, n_fft=args.n_fft, hop_length=args.hop_length,
+                                        source_sr=librosa.get_samplerate(long_voice_path), windows_per_job=args.windows_per_job)
+            resources = governor.plan(short_voice_time, long_voice_time, geometry=geometry)
+            if checkpoint is not None:
+                checkpoint.set("resources", dict(resources))
+        split_duration = resources["split_duration"]
+        geometry = (resources["segment_length"], resources["overlap"])
+        # A plan of an older run may hold several workers, a checkpointed search stays sequential
+        if resources["workers"] > 1 and checkpoint is None:
+            local_workers = resources["workers"]
+
+    # 3) Split the long audio into files of split_duration seconds
+    segment_paths = checkpoint.segments(split_duration) if checkpoint is not None else None
+    if segment_paths is None:
+        with instrumentation.span("split"):
+            segment_paths = split_long_audio(LargeAudioSplitter, long_voice_path, long_voice_time, split_duration, segment_prefix)
+        if checkpoint is not None:
+            checkpoint.record_segments(segment_paths, split_duration)
+
+    # 4) Sliding window search
+    if args.listen or local_workers:
+        coordinator = ScanCoordinator(*parse_address(args.listen or "127.0.0.1:0"), worker_timeout=args.worker_timeout)
+        try:
+            start_local_workers(local_workers, coordinator.address)
+            with instrumentation.span("distributed_scan"):
+                result = coordinator.scan(analyzer, short_audio_array, short_voice_time, segment_paths, long_voice_time,
+                                          split_duration, args.confident_count, args.windows_per_job, geometry=geometry)
+        finally:
+            coordinator.close()
+    else:
+        low_information = LowInformationDetector() if args.skip_low_information else None
+        scan_order = None
+        if SCAN_ORDERS[args.scan_order] is not None:
+            scan_order = SCAN_ORDERS[args.scan_order](confident_count=args.confident_count)
+        result = search_long_audio(short_audio_array, short_voice_time, segment_paths, split_duration, args.sr, analyzer,
+                                   instrumentation=instrumentation, low_information=low_information, geometry=geometry,
+                                   scan_order=scan_order, checkpoint=checkpoint, deadline=deadline)
+    result["original_seconds"] = long_voice_time
+    if resources is not None:
+        # Peak RSS is the maximum over the whole process, in a batch it includes the originals searched before
+        resources["actual_peak_mb"] = peak_rss_mb()
+        result["resources"] = resources
+    return result
+
+
+def locate_clips(args, inputs, instrumentation, analyzer=None):
+    """
+    Locate every clip of a compilation: fingerprint the originals once into an index, then match the whole
+    compilation against it (see compilation.py). Returns the result of locate_compilation plus "found".
+    Compilations are not stored in the result cache.
+    args:
+        args: argparse.Namespace, Parsed command line arguments
+        inputs: dict, Result of resolve_inputs (clip_type "array" passes the decoded compilation at args.sr as clip)
+        instrumentation: Instrumentation, Receives the spans and counters of every stage
+        analyzer: FingerprintIdentifier, Fingerprint recognizer of the search, build_analyzer(args) if None
+    """
+    audio_path = os.path.join(args.work_dir, "audio")
+
+    # 1) Compilation: download the whole video (or the given range) and decode it
+    if inputs["clip_type"] == "array":
+        compilation_array = inputs["clip"]
+    elif inputs["clip_type"] == "file":
+        with instrumentation.span("decode_clip"):
+            compilation_array, _ = load_clip(inputs["clip"], args.sr, inputs["start_time"], inputs["end_time"])
+    else:
+        with instrumentation.span("download_clip"):
+            if inputs["end_time"] is None:
+                compilation_path = download_sound_file(inputs["clip"], audio_path, 1, inputs["clip_type"])
+            else:
+                compilation_path = download_sound_file(inputs["clip"], audio_path, 2, inputs["clip_type"],
+                                                       inputs["start_time"], inputs["end_time"])
+        with instrumentation.span("decode_clip"):
+            start_time = inputs["start_time"] if inputs["end_time"] is None else None
+            compilation_array, _ = load_clip(compilation_path, args.sr, start_time)
+    if analyzer is None:
+        analyzer = build_analyzer(args, instrumentation)
+
+    # 2) Originals: every one is split and fingerprinted one split file at a time
+    if inputs["original_type"] == "directory":
+        sources = [(path, path) for path in list_media_files(inputs["original"])]
+    else:
+        sources = [(inputs["original"], inputs["original"])]
+    original_seconds = 0.0
+
+    def originals():
+        nonlocal original_seconds
+        for index, (video_id, source) in enumerate(sources):
+            if inputs["original_type"] in ("file", "directory"):
+                long_voice_path, long_voice_time = source, librosa.get_duration(path=source)
+            else:
+                with instrumentation.span("download"):
+                    long_voice_time = Download(source, audio_path).get_time_info()
+                    long_voice_path = download_sound_file(source, audio_path, 1, inputs["original_type"])
+            original_seconds += long_voice_time
+            segment_dir = os.path.join(args.work_dir, "segment", f"original_{index:03d}")
+            with instrumentation.span("split"):
+                segment_paths = split_long_audio(LargeAudioSplitter, long_voice_path, long_voice_time, args.split_duration,
+                                                 os.path.join(segment_dir, "segments"))
+            yield video_id, (librosa.load(path, sr=args.sr)[0] for path in segment_paths)
+            # The split files of an indexed original are not needed any more
+            if not args.keep_files:
+                shutil.rmtree(segment_dir, ignore_errors=True)
+
+    with instrumentation.span("index_originals"):
+        index = index_originals(analyzer, originals())
+    with instrumentation.span("match_compilation"):
+        result = locate_compilation(index, [compilation_array], min_run_seconds=args.min_run_seconds)
+    instrumentation.count("compilation_clips", len(result["clips"]))
+    result["found"] = bool(result["clips"])
+    result["clip_seconds"] = result["compilation_seconds"]
+    result["original_seconds"] = original_seconds
+    return result
+
+
+def locate(args, inputs, instrumentation, analyzer=None, plan_window=None, cache=None):
+    """
+    Run the whole pipeline for the validated inputs and return the search result dictionary.
+    When the original is a directory, every media file in it is searched; the result then describes the first
+    file that matched (or the best scoring one) and "originals" lists the result of every file.
+    Originals whose match is in the result cache are not downloaded nor searched, their result has "cached": true.
+    With args.checkpoint the progress of every original is recorded in the working directory, and a new run of the
+    same query resumes from it; the checkpoints are deleted once every original has been searched.
+    With args.time_budget the search stops when the budget runs out ("complete" is then false, see
+    locator.search_long_audio); such results are neither cached nor recorded as finished in a checkpoint.
+    args:
+        args: argparse.Namespace, Parsed command line arguments
+        inputs: dict, Result of resolve_inputs (clip_type "array" passes the decoded clip at args.sr as clip)
+        instrumentation: Instrumentation, Receives the spans and counters of every stage
+        analyzer: FingerprintIdentifier, Fingerprint recognizer of the search, build_analyzer(args) if None
+        plan_window: callable(short_audio_array, short_voice_time, analyzer) returning the window plan,
+            the --window-policy if None (highlightlocator.Locator passes its memoized plans)
+        cache: ResultCache, Result cache to use, the one described by the arguments if None
+    """
+    if args.compilation:
+        return locate_clips(args, inputs, instrumentation, analyzer)
+    deadline = None if args.time_budget is None else time.monotonic() + args.time_budget
+    audio_path = os.path.join(args.work_dir, "audio")
+    segment_prefix = os.path.join(args.work_dir, "segment", "segments")
+
+    # 1) Short audio: download the section, or trim the local file while loading it
+    if inputs["clip_type"] == "array":
+        short_audio_array = inputs["clip"]
+        short_voice_time = len(short_audio_array) / args.sr
+    elif inputs["clip_type"] == "file":
+        with instrumentation.span("decode_clip"):
+            short_audio_array, short_voice_time = load_clip(inputs["clip"], args.sr, inputs["start_time"], inputs["end_time"])
+    else:
+        with instrumentation.span("download_clip"):
+            short_voice_path = download_sound_file(inputs["clip"], audio_path, 2, inputs["clip_type"], inputs["start_time"], inputs["end_time"])
+        with instrumentation.span("decode_clip"):
+            short_audio_array, short_voice_time = load_clip(short_voice_path, args.sr)
+    if analyzer is None:
+        analyzer = build_analyzer(args, instrumentation)
+    if plan_window is None:
+        plan_window = WINDOW_POLICIES[args.window_policy]().plan
+    if args.no_result_cache:
+        cache = None
+    elif cache is None and (args.result_cache or default_cache_path()):
+        cache = ResultCache(args.result_cache, ttl_seconds=args.result_cache_ttl * 24 * 3600)
+    params = search_params(analyzer, **search_options(args))
+    window_plan = None
+    checkpoints = []
+
+    def search(long_voice_path, long_voice_time, segment_prefix, checkpoint):
+        # The window plan times the analyzer, it is only measured when an original has to be searched
+        nonlocal window_plan
+        if window_plan is None and checkpoint is not None:
+            # A resumed search keeps its window plan, a new measurement could move the windows
+            window_plan = checkpoint.get("window_plan")
+        if window_plan is None:
+            with instrumentation.span("window_plan"):
+                window_plan = plan_window(short_audio_array, short_voice_time, analyzer)
+        if checkpoint is not None:
+            checkpoint.set("window_plan", window_plan)
+        result = search_original(args, analyzer, short_audio_array, short_voice_time, long_voice_path, long_voice_time,
+                                 segment_prefix, instrumentation, window_plan, checkpoint, deadline)
+        if checkpoint is not None and result["complete"]:
+            # Kept until every original is searched, a resumed batch does not search this one again
+            checkpoint.set("result", result)
+        return result
+
+    def open_checkpoint(key, name):
+        # Returns (checkpoint, result of the original if it was searched to the end before)
+        if not args.checkpoint:
+            return None, None
+        checkpoint = ScanCheckpoint(os.path.join(args.work_dir, name), key)
+        checkpoints.append(checkpoint)
+        instrumentation.count("checkpoints_resumed", int(checkpoint.resumed))
+        result = checkpoint.get("result")
+        return checkpoint, None if result is None else dict(result, cached=False)
+
+    def cached(identity):
+        key = cache_key(short_audio_array, identity, params)
+        if cache is None:
+            return key, None
+        with instrumentation.span("result_cache"):
+            result = cache.get(key)
+        instrumentation.count("result_cache_hits" if result is not None else "result_cache_misses")
+        if result is not None:
+            result["cached"] = True
+        return key, result
+
+    def store(key, result):
+        result.setdefault("cached", False)
+        # A search stopped by the time budget is only a best guess
+        if cache is not None and result.get("complete", True):
+            cache.put(key, result)
+
+    # 2) Long audio: download it unless it is already a local file (or a directory of them)
+    if inputs["original_type"] == "directory":
+        results = []
+        for index, long_voice_path in enumerate(list_media_files(inputs["original"])):
+            key, result = cached(original_identity(long_voice_path, "file"))
+            if result is None:
+                checkpoint, result = open_checkpoint(key, f"checkpoint_{index:03d}.json")
+            if result is None:
+                segment_dir = os.path.join(args.work_dir, "segment", f"original_{index:03d}")
+                result = search(long_voice_path, librosa.get_duration(path=long_voice_path), os.path.join(segment_dir, "segments"),
+                                checkpoint)
+                store(key, result)
+                # The split files of a searched original are not needed any more
+                if not args.keep_files:
+                    shutil.rmtree(segment_dir, ignore_errors=True)
+            result["original"] = long_voice_path
+            results.append(result)
+        result = dict(next((result for result in results if result["found"]), max(results, key=lambda result: result["score"])))
+        result["complete"] = all(result.get("complete", True) for result in results)
+        seconds = sum(result["original_seconds"] for result in results)
+        if seconds:
+            result["coverage"] = sum(result.get("coverage", 1.0) * result["original_seconds"] for result in results) / seconds
+        result["originals"] = results
+    else:
+        key, result = cached(original_identity(inputs["original"], inputs["original_type"]))
+        if result is None:
+            checkpoint, result = open_checkpoint(key, "checkpoint.json")
+        if result is None:
+            if inputs["original_type"] == "file":
+                long_voice_path = inputs["original"]
+                long_voice_time = librosa.get_duration(path=long_voice_path)
+            elif checkpoint is not None and checkpoint.original() is not None:
+                # Downloaded completely before the interruption
+                long_voice_path, long_voice_time = checkpoint.original()
+            else:
+                with instrumentation.span("download"):
+                    long_voice_time = Download(inputs["original"], audio_path).get_time_info()
+                    long_voice_path = download_sound_file(inputs["original"], audio_path, 1, inputs["original_type"])
+                if checkpoint is not None:
+                    checkpoint.record_original(long_voice_path, long_voice_time)
+            result = search(long_voice_path, long_voice_time, segment_prefix, checkpoint)
+            store(key, result)
+    # Every original was searched, nothing is left to resume (unless the time budget stopped the search)
+    if result.get("complete", True):
+        for checkpoint in checkpoints:
+            checkpoint.clear()
+    result["clip_seconds"] = short_voice_time
+    result["window_plan"] = window_plan
+    if cache is not None:
+        result["result_cache"] = cache.stats()
+    if "youtube" in (inputs["clip_type"], inputs["original_type"]) or "twitch" in (inputs["clip_type"], inputs["original_type"]):
+        # Video information extracted once and reused by every download (info_cache.py), counted over the process
+        result["info_cache"] = shared_info_cache().stats()
+    return result
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    filter_warning()
+
+    output = {
+        "status": "error",
+        "exit_code": EXIT_ERROR,
+        "clip": args.clip,
+        "original": args.original,
+        "start": args.start,
+        "end": args.end,
+        "timestamp": None,
+        "offset_seconds": None,
+        "score": None,
+        "timings": {},
+        "counters": {},
+        "peak_rss_mb": None,
+        "real_time_factor": None,
+        "error": None,
+    }
+    instrumentation = Instrumentation()
+    try:
+        inputs = resolve_inputs(args)
+    except ValueError as e:
+        inputs = None
+        output["status"] = "invalid_argument"
+        output["exit_code"] = EXIT_USAGE
+        output["error"] = str(e)
+
+    if inputs is not None:
+        created_work_dir = args.work_dir is None
+        if created_work_dir:
+            args.work_dir = tempfile.mkdtemp(prefix="highlightlocator_")
+        try:
+            # Keep stdout for the JSON result only
+            with contextlib.redirect_stdout(sys.stderr):
+                result = locate(args, inputs, instrumentation)
+            output.update(result)
+            if result["found"]:
+                output["status"], output["exit_code"] = "found", EXIT_FOUND
+            elif not result.get("complete", True):
+                output["status"], output["exit_code"] = "incomplete", EXIT_INCOMPLETE
+            else:
+                output["status"], output["exit_code"] = "not_found", EXIT_NOT_FOUND
+        except Exception as e:
+            output["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            if created_work_dir and not args.keep_files:
+                shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    summary = instrumentation.report()
+    output["timings"] = {name: stats["total"] for name, stats in summary["spans"].items()}
+    output["timings"]["total"] = summary["wall_seconds"]
+    output["counters"] = summary["counters"]
+    output["peak_rss_mb"] = summary["peak_rss_mb"]
+    output["real_time_factor"] = summary["real_time_factor"]
+    if args.report:
+        instrumentation.write_report(args.report)
+    if args.trace:
+        instrumentation.write_chrome_trace(args.trace)
+
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return output["exit_code"]
+
+
+# Entry point
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Compilation mode: locate every clip of a highlight compilation in one pass.
+
+A compilation strings together 10 to 30 clips of one stream. Instead of cutting each clip by hand and scanning the
+original once per clip, the original is fingerprinted once into an ArchiveIndex (archive_index.py) and the whole
+compilation is fingerprinted once on one continuous frame axis. Every compilation hash is looked up in the index,
+which gives for each hit the compilation frame and the offset (original frame minus compilation frame).
+Within one clip the offset is constant, so the compilation is cut into blocks of block_seconds, the offset with the
+most votes is taken in every block, and consecutive blocks that agree on the video and the offset form a run:
+one clip, mapped from its compilation time range to its original time.
+
+The cost is one fingerprinting pass over the original plus one over the compilation, whatever the number of clips.
+Nothing in here prints, the callers report the runs in their own language.
+"""
+
+import numpy as np
+
+from archive_index import ArchiveIndex, StreamFingerprinter
+from time_calculate import time_format
+
+
+def index_originals(analyzer, originals, block_seconds=180):
+    """
+    Fingerprint the originals into a new ArchiveIndex with one shard (one lookup per hash is all a compilation needs).
+    args:
+        analyzer: FingerprintIdentifier, Fingerprint parameters
+        originals: Iterable[Tuple[str, Iterable[ndarray]]], (video_id, consecutive audio chunks at analyzer.sr) of every original
+        block_seconds: float, Length of the blocks the audio is fingerprinted in
+    """
+    index = ArchiveIndex(analyzer, shard_count=1, block_seconds=block_seconds)
+    for video_id, chunks in originals:
+        index.add_video(video_id, chunks)
+    index.finalize()
+    return index
+
+
+def fingerprint_stream(analyzer, chunks, block_seconds=180):
+    """
+    Return the (hashes, times) of audio given as consecutive chunks, on one continuous frame axis.
+    """
+    fingerprinter = StreamFingerprinter(analyzer, block_seconds)
+    parts = [fingerprinter.feed(chunk) for chunk in chunks]
+    parts.append(fingerprinter.flush())
+    return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]), fingerprinter.samples
+
+
+def locate_compilation(index, compilation_chunks, block_seconds=1.0, min_block_votes=3, offset_tolerance=2,
+                       max_gap_seconds=3.0, min_run_seconds=2.0, min_score=None):
+    """
+    Find the clips of a compilation in the originals of an index.
+    Returns a dictionary with:
+        clips: list of {compilation_start, compilation_end, original_start, original_end (seconds), video_id,
+            compilation_timestamp, original_timestamp, score}, in compilation order
+        compilation_seconds: float, Duration of the compilation
+        matched_seconds: float, Seconds of the compilation mapped to an original
+    args:
+        index: ArchiveIndex, Fingerprints of the originals (index_originals, or an archive of a channel)
+        compilation_chunks: Iterable[ndarray], Consecutive parts of the compilation audio at index.analyzer.sr
+        block_seconds: float, Resolution of the run detection on the compilation time axis
+        min_block_votes: int, Votes the best offset of a block needs to belong to a run
+        offset_tolerance: int, Frames two blocks of one run may disagree by (the STFT frames of the compilation
+            and of the original are not aligned)
+        max_gap_seconds: float, Seconds without enough votes (a quiet moment, a caption sound) a run may bridge
+        min_run_seconds: float, Shortest clip reported
+        min_score: int, Votes a run needs in total, analyzer.min_count if None
+    """
+    analyzer = index.analyzer
+    frame_seconds = analyzer.hop_length / analyzer.sr
+    min_score = analyzer.min_count if min_score is None else min_score
+    hashes, times, samples = fingerprint_stream(analyzer, compilation_chunks, index.block_seconds)
+
+    # Every posting sharing a hashkey with the compilation: (video, original frame, compilation frame)
+    shard_of = hashes % index.shard_count
+    hits = [index.shards[number].lookup_times(hashes[shard_of == number], times[shard_of == number])
+            for number in range(index.shard_count)]
+    video_ids = np.concatenate([hit[0] for hit in hits]).astype(np.int64)
+    query_times = np.concatenate([hit[2] for hit in hits]).astype(np.int64)
+    offsets = np.concatenate([hit[1] for hit in hits]).astype(np.int64) - query_times
+    block_frames = max(1, int(round(block_seconds / frame_seconds)))
+    blocks = query_times // block_frames
+
+    # Votes of every (block, video, offset), then the best one of every block
+    best = {}
+    if len(blocks):
+        order = np.lexsort((offsets, video_ids, blocks))
+        keys = np.stack([blocks[order], video_ids[order], offsets[order]])
+        starts = np.flatnonzero(np.r_[True, np.any(keys[:, 1:] != keys[:, :-1], axis=0)])
+        counts = np.diff(np.r_[starts, len(order)])
+        group_blocks = keys[0, starts]
+        # The votes of a clip spread over neighbouring offsets, count every offset within offset_tolerance
+        # (same block and video) as one: number the (block, video) pairs and search on (pair, offset)
+        pairs = np.cumsum(np.r_[True, np.any(keys[:2, starts[1:]] != keys[:2, starts[:-1]], axis=0)])
+        position = pairs * (1 << 34) + keys[2, starts] + (1 << 33)
+        cumulative = np.r_[0, np.cumsum(counts)]
+        counts = cumulative[np.searchsorted(position, position + offset_tolerance, side="right")] - \
+            cumulative[np.searchsorted(position, position - offset_tolerance, side="left")]
+        # Within a block, the group with the most votes (the first one on ties)
+        block_order = np.lexsort((-counts, group_blocks))
+        first_of_block = np.r_[True, group_blocks[block_order][1:] != group_blocks[block_order][:-1]]
+        for group in block_order[first_of_block]:
+            if counts[group] >= min_block_votes:
+                best[int(group_blocks[group])] = (int(keys[1, starts[group]]), int(keys[2, starts[group]]), int(counts[group]))
+
+    # Consecutive blocks agreeing on the video and the offset form a run
+    runs = []
+    for block in sorted(best):
+        video, offset, count = best[block]
+        run = runs[-1] if runs else None
+        if run is not None and run["video"] == video and abs(offset - run["offset"]) <= offset_tolerance \
+                and (block - run["last"] - 1) * block_seconds <= max_gap_seconds:
+            run["last"] = block
+            run["score"] += count
+            if count > run["best_count"]:
+                run["offset"], run["best_count"] = offset, count
+        else:
+            runs.append({"video": video, "offset": offset, "first": block, "last": block, "score": count, "best_count": count})
+
+    clips = []
+    gap_blocks = int(max_gap_seconds / block_seconds) + 1
+    for number, run in enumerate(runs):
+        if run["score"] < min_score:
+            continue
+        # The exact range is given by the hits of the run's offset, up to max_gap_seconds around the run
+        # (the blocks there had too few votes) without reaching into the neighbouring runs
+        first = max(run["first"] - gap_blocks, runs[number - 1]["last"] + 1 if number else run["first"] - gap_blocks)
+        last = min(run["last"] + gap_blocks, runs[number + 1]["first"] - 1 if number + 1 < len(runs) else run["last"] + gap_blocks)
+        selected = (video_ids == run["video"]) & (np.abs(offsets - run["offset"]) <= offset_tolerance) & \
+                   (blocks >= first) & (blocks <= last)
+        first_frame, last_frame = int(query_times[selected].min()), int(query_times[selected].max())
+        compilation_start = first_frame * frame_seconds
+        compilation_end = (last_frame + analyzer.fan_value_frames) * frame_seconds + analyzer.n_fft / analyzer.sr
+        if compilation_end - compilation_start < min_run_seconds:
+            continue
+        original_start = max(0.0, compilation_start + run["offset"] * frame_seconds)
+        clips.append({
+            "compilation_start": compilation_start,
+            "compilation_end": compilation_end,
+            "original_start": original_start,
+            "original_end": original_start + compilation_end - compilation_start,
+            "video_id": index.videos[run["video"]]["video_id"],
+            "compilation_timestamp": time_format.sec_to_time(int(compilation_start)),
+            "original_timestamp": time_format.sec_to_time(int(original_start)),
+            "score": run["score"],
+        })
+    return {
+        "clips": clips,
+        "compilation_seconds": samples / analyzer.sr,
+        "matched_seconds": sum(clip["compilation_end"] - clip["compilation_start"] for clip in clips),
+    }
@@ -0,0 +1,219 @@
+"""
+Compressed on-disk format of a posting run (archive_index.PostingRun), read block by block.
+
+Stored as numpy arrays, a posting costs 12 bytes (int32 video, int32 frame, plus the int64 hashkey and offset
+of its key spread over the postings), so an archive of hundreds of streams takes hundreds of GB. This format
+stores every number as a varint (7 bits per byte, the high bit marks that another byte follows) of a small delta:
+    - the keys of a block as the difference to the previous key (the first key is in the block directory),
+    - the number of postings of every key,
+    - the postings of a key sorted by (video, frame): the video as the difference to the previous posting,
+      the frame as the difference to the previous posting of the same video (absolute for a new video).
+
+File layout (little endian):
+    header:     magic "HLXI", version, key count, posting count, block count, keys per block, directory CRC-32
+    directory:  per block: first key, byte offset and length of its data, key count, posting count, CRC-32 of its data
+    blocks:     key deltas, posting counts, video deltas, frame deltas, all varints
+A lookup binary searches the directory, then reads, checks and decodes only the blocks holding its hashkeys;
+the file is memory mapped, so the rest of it is never read. A block whose CRC-32 does not match raises ValueError.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from fingerprint import expand_ranges
+
+MAGIC = b"HLXI"
+VERSION = 1
+_HEADER = struct.Struct("<4sIQQIII")
+_DIRECTORY = np.dtype([("first_key", "<i8"), ("offset", "<u8"), ("length", "<u4"), ("keys", "<u4"),
+                       ("postings", "<u4"), ("crc", "<u4")])
+
+
+def encode_varints(values):
+    """
+    Encode non-negative integers as varints, return the bytes.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while np.any(rest):
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    owner = np.repeat(np.arange(len(values)), lengths)
+    position = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    encoded = ((values[owner] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7F)).astype(np.uint8)
+    encoded[position < lengths[owner] - 1] |= 0x80
+    return encoded.tobytes()
+
+
+def decode_varints(data):
+    """
+    Decode a buffer of varints, return them as an int64 array.
+    """
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.r_[0, ends[:-1] + 1]
+    position = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    parts = (encoded & 0x7F).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+def _restart_cumsum(values, starts):
+    # Cumulative sum that starts again at every position of starts (sorted, starting with 0)
+    total = np.cumsum(values)
+    if len(values) == 0:
+        return total
+    return total - np.repeat(np.r_[0, total][starts], np.diff(np.r_[starts, len(values)]))
+
+
+def _posting_deltas(keys_of_postings, video_ids, frames):
+    # Postings must be sorted by (key, video, frame)
+    new_key = np.r_[True, keys_of_postings[1:] != keys_of_postings[:-1]][:len(keys_of_postings)]
+    video_deltas = np.diff(np.r_[0, video_ids])
+    video_deltas[new_key] = video_ids[new_key]
+    new_video = new_key | (video_deltas != 0)
+    frame_deltas = np.diff(np.r_[0, frames])
+    frame_deltas[new_video] = frames[new_video]
+    return video_deltas, frame_deltas
+
+
+def write_compressed_run(path, run, block_keys=128):
+    """
+    Write a posting run (anything with keys, offsets, video_ids and frames arrays) to a compressed file.
+    The file is written next to the target and moved over it, so a reader never sees half a file.
+    args:
+        path: str, File to write
+        run: PostingRun, Postings grouped by sorted hashkey
+        block_keys: int, Hashkeys per block, the unit of reading and decoding
+    """
+    keys = np.asarray(run.keys, dtype=np.int64)
+    offsets = np.asarray(run.offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    # Sort the postings of every key by (video, frame), the order within a key does not matter to a lookup
+    owner = np.repeat(np.arange(len(keys)), counts)
+    order = np.lexsort((run.frames, run.video_ids, owner))
+    video_ids = np.asarray(run.video_ids, dtype=np.int64)[order]
+    frames = np.asarray(run.frames, dtype=np.int64)[order]
+    video_deltas, frame_deltas = _posting_deltas(owner, video_ids, frames)
+
+    block_count = (len(keys) + block_keys - 1) // block_keys
+    directory = np.zeros(block_count, dtype=_DIRECTORY)
+    blocks = []
+    position = _HEADER.size + directory.nbytes
+    for block in range(block_count):
+        first, last = block * block_keys, min((block + 1) * block_keys, len(keys))
+        begin, end = offsets[first], offsets[last]
+        data = encode_varints(np.concatenate([np.diff(keys[first:last], prepend=keys[first]), counts[first:last],
+                                              video_deltas[begin:end], frame_deltas[begin:end]]))
+        directory[block] = (keys[first], position, len(data), last - first, end - begin, zlib.crc32(data))
+        blocks.append(data)
+        position += len(data)
+
+    directory_bytes = directory.tobytes()
+    header = _HEADER.pack(MAGIC, VERSION, len(keys), len(video_ids), block_count, block_keys, zlib.crc32(directory_bytes))
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(header)
+        f.write(directory_bytes)
+        for data in blocks:
+            f.write(data)
+    os.replace(temporary_path, path)
+
+
+class CompressedRun:
+    """
+    Read-only posting run backed by a compressed file, with the lookup methods of archive_index.PostingRun.
+    Only the header and the block directory are read when it is opened.
+
+    args:
+        path: str, File written by write_compressed_run
+
+    methods:
+        lookup(hashes, times) / lookup_times(hashes, times): As PostingRun, decoding only the blocks needed.
+        decode_blocks(blocks): Check and decode some blocks.
+        to_arrays(): Decode the whole run (to merge it with new postings).
+        nbytes(): Size of the file.
+        close(): Release the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < _HEADER.size:
+            raise ValueError(f"Not a compressed index file : {path}")
+        magic, version, self.key_count, self.posting_count, block_count, self.block_keys, directory_crc = \
+            _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a compressed index file (or an unsupported version) : {path}")
+        directory_bytes = self.data[_HEADER.size:_HEADER.size + block_count * _DIRECTORY.itemsize]
+        if zlib.crc32(directory_bytes) != directory_crc:
+            raise ValueError(f"Corrupted block directory : {path}")
+        self.directory = np.frombuffer(directory_bytes, dtype=_DIRECTORY)
+        self.first_keys = self.directory["first_key"]
+
+    def close(self):
+        self.data.close()
+
+    def nbytes(self):
+        return len(self.data)
+
+    def decode_blocks(self, blocks):
+        """
+        Check and decode the given blocks (sorted block numbers) at once, return (keys, offsets, video_ids, frames)
+        of their postings, like the arrays of a PostingRun.
+        """
+        entries = self.directory[blocks]
+        chunks = []
+        for block, entry in zip(blocks, entries):
+            start = int(entry["offset"])
+            data = self.data[start:start + int(entry["length"])]
+            if zlib.crc32(data) != int(entry["crc"]):
+                raise ValueError(f"Corrupted block {block} : {self.path}")
+            chunks.append(data)
+        values = decode_varints(b"".join(chunks))
+        key_counts = entries["keys"].astype(np.int64)
+        posting_counts = entries["postings"].astype(np.int64)
+        # Values of a block: key deltas, posting counts, video deltas, frame deltas
+        starts = np.r_[0, np.cumsum(2 * key_counts + 2 * posting_counts)[:-1]]
+        key_deltas = values[expand_ranges(starts, key_counts)]
+        counts = values[expand_ranges(starts + key_counts, key_counts)]
+        video_deltas = values[expand_ranges(starts + 2 * key_counts, posting_counts)]
+        frame_deltas = values[expand_ranges(starts + 2 * key_counts + posting_counts, posting_counts)]
+        # The first key delta of every block is 0, the block starts from its first key in the directory
+        first_keys = np.repeat(entries["first_key"], key_counts)
+        keys = first_keys + _restart_cumsum(key_deltas, np.r_[0, np.cumsum(key_counts)[:-1]][key_counts > 0])
+        offsets = np.r_[0, np.cumsum(counts)]
+        # Every key has at least one posting, so the first postings of the keys are distinct
+        new_key = np.zeros(len(video_deltas), dtype=bool)
+        new_key[offsets[:-1]] = True
+        video_ids = _restart_cumsum(video_deltas, np.flatnonzero(new_key))
+        frames = _restart_cumsum(frame_deltas, np.flatnonzero(new_key | (video_deltas != 0)))
+        return keys, offsets, video_ids.astype(np.int32), frames.astype(np.int32)
+
+    def lookup(self, hashes, times):
+        video_ids, frames, query_times = self.lookup_times(hashes, times)
+        return video_ids, frames - query_times
+
+    def lookup_times(self, hashes, times):
+        blocks = np.searchsorted(self.first_keys, hashes, side="right") - 1
+        keys, offsets, video_ids, frames = self.decode_blocks(np.unique(blocks[blocks >= 0]))
+        index = np.searchsorted(keys, hashes)
+        found = index < len(keys)
+        found[found] = keys[index[found]] == hashes[found]
+        index, times = index[found], times[found]
+        starts = offsets[index]
+        counts = offsets[index + 1] - starts
+        postings = expand_ranges(starts, counts)
+        return video_ids[postings], frames[postings], np.repeat(times, counts)
+
+    def to_arrays(self):
+        keys, offsets, video_ids, frames = self.decode_blocks(np.arange(len(self.directory)))
+        return {"keys": keys, "offsets": offsets, "video_ids": video_ids, "frames": frames}
@@ -0,0 +1,486 @@
+"""
+Distributed scan of a long audio: a coordinator hands out sliding window jobs to workers on other machines.
+
+The long audio is split into hour files as usual (LargeAudioSplitter). The coordinator cuts the sliding windows of
+every split file into jobs of a few windows each and sends them, together with the fingerprint of the clip,
+to the workers that connect to it. Workers must be able to open the split files under the same path
+(shared directory, or the same files copied to every node).
+
+Protocol: one JSON object per line over TCP.
+    worker -> coordinator   {"type": "hello", "name": ...}
+    coordinator -> worker   {"type": "query", "scan_id": ..., "analyzer": {...}, "hashes": [...], "times": [...]}
+    coordinator -> worker   {"type": "job", "scan_id": ..., "job_id": ..., "segment_index": ..., "path": ..., "windows": [[seg_start, seg_end], ...]}
+    worker -> coordinator   {"type": "progress", "job_id": ..., "seg_start": ..., "seg_end": ..., "is_match": ..., "best_count": ...}
+    worker -> coordinator   {"type": "result", "job_id": ..., "windows": ..., "best_count": ..., "match": {...} or null, "cancelled": ...}
+    coordinator -> worker   {"type": "cancel", "scan_id": ...}   Stop the current job after the window being searched
+    coordinator -> worker   {"type": "stop"}     Disconnect
+
+Every progress message also serves as a heartbeat: a worker that disconnects, or sends nothing for worker_timeout
+seconds, is dropped and its job is queued again for the other workers.
+
+    python distributed.py worker --connect HOST:PORT     Start a worker (the coordinator is cli.py --listen)
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+import librosa
+import numpy as np
+
+from fingerprint import FingerprintIdentifier
+from hash_filter import HashFilter
+from locator import window_geometry
+from search_time import search_subclip
+from sliding_audio_split import SlidingWindowProcessor
+from time_calculate import time_format
+
+
+def send_message(connection, lock, message):
+    data = (json.dumps(message) + "\n").encode("utf-8")
+    with lock:
+        connection.sendall(data)
+
+
+def receive_message(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    return json.loads(line)
+
+
+def parse_address(text):
+    """
+    Split HOST:PORT (or just PORT) into (host, port).
+    """
+    host, _, port = text.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def plan_jobs(segment_paths, long_voice_time, split_duration, short_voice_time, windows_per_job=8, geometry=None):
+    """
+    Cut the sliding windows of every split file into jobs, using the same window geometry as locator.search_long_audio.
+    Returns a list of {job_id, segment_index, path, windows}.
+    """
+    segment_length, overlap = geometry or window_geometry(short_voice_time)
+    jobs = []
+    for segment_index, segment_path in enumerate(segment_paths):
+        segment_time = min(split_duration, long_voice_time - segment_index * split_duration)
+        if len(segment_paths) == 1:
+            segment_time = long_voice_time
+        windows = []
+        current_start = 0
+        while current_start < segment_time:
+            seg_start = max(current_start - overlap, 0)
+            seg_end = min(current_start + segment_length + overlap, segment_time)
+            if seg_start >= seg_end:
+                break
+            windows.append([seg_start, seg_end])
+            current_start += segment_length
+        for first in range(0, len(windows), windows_per_job):
+            jobs.append({
+                "job_id": len(jobs),
+                "segment_index": segment_index,
+                "path": segment_path,
+                "windows": windows[first:first + windows_per_job],
+            })
+    return jobs
+
+
+class _Scan:
+    """
+    State of one distributed scan, guarded by the coordinator condition.
+    """
+
+    def __init__(self, scan_id, query, jobs, confident_count, split_duration, report):
+        self.scan_id = scan_id
+        self.query = query
+        self.jobs = jobs
+        self.pending = deque(jobs)
+        self.finished = set()
+        self.confident_count = confident_count
+        self.split_duration = split_duration
+        self.report = report
+        self.matches = []
+        self.cancelled = False
+        self.windows_searched = 0
+        self.score = 0
+        self.requeued = 0
+
+    def done(self):
+        return self.cancelled or len(self.finished) == len(self.jobs)
+
+
+class ScanCoordinator:
+    """
+    Accept worker connections and distribute the windows of a scan over them.
+
+    args:
+        host, port: Address to listen on (port 0 picks a free port, see .address)
+        worker_timeout: float, Seconds without any message after which a busy worker is considered dead
+
+    methods:
+        scan(...): Search the split files with the connected workers, return a result like locator.search_long_audio.
+        close(): Tell the workers to stop and close the listening socket.
+    """
+
+    def __init__(self, host="0.0.0.0", port=0, worker_timeout=120.0):
+        self.worker_timeout = worker_timeout
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        self.condition = threading.Condition()
+        self.workers = []
+        self.current = None
+        self.scan_count = 0
+        self.closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_worker, args=(connection, address), daemon=True).start()
+
+    def _serve_worker(self, connection, address):
+        worker = {"name": f"{address[0]}:{address[1]}", "connection": connection, "lock": threading.Lock(), "job": None}
+        connection.settimeout(self.worker_timeout)
+        reader = connection.makefile("rb")
+        scan = None
+        try:
+            hello = receive_message(reader)
+            worker["name"] = hello.get("name") or worker["name"]
+            with self.condition:
+                self.workers.append(worker)
+                self.condition.notify_all()
+            query_sent = None
+            while True:
+                with self.condition:
+                    while not self.closed and (self.current is None or not self.current.pending):
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    scan = self.current
+                    job = scan.pending.popleft()
+                    worker["job"] = job
+                if query_sent != scan.scan_id:
+                    send_message(connection, worker["lock"], scan.query)
+                    query_sent = scan.scan_id
+                send_message(connection, worker["lock"], {"type": "job", "scan_id": scan.scan_id, **job})
+                while True:
+                    message = receive_message(reader)
+                    if message["type"] == "progress":
+                        self._on_progress(scan, job, worker, message)
+                    elif message["type"] == "result":
+                        self._on_result(scan, job, message)
+                        break
+                with self.condition:
+                    worker["job"] = None
+        except (OSError, ValueError, KeyError):
+            # Disconnected, timed out or sent garbage: give its job to another worker
+            with self.condition:
+                job = worker["job"]
+                if job is not None and not scan.done() and job["job_id"] not in scan.finished:
+                    scan.pending.appendleft(job)
+                    scan.requeued += 1
+                    self.condition.notify_all()
+        finally:
+            with self.condition:
+                if worker in self.workers:
+                    self.workers.remove(worker)
+                self.condition.notify_all()
+            connection.close()
+
+    def _on_progress(self, scan, job, worker, message):
+        if scan.report and not scan.cancelled:
+            global_base = job["segment_index"] * scan.split_duration
+            scan.report("window_result", {
+                "segment_index": job["segment_index"],
+                "seg_start": message["seg_start"],
+                "seg_end": message["seg_end"],
+                "global_start": global_base + message["seg_start"],
+                "global_end": global_base + message["seg_end"],
+                "is_match": message["is_match"],
+                "best_count": message["best_count"],
+                "worker": worker["name"],
+            })
+
+    def _on_result(self, scan, job, message):
+        cancel = []
+        with self.condition:
+            if job["job_id"] in scan.finished:
+                return
+            if message.get("cancelled"):
+                if not scan.done():
+                    scan.pending.appendleft(job)
+                    self.condition.notify_all()
+                return
+            scan.finished.add(job["job_id"])
+            scan.windows_searched += message["windows"]
+            scan.score = max(scan.score, message["best_count"])
+            match = message["match"]
+            if match is not None:
+                match["segment_index"] = job["segment_index"]
+                scan.matches.append(match)
+                if match["best_count"] >= scan.confident_count and not scan.cancelled:
+                    # Confident hit: drop the queued jobs and stop the ones in progress
+                    scan.cancelled = True
+                    scan.pending.clear()
+                    cancel = [w for w in self.workers if w["job"] is not None and w["job"] is not job]
+            self.condition.notify_all()
+        for worker in cancel:
+            try:
+                send_message(worker["connection"], worker["lock"], {"type": "cancel", "scan_id": scan.scan_id})
+            except OSError:
+                pass
+
+    def scan(self, analyzer, short_audio_array, short_voice_time, segment_paths, long_voice_time, split_duration=3600,
+             confident_count=None, windows_per_job=8, report=None, geometry=None):
+        """
+        Search the split files of the long audio for the short audio with the connected workers.
+        Returns the same dictionary as locator.search_long_audio, with jobs, jobs_requeued and workers added.
+        The earliest match is returned, like the sequential search, also when a confident hit cancelled the other
+        jobs (the earliest of the matches found until then: a replay of the clip in a cancelled job is not seen).
+        Raise RuntimeError if no worker is connected for worker_timeout seconds.
+        args:
+            analyzer: FingerprintIdentifier, Its parameters are sent to the workers (a stoplist is not)
+            short_audio_array: ndarray, Short audio signal
+            short_voice_time: float, Duration of the short audio in seconds
+            segment_paths: List[str], Split files of the long audio in order, readable by the workers
+            long_voice_time: float, Duration of the long audio in seconds
+            split_duration: int, Duration of each split file in seconds
+            confident_count: int, A match with at least this score cancels the remaining jobs (default analyzer.min_count)
+            windows_per_job: int, Number of sliding windows in each job
+            report: callable(event, data), Receives a window_result event for every window searched
+            geometry: (segment_length, overlap) of the sliding window in seconds, window_geometry(short_voice_time) if None
+        """
+        hashes, times = analyzer.query_pairs(short_audio_array)
+        jobs = plan_jobs(segment_paths, long_voice_time, split_duration, short_voice_time, windows_per_job, geometry)
+        with self.condition:
+            if self.current is not None and not self.current.done():
+                raise RuntimeError("A scan is already running")
+            self.scan_count += 1
+            query = {"type": "query", "scan_id": self.scan_count, "analyzer": analyzer.get_params(),
+                     "hashes": hashes.tolist(), "times": times.tolist()}
+            scan = _Scan(self.scan_count, query, jobs, confident_count or analyzer.min_count, split_duration, report)
+            self.current = scan
+            self.condition.notify_all()
+            alone_since = None
+            while not scan.done():
+                if self.workers:
+                    alone_since = None
+                elif alone_since is None:
+                    alone_since = time.monotonic()
+                elif time.monotonic() - alone_since > self.worker_timeout:
+                    scan.cancelled = True
+                    raise RuntimeError("No worker connected")
+                self.condition.wait(0.5)
+            worker_count = len(self.workers)
+
+        result = {
+            "found": False,
+            "offset_seconds": None,
+            "timestamp": None,
+            "score": scan.score,
+            "segment_index": None,
+            "window": None,
+            "windows_searched": scan.windows_searched,
+            "skipped_seconds": 0.0,
+            "complete": True,
+            "coverage": scan.windows_searched / max(1, sum(len(job["windows"]) for job in jobs)),
+            "confident": False,
+            "best_guess": None,
+            "jobs": len(jobs),
+            "jobs_requeued": scan.requeued,
+            "workers": worker_count,
+        }
+        if scan.matches:
+            match = min(scan.matches, key=lambda m: (m["segment_index"], m["seg_start"]))
+            global_offset_sec = match["segment_index"] * split_duration + self.refine(
+                match, segment_paths[match["segment_index"]], analyzer.sr, short_audio_array)
+            result.update({
+                "found": True,
+                "offset_seconds": float(global_offset_sec),
+                "timestamp": time_format.sec_to_time(int(global_offset_sec)),
+                "score": match["best_count"],
+                "segment_index": match["segment_index"],
+                "window": [match["seg_start"], match["seg_end"]],
+                "confident": True,
+            })
+            result["best_guess"] = {name: result[name] for name in ("offset_seconds", "timestamp", "score")}
+        return result
+
+    @staticmethod
+    def refine(match, segment_path, sr, short_audio_array):
+        """
+        Return the exact position of the clip in the split file, found like locator._WindowSearch.refine: the split
+        file is decoded whole and the matching window is cut from it, so both searches correlate the same samples
+        (the vote offset of the worker is only precise to a frame).
+        """
+        audio, _ = librosa.load(segment_path, sr=sr)
+        window_audio_array = SlidingWindowProcessor.split_audio(audio, match["seg_start"], match["seg_end"], sr)
+        return match["seg_start"] + search_subclip.find_offset(window_audio_array, sr, short_audio_array, 10)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            workers = list(self.workers)
+            self.condition.notify_all()
+        for worker in workers:
+            try:
+                send_message(worker["connection"], worker["lock"], {"type": "stop"})
+            except OSError:
+                pass
+        self.server.close()
+
+
+class ScanWorker:
+    """
+    Connect to a coordinator and search the windows of the jobs it sends.
+
+    args:
+        host, port: Address of the coordinator
+        name: str, Name shown by the coordinator (default host name and process ID)
+
+    methods:
+        run(): Serve jobs until the coordinator sends stop or disconnects.
+    """
+
+    def __init__(self, host, port, name=None):
+        self.host = host
+        self.port = port
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.cancel = threading.Event()
+        self.scan_id = None
+
+    def run(self):
+        connection = socket.create_connection((self.host, self.port))
+        lock = threading.Lock()
+        reader = connection.makefile("rb")
+        messages = deque()
+        arrived = threading.Condition()
+
+        def read_messages():
+            # Read in the background so a cancel is seen while a window is being searched
+            try:
+                while True:
+                    message = receive_message(reader)
+                    with arrived:
+                        if message["type"] == "cancel":
+                            # A late cancel of a previous scan must not stop the job of the next one
+                            if message["scan_id"] == self.scan_id:
+                                self.cancel.set()
+                        else:
+                            messages.append(message)
+                        arrived.notify()
+            except (OSError, ValueError):
+                with arrived:
+                    messages.append({"type": "stop"})
+                    arrived.notify()
+
+        threading.Thread(target=read_messages, daemon=True).start()
+        send_message(connection, lock, {"type": "hello", "name": self.name})
+        analyzer = None
+        pairs = None
+        try:
+            while True:
+                with arrived:
+                    while not messages:
+                        arrived.wait()
+                    message = messages.popleft()
+                if message["type"] == "stop":
+                    return
+                if message["type"] == "query":
+                    analyzer = FingerprintIdentifier(**message["analyzer"])
+                    pairs = (np.array(message["hashes"], dtype=np.int64), np.array(message["times"], dtype=np.int64))
+                elif message["type"] == "job":
+                    with arrived:
+                        self.scan_id = message["scan_id"]
+                        self.cancel.clear()
+                    send_message(connection, lock, self.run_job(message, analyzer, pairs,
+                                                                lambda m: send_message(connection, lock, m)))
+        finally:
+            connection.close()
+
+    def run_job(self, job, analyzer, pairs, send):
+        """
+        Search the windows of one job in order and return the result message.
+        The job stops at its first match (the earliest one in the job) or when cancelled.
+        """
+        windows = job["windows"]
+        range_start = windows[0][0]
+        range_end = max(seg_end for seg_start, seg_end in windows)
+        result = {"type": "result", "job_id": job["job_id"], "windows": 0, "best_count": 0, "match": None, "cancelled": False}
+        if not os.path.exists(job["path"]):
+            # The duration reported before the split can round up to one split file that ffmpeg never wrote
+            return result
+        # Only decode the part of the split file covered by the job
+        audio, sr = librosa.load(job["path"], sr=analyzer.sr, offset=range_start, duration=range_end - range_start)
+        hash_filter = HashFilter(pairs[0]) if analyzer.prefilter else None
+        for seg_start, seg_end in windows:
+            if self.cancel.is_set():
+                result["cancelled"] = True
+                return result
+            window_audio_array = SlidingWindowProcessor.split_audio(audio, seg_start - range_start, seg_end - range_start, sr)
+            if len(window_audio_array) < analyzer.n_fft:
+                break
+            is_match, best_count, best_offset = analyzer.identify_pairs(window_audio_array, pairs, hash_filter)
+            result["windows"] += 1
+            result["best_count"] = max(result["best_count"], best_count)
+            send({"type": "progress", "job_id": job["job_id"], "seg_start": seg_start, "seg_end": seg_end,
+                  "is_match": is_match, "best_count": best_count})
+            if is_match:
+                result["match"] = {
+                    "seg_start": seg_start,
+                    "seg_end": seg_end,
+                    "offset_in_seg": seg_start + max(0, best_offset) * analyzer.hop_length / sr,
+                    "best_count": best_count,
+                }
+                break
+        return result
+
+
+def start_local_workers(count, address):
+    """
+    Start `count` workers in background threads of this process, connected to the coordinator at address.
+    Used to run the distributed mode on one machine (and to try it without other machines).
+    """
+    host, port = address
+    if host in ("0.0.0.0", ""):
+        host = "127.0.0.1"
+    threads = []
+    for number in range(count):
+        thread = threading.Thread(target=ScanWorker(host, port, f"local-{number}").run, daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker of the distributed scan (the coordinator is cli.py --listen).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="Connect to a coordinator and search the jobs it sends")
+    worker.add_argument("--connect", required=True, help="Coordinator address, HOST:PORT")
+    worker.add_argument("--name", help="Name shown by the coordinator")
+    worker.add_argument("--retry", type=float, default=5.0, help="Seconds between connection attempts (default 5)")
+    args = parser.parse_args(argv)
+
+    host, port = parse_address(args.connect)
+    while True:
+        try:
+            ScanWorker(host, port, args.name).run()
+            return 0
+        except ConnectionRefusedError:
+            print(f"Coordinator {args.connect} is not available, retrying in {args.retry} seconds", file=sys.stderr)
+            time.sleep(args.retry)
+
+
+# Entry point
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,11 @@
+import copy
 import yt_dlp
 import re
 from tqdm import tqdm
 from yt_dlp.utils import download_range_func
+from format_policy import AudioFormatPolicy
+from fragment_download import FragmentDownloader
+from info_cache import shared_info_cache
 class Download:
     """
     A class to download audio files from YouTube using yt-dlp.
@@ -9,6 +13,7 @@ class Download:
         url (str): The URL of the YouTube video.
         output_path (str): The path to save the downloaded audio file.
         fixed_filename (str): The filename of the downloaded audio file without special characters.
+        info_cache (InfoCache): Cache of the video information (info_cache.py), the one shared by the process if None.
     
     Methods:
         generate_filename(url): Generate a filename based on the URL.Supports YouTube and Twitch.
@@ -17,12 +22,14 @@ class Download:
         download_youtube_section_m4a(start_time, end_time): Download a section of the audio file based on the start and end times.
         download_twitch_mp4(): Download the mp4 file from the Twitch video.
         get_time_info(): Get the duration of the YouTube video.
+        with_info(action): Run action(info) on the cached information of the video.
     """
-    def __init__(self, url, output_path):
+    def __init__(self, url, output_path, info_cache=None):
         # Initialize the Download class with the URL and output path.
         self.url = url
         self.output_path = output_path
         self.fixed_filename = self.generate_filename(url)
+        self.info_cache = info_cache or shared_info_cache()
     
     def generate_filename(self, url):
         """
@@ -44,6 +51,19 @@ class Download:
     
     def remove_special_characters(self, filename):
         return re.sub(r'[^a-zA-Z0-9]', '', filename)
+
+    def with_info(self, action):
+        """
+        Run action(info) on the information of the video from the info cache, extracted only if no fresh entry exists.
+        A download that fails with an entry older than a minute (its format URLs may have expired) is run once more
+        on a new extraction.
+        """
+        try:
+            return action(self.info_cache.get(self.url))
+        except yt_dlp.utils.DownloadError:
+            if not self.info_cache.invalidate(self.url, min_age=60):
+                raise
+            return action(self.info_cache.get(self.url))
         
     
     def download_youtube_m4a(self):
@@ -58,14 +78,23 @@ class Download:
                 clean_percent_str = re.sub(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])', '', d['_percent_str'])
                 percent = float(clean_percent_str.strip('%'))
                 progress_bar.n = percent
+                if d.get('speed'):
+                    # Throughput of the download, and its fragment retries when the fragment downloader reports them
+                    # (the progress of a yt-dlp download has no retry count)
+                    postfix = f"{d['speed'] / 1e6:.2f} MB/s"
+                    if 'fragment_retries' in d:
+                        postfix += f", 重試 {d['fragment_retries']}"
+                    progress_bar.set_postfix_str(postfix, refresh=False)
                 progress_bar.refresh()
             elif d['status'] == 'finished':
                 progress_bar.n = 100
                 progress_bar.close()
                 print(f"下載完成：{d['filename']}")
+        # Select the cheapest audio rendition, the audio is resampled to 16 kHz anyway
+        format_policy = AudioFormatPolicy()
         # Set the download options
         ydl_opts = {
-            'format': 'bestaudio[ext=m4a]/best[ext=m4a]',                       #downloading the best audio quality
+            'format': format_policy,                                            #cheapest audio that still holds up 16 kHz fingerprinting
             'progress_hooks': [progress_hook],                                  #progress bar
             'outtmpl': f'{self.output_path}/{self.fixed_filename}.%(ext)s',     #output path
             'postprocessors': [],                                               #no postprocessing
@@ -76,14 +105,21 @@ class Download:
 
         # Display time information and show progress bar while downloading the file
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            
-            info = ydl.extract_info(self.url, download=False)
-            print("影音長度："+str(info['duration'])+"秒")
-            progress_bar = tqdm(total=100, desc="下載進度", unit="%")
-            ydl.download(self.url)
-            filename = ydl.prepare_filename(info)
-            # Return the file name, which refers to the path, for example: ./video_id.m4a
-            return filename
+
+            def download(raw_info):
+                nonlocal progress_bar
+                # Select the format on a copy, the download selects it again on the cached information
+                info = ydl.process_ie_result(copy.deepcopy(raw_info), download=False)
+                print("影音長度："+str(info['duration'])+"秒")
+                self.report_format_selection(format_policy, info)
+                progress_bar = tqdm(total=100, desc="下載進度", unit="%")
+                filename = ydl.prepare_filename(info)
+                # Fetch the audio as parallel fragments, fall back to yt-dlp if the format cannot be split
+                if FragmentDownloader(progress_hooks=[progress_hook]).download_info(info, filename) is None:
+                    ydl.process_ie_result(raw_info, download=True)
+                # Return the file name, which refers to the path, for example: ./video_id.m4a
+                return filename
+            return self.with_info(download)
 
     def download_youtube_section_m4a(self, start_time, end_time):
         # Download a section of the audio file based on the start and end times.
@@ -93,6 +129,13 @@ class Download:
                 clean_percent_str = re.sub(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])', '', d['_percent_str'])
                 percent = float(clean_percent_str.strip('%'))
                 progress_bar.n = percent
+                if d.get('speed'):
+                    # Throughput of the download, and its fragment retries when the fragment downloader reports them
+                    # (the progress of a yt-dlp download has no retry count)
+                    postfix = f"{d['speed'] / 1e6:.2f} MB/s"
+                    if 'fragment_retries' in d:
+                        postfix += f", 重試 {d['fragment_retries']}"
+                    progress_bar.set_postfix_str(postfix, refresh=False)
                 progress_bar.refresh()
             elif d['status'] == 'finished':
                 progress_bar.n = 100
@@ -111,15 +154,21 @@ class Download:
             'noprogress':True                                                               #no progress messages
         }
         # download
+        progress_bar = None
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            
-            info = ydl.extract_info(self.url, download=False)
-            print("影音長度："+str(end_time-start_time)+"秒")
-            progress_bar = tqdm(total=100, desc="下載進度", unit="%")
-            ydl.download(self.url)
-            filename = ydl.prepare_filename(info)
-            # Return the file name, which refers to the path, for example: ./video_id.m4a
-            return filename
+
+            def download(raw_info):
+                nonlocal progress_bar
+                info = ydl.process_ie_result(copy.deepcopy(raw_info), download=False)
+                print("影音長度："+str(end_time-start_time)+"秒")
+                progress_bar = tqdm(total=100, desc="下載進度", unit="%")
+                # Stays on yt-dlp: ffmpeg reads only the section and cuts it at a keyframe, the fragment downloader
+                # could only fetch the whole file (a time range has no byte range in a progressive m4a)
+                ydl.process_ie_result(raw_info, download=True)
+                filename = ydl.prepare_filename(info)
+                # Return the file name, which refers to the path, for example: ./video_id.m4a
+                return filename
+            return self.with_info(download)
         
     def download_twitch_mp4(self):
         progress_bar = None
@@ -133,48 +182,60 @@ class Download:
                 clean_percent_str = re.sub(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])', '', d['_percent_str'])
                 percent = float(clean_percent_str.strip('%'))
                 progress_bar.n = percent
+                if d.get('speed'):
+                    # Throughput of the download, and its fragment retries when the fragment downloader reports them
+                    # (the progress of a yt-dlp download has no retry count)
+                    postfix = f"{d['speed'] / 1e6:.2f} MB/s"
+                    if 'fragment_retries' in d:
+                        postfix += f", 重試 {d['fragment_retries']}"
+                    progress_bar.set_postfix_str(postfix, refresh=False)
                 progress_bar.refresh()
             elif d['status'] == 'finished':
                 progress_bar.n = 100
                 progress_bar.close()
                 print(f"下載完成：{d['filename']}")
+        # Select the cheapest audio rendition, the audio is resampled to 16 kHz anyway
+        format_policy = AudioFormatPolicy(baseline="Audio_Only", fallback=("Audio_Only", "bestaudio", "best"))
         # Set the download options
         ydl_opts = {
-            'format': 'Audio_Only',                                             #downloading the best audio quality    
+            'format': format_policy,                                            #cheapest audio that still holds up 16 kHz fingerprinting
             'outtmpl': f'{self.output_path}/{self.fixed_filename}.%(ext)s',     #output path
             'progress_hooks': [progress_hook],                                  #progress bar
             'postprocessors': [],                                               #no postprocessing
             'nooverwrites': False,                                              #overwrite existing files
             'quiet': True,                                                      #no logging                               
             'noprogress':True,                                                  #no progress messages                 
-            'concurrent_fragment_downloads': 6 ,                                #number of concurrent fragment downloads
+            'concurrent_fragment_downloads': 6 ,                                #number of concurrent fragment downloads of the yt-dlp fallback
             'nopart': True,                                                     #do not use .part files      
                                                    
         }
 
         # Display time information and show progress bar while downloading the file
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            
-            info = ydl.extract_info(self.url, download=False)
-            print("影音長度："+str(info['duration'])+"秒")
-            progress_bar = tqdm(total=100, desc="下載進度", unit="%")
-            ydl.download(self.url)
-            filename = ydl.prepare_filename(info)
-            # Return the file name, which refers to the path, for example: ./video_id.m4a
-            return filename
+
+            def download(raw_info):
+                nonlocal progress_bar
+                info = ydl.process_ie_result(copy.deepcopy(raw_info), download=False)
+                print("影音長度："+str(info['duration'])+"秒")
+                self.report_format_selection(format_policy, info)
+                progress_bar = tqdm(total=100, desc="下載進度", unit="%")
+                filename = ydl.prepare_filename(info)
+                # Fetch the HLS segments in parallel, fall back to yt-dlp if the playlist cannot be read that way
+                if FragmentDownloader(progress_hooks=[progress_hook]).download_info(info, filename) is None:
+                    ydl.process_ie_result(raw_info, download=True)
+                # Return the file name, which refers to the path, for example: ./video_id.m4a
+                return filename
+            return self.with_info(download)
            
+    def report_format_selection(self, format_policy, info):
+        # Log the selected audio format and the bytes saved compared with the format used before
+        chosen_bytes, baseline_bytes, saved_bytes = format_policy.bytes_saved(info.get('duration'))
+        if chosen_bytes is not None and saved_bytes is not None:
+            print(f"音訊格式：{info.get('format_id')}（{info.get('acodec')}），約 {chosen_bytes / 1e6:.1f} MB，"
+                  f"比原本的格式少 {saved_bytes / 1e6:.1f} MB")
+
     def get_time_info(self):
         # Get the duration of the YouTube
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': f'{self.output_path}/{self.fixed_filename}.%(ext)s', 
-            'postprocessors': [],  
-            'nooverwrites': False,  
-            'quiet': True,                                                                                 
-            'noprogress':True
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            
-            info = ydl.extract_info(self.url, download=False)
-            return info['duration'] 
+        # The duration is part of the raw information, no format needs to be selected
+        return self.info_cache.get(self.url)['duration'] 
 
@@ -1,6 +1,11 @@
 import librosa
 import numpy as np
 from collections import defaultdict
+from scipy.ndimage import maximum_filter
+
+from hash_filter import HashFilter
+from instrumentation import NullInstrumentation
+from query_region import best_query_region
 
 class FingerprintIdentifier:
     """
@@ -32,15 +37,60 @@ class FingerprintIdentifier:
 
         min_count: Minimum number of matching points for the result, determining whether the audio files match.
 
+        Density controls (all disabled by default, None keeps every peak / pair):
+
+        max_peaks_per_frame: Keep only the strongest N peaks of each STFT frame.
+
+        max_peaks_per_band: Keep only the strongest N peaks per frequency band per second,
+        the spectrum is divided into `band_count` bands of equal width.
+
+        band_count: Number of frequency bands used by max_peaks_per_band.
+
+        max_targets_per_anchor: Pair each anchor only with its N strongest target peaks.
+
+        Hash popularity (disabled by default):
+
+        max_hash_occurrences: A hashkey that occurs more than N times in the reference window is treated as uninformative.
+
+        stoplist: HashStoplist with per stream or per archive hashkey popularity, see stoplist.py.
+
+        stoplist_mode: "skip" drops the votes of uninformative hashkeys,
+        "weight" keeps them with a weight that decreases with their popularity.
+
+        prefilter: Test the reference pairs against a Bloom filter of the sample hashkeys (hash_filter.py) before
+        grouping them, the answer is the same and the pairs that cannot get a vote are not sorted.
+
+        query_seconds: A sample longer than this votes only with the pairs of its most distinctive query_seconds
+        seconds (query_region.py), which keep their time in the sample; None votes with every pair.
+
+        instrumentation: Instrumentation object receiving the stft / peaks / hashing / voting spans
+        and the peaks / pairs / hash_hits / votes / votes_skipped / hashes_skipped / query_pairs_dropped counters,
+        nothing is recorded if None.
+        With the prefilter, filter_pairs / filter_passed / filter_matched count the reference pairs tested, the ones
+        that passed and the ones whose hashkey really is in a sample (filter_passed / filter_pairs is the hit rate).
+
     methods:
         detect_peaks_2d: 2D peak detection, detecting peaks in the 2D spectrum.
+        detect_peak_arrays: Same as detect_peaks_2d, returning arrays.
+        limit_peak_density: Apply the per frame / per band caps to the detected peaks.
+        pair_indices: Pair anchor peaks with target peaks for all anchors at once, shared by fingerprint generation and identification.
+        pair_peaks: The same pairs, as (hashkey, timeA) tuples.
+        spectrogram_db: STFT magnitude in dB, normalized to the loudest bin.
+        fingerprint_arrays: Pair peaks into packed hash and anchor time arrays.
+        get_params: Return the fingerprint parameters, to store them next to saved fingerprints.
         build_fingerprint: Generate music fingerprints, pairing peaks to generate fingerprints.
         identify: Identify music fingerprints, determining whether two audio files match.
+        query_pairs / identify_pairs: identify in two steps, to fingerprint the sample only once.
+        reference_pairs: Fingerprint the reference audio and group its pairs by hashkey.
+        identify_batch: identify_pairs for several samples, fingerprinting the reference once.
 
     For detailed instructions on this class, please refer to the fingerprint_manual.md or fingerprint_manual_en.md document.
     """
 
-    def __init__(self,sr=16000,n_fft=2048,hop_length=512,peak_threshold=-30.0,peak_neighborhood=3, fan_value_frames=5,min_count=8):
+    def __init__(self,sr=16000,n_fft=2048,hop_length=512,peak_threshold=-30.0,peak_neighborhood=3, fan_value_frames=5,min_count=8,
+                 max_peaks_per_frame=None,max_peaks_per_band=None,band_count=6,max_targets_per_anchor=None,
+                 max_hash_occurrences=None,stoplist=None,stoplist_mode="skip",prefilter=True,query_seconds=None,
+                 instrumentation=None):
 
         self.sr = sr
         self.n_fft = n_fft
@@ -49,6 +99,39 @@ class FingerprintIdentifier:
         self.peak_neighborhood = peak_neighborhood
         self.fan_value_frames = fan_value_frames
         self.min_count = min_count
+        self.max_peaks_per_frame = max_peaks_per_frame
+        self.max_peaks_per_band = max_peaks_per_band
+        self.band_count = band_count
+        self.max_targets_per_anchor = max_targets_per_anchor
+        if stoplist_mode not in ("skip", "weight"):
+            raise ValueError("stoplist_mode must be skip or weight")
+        self.max_hash_occurrences = max_hash_occurrences
+        self.stoplist = stoplist
+        self.stoplist_mode = stoplist_mode
+        self.prefilter = prefilter
+        self.query_seconds = query_seconds
+        self.instrumentation = instrumentation or NullInstrumentation()
+
+    def get_params(self):
+        """
+        Return the parameters that determine the fingerprints and the match decision, as a dictionary
+        that can be passed back to FingerprintIdentifier(**params).
+        """
+        return {
+            "sr": self.sr,
+            "n_fft": self.n_fft,
+            "hop_length": self.hop_length,
+            "peak_threshold": self.peak_threshold,
+            "peak_neighborhood": self.peak_neighborhood,
+            "fan_value_frames": self.fan_value_frames,
+            "min_count": self.min_count,
+            "max_peaks_per_frame": self.max_peaks_per_frame,
+            "max_peaks_per_band": self.max_peaks_per_band,
+            "band_count": self.band_count,
+            "max_targets_per_anchor": self.max_targets_per_anchor,
+            "max_hash_occurrences": self.max_hash_occurrences,
+            "stoplist_mode": self.stoplist_mode,
+        }
 
     def detect_peaks_2d(self, S_db):
         """
@@ -60,27 +143,109 @@ class FingerprintIdentifier:
         Returns:
             List[Tuple[int, int, float]]: List of peaks as (freq, time, magnitude).
         """
-        freq_len, time_len = S_db.shape
-        peaks = []
-        # Traverse the spectrogram to find peakss.
-        for t in range(time_len):
-            for f in range(freq_len):
-                # Skip points below the peak threshold
-                val = S_db[f, t]
-                if val < self.peak_threshold:
-                    continue
-                # Define local neighborhood boundaries
-                fmin = max(0, f - self.peak_neighborhood)
-                fmax = min(freq_len, f + self.peak_neighborhood + 1)
-                tmin = max(0, t - self.peak_neighborhood)
-                tmax = min(time_len, t + self.peak_neighborhood + 1)
-                # Extract the local neighborhood around the point
-                local_patch = S_db[fmin:fmax, tmin:tmax]
-                # Check if the point is a local maximum
-                if val >= np.max(local_patch):
-                    peaks.append((f, t, val))
+        freqs, times, values = self.detect_peak_arrays(S_db)
         # Return the peaks list.
-        return peaks
+        return list(zip(freqs.tolist(), times.tolist(), values.tolist()))
+
+    def detect_peak_arrays(self, S_db):
+        """
+        Same as detect_peaks_2d, but return the peaks as three arrays (freqs, times, values), ordered by time, then frequency.
+        """
+        # A point is a peak if it is not below the threshold and is the maximum of its neighborhood (freq±N, time±N).
+        # The maximum filter pads with -inf, which gives the same result as clipping the neighborhood at the borders.
+        size = 2 * self.peak_neighborhood + 1
+        local_max = maximum_filter(S_db, size=size, mode="constant", cval=-np.inf)
+        is_peak = (S_db >= self.peak_threshold) & (S_db >= local_max)
+        # Transpose so the peaks come out ordered by time, then frequency
+        times, freqs = np.nonzero(is_peak.T)
+        values = S_db[freqs, times]
+        return self.limit_peak_density(freqs, times, values, S_db.shape[0])
+
+    def limit_peak_density(self, freqs, times, values, freq_len):
+        """
+        Drop the weakest peaks of crowded frames and frequency bands.
+
+        Args:
+            freqs, times, values (ndarray): Peaks ordered by time, then frequency.
+            freq_len (int): Number of frequency bins of the spectrogram.
+
+        Returns:
+            Tuple[ndarray, ndarray, ndarray]: The remaining peaks, in the same order.
+        """
+        keep = np.ones(len(freqs), dtype=bool)
+        if self.max_peaks_per_frame is not None:
+            keep &= _rank_in_group(times, values) < self.max_peaks_per_frame
+        if self.max_peaks_per_band is not None:
+            frames_per_second = max(1, int(round(self.sr / self.hop_length)))
+            bands = freqs * self.band_count // freq_len
+            groups = (times // frames_per_second) * self.band_count + bands
+            keep &= _rank_in_group(groups, values) < self.max_peaks_per_band
+        return freqs[keep], times[keep], values[keep]
+
+    def pair_indices(self, times, values):
+        """
+        Pair anchor peaks with the target peaks that follow them within fan_value_frames, for all anchors at once.
+
+        This produces exactly the pairs of the original two-pointer loop, whose second pointer is never moved back:
+        the loop of anchor i stops at the first peak more than fan_value_frames after it (ends[i]), or where the
+        previous anchor stopped if that is further, so the stop positions are the running maximum of max(i+1, ends[i])
+        and anchor i is paired with the peaks between the previous stop and its own stop.
+        If max_targets_per_anchor is set, only the strongest targets of each anchor are kept.
+
+        Args:
+            times (ndarray): Peak times, sorted.
+            values (ndarray): Peak magnitudes, in the same order.
+
+        Returns:
+            Tuple[ndarray, ndarray]: (anchors, targets), indices of the paired peaks, ordered by anchor, then target.
+        """
+        n_peaks = len(times)
+        if n_peaks < 2:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        after_anchor = np.arange(1, n_peaks + 1)
+        ends = np.searchsorted(times, times + self.fan_value_frames, side="right")
+        stops = np.maximum.accumulate(np.maximum(ends, after_anchor))
+        starts = np.maximum(after_anchor, np.r_[0, stops[:-1]])
+        counts = np.maximum(stops - starts, 0)
+        anchors = np.repeat(np.arange(n_peaks), counts)
+        targets = expand_ranges(starts, counts)
+        # Only consider valid pairs where dt > 0
+        valid = times[targets] > times[anchors]
+        anchors, targets = anchors[valid], targets[valid]
+        if self.max_targets_per_anchor is not None:
+            keep = _rank_in_group(anchors, values[targets]) < self.max_targets_per_anchor
+            anchors, targets = anchors[keep], targets[keep]
+        return anchors, targets
+
+    def fingerprint_arrays(self, peaks):
+        """
+        Pair peaks into flat arrays, the representation used for matching.
+
+        Args:
+            peaks (List[Tuple[int, int, float]] or Tuple[ndarray, ndarray, ndarray]): Peaks as returned by
+            detect_peaks_2d or detect_peak_arrays.
+
+        Returns:
+            Tuple[ndarray, ndarray]: (hashes, times), the packed hashkey (see pack_hashkey) and anchor time of every pair.
+        """
+        freqs, times, values = _sorted_peak_arrays(peaks)
+        anchors, targets = self.pair_indices(times, values)
+        return pack_hashkey(freqs[anchors], freqs[targets], times[targets] - times[anchors]), times[anchors]
+
+    def pair_peaks(self, peaks_sorted):
+        """
+        Pair anchor peaks with the target peaks that follow them within fan_value_frames.
+
+        Args:
+            peaks_sorted (List[Tuple[int, int, float]]): Peaks sorted by time.
+
+        Yields:
+            Tuple[Tuple[int, int, int], int]: (hashkey, timeA) where hashkey is (freqA, freqB, dt).
+        """
+        hashes, times = self.fingerprint_arrays(peaks_sorted)
+        freqA, freqB, dt = unpack_hashkey(hashes)
+        for hashkey, timeA in zip(zip(freqA.tolist(), freqB.tolist(), dt.tolist()), times.tolist()):
+            yield hashkey, timeA
 
     def build_fingerprint(self, peaks):
         """
@@ -96,43 +261,90 @@ class FingerprintIdentifier:
         Returns:
             defaultdict: A dictionary-like structure where keys are hashkeys, and values are lists of time offsets.
         """
-        # Sort peaks by time for consistent pair generation
-        peaks_sorted = sorted(peaks, key=lambda x:x[1])  # x[1] is the time index
-        n_peaks = len(peaks_sorted)
-
         # Dictionary to store the fingerprint (hashkey -> list of offsets)
         hash_dict = defaultdict(list)
-
-        # Use two variables to traverse the entire peaks_sorted list
-        # Initialize the second pointer
-        j = 0
-        for i in range(n_peaks):
-            freqA, timeA, valA = peaks_sorted[i]
-            # Ensure the second pointer starts after the first pointer
-            if j < i+1:
-                j = i+1
-
-            # Match the current peak with subsequent peaks within the fan-out limit
-            while j < n_peaks:
-                freqB, timeB, valB = peaks_sorted[j]
-                dt = timeB - timeA
-
-                # If the time difference exceeds the fan-out limit, break the loop
-                if dt > self.fan_value_frames:
-                    break
-
-                # Only consider valid pairs where dt > 0
-                if dt> 0:
-                    # Generate a hashkey using frequencies and time difference
-                    hashkey = (freqA, freqB, dt)
-                    # Store the time offset (timeA) for the hashkey
-                    hash_dict[hashkey].append(timeA)
-                # Move the second pointer forward
-                j+=1
+        for hashkey, timeA in self.pair_peaks(peaks):
+            # Store the time offset (timeA) for the hashkey
+            hash_dict[hashkey].append(timeA)
 
         # Return the fingerprint dictionary
         return hash_dict
 
+    def hash_weight(self, hashkey, occurrences):
+        """
+        Return the vote weight of a hashkey found `occurrences` times in the reference window.
+        1 for informative hashkeys, 0 for skipped ones, and in between in "weight" mode.
+        """
+        weight = 1.0
+        if self.max_hash_occurrences is not None and occurrences > self.max_hash_occurrences:
+            weight = self.max_hash_occurrences / occurrences
+        if self.stoplist is not None:
+            weight = min(weight, self.stoplist.weight(hashkey))
+        if weight < 1.0 and self.stoplist_mode == "skip":
+            return 0
+        return weight
+
+    def hash_weights(self, keys, occurrences):
+        """
+        hash_weight for arrays of packed hashkeys and their occurrence counts.
+        """
+        if self.stoplist is not None:
+            return np.array([self.hash_weight(hashkey, count) for hashkey, count
+                             in zip(zip(*(part.tolist() for part in unpack_hashkey(keys))), occurrences.tolist())], dtype=np.float64)
+        weights = np.ones(len(keys), dtype=np.float64)
+        if self.max_hash_occurrences is not None:
+            popular = occurrences > self.max_hash_occurrences
+            weights[popular] = self.max_hash_occurrences / occurrences[popular]
+            if self.stoplist_mode == "skip":
+                weights[popular] = 0
+        return weights
+
+    def spectrogram_db(self, audio):
+        """
+        Compute the STFT magnitude of an audio signal in dB, relative to its loudest bin.
+
+        Args:
+            audio (ndarray): Audio signal.
+
+        Returns:
+            ndarray: Spectrogram in dB, shape (freq_len, time_len).
+        """
+        D = librosa.stft(audio, n_fft=self.n_fft, hop_length=self.hop_length, center=False)
+        return librosa.amplitude_to_db(np.abs(D), ref=np.max)
+
+    def query_pairs(self, sample_audio):
+        """
+        Fingerprint the sample audio once, so it can be compared with many reference windows
+        (or sent to other machines, see distributed.py). With query_seconds, only the pairs of the most
+        distinctive part of a longer sample are returned.
+
+        Args:
+            sample_audio (ndarray): Sample audio signal.
+
+        Returns:
+            Tuple[ndarray, ndarray]: (hashes, times) of the sample, see fingerprint_arrays.
+        """
+        instrumentation = self.instrumentation
+        # Compute STFT and convert to dB
+        with instrumentation.span("stft"):
+            S_db_samp = self.spectrogram_db(sample_audio)
+
+        # Detect peaks in the sample audio
+        with instrumentation.span("peaks"):
+            peaks_samp = self.detect_peak_arrays(S_db_samp)
+        hashes, times = self.fingerprint_arrays(peaks_samp)
+        if self.query_seconds is not None:
+            region_frames = int(np.ceil(self.query_seconds * self.sr / self.hop_length))
+            # A stoplist that is still learning knows nothing about the hashkeys yet
+            key_weights = None
+            if self.stoplist is not None and not self.stoplist.learn:
+                key_weights = lambda keys: self.hash_weights(keys, np.ones(len(keys), dtype=np.int64))
+            first_frame, end_frame = best_query_region(hashes, times, region_frames, key_weights)
+            kept = (times >= first_frame) & (times < end_frame)
+            instrumentation.count("query_pairs_dropped", int(len(kept) - kept.sum()))
+            hashes, times = hashes[kept], times[kept]
+        return hashes, times
+
     def identify(self, ref_audio, sample_audio):
         """
         Compare two audio files to determine if they match.
@@ -151,56 +363,209 @@ class FingerprintIdentifier:
                 - is_match (bool): True if match is found, False otherwise.
                 - best_count (int): Highest number of matching fingerprints.
         """
+        is_match, best_count, _ = self.identify_pairs(ref_audio, self.query_pairs(sample_audio))
+        return (is_match, best_count)
+
+    def identify_pairs(self, ref_audio, sample_pairs, hash_filter=None):
+        """
+        Same as identify, with the sample already fingerprinted by query_pairs.
+
+        Args:
+            ref_audio (ndarray): Reference audio signal.
+            sample_pairs (Tuple[ndarray, ndarray]): Result of query_pairs.
+            hash_filter (HashFilter): Filter of the sample hashkeys, built from sample_pairs if None
+                (pass one to reuse it for every window of a search).
+
+        Returns:
+            Tuple[bool, int, int]: (is_match, best_count, best_offset), best_offset being the frame of the
+            reference audio where the sample starts (None if nothing matched).
+        """
+        if self.prefilter and hash_filter is None:
+            hash_filter = HashFilter(sample_pairs[0])
+        reference = self.reference_pairs(ref_audio, hash_filter)
+        result, matched = self._vote(reference, sample_pairs)
+        if reference[4]:
+            self.instrumentation.count("filter_matched", int(reference[2][matched].sum()))
+        return result
+
+    def identify_batch(self, ref_audio, sample_pairs_list, hash_filter=None):
+        """
+        identify_pairs for several samples (clips searched in the same original): the reference audio is
+        fingerprinted once, and one filter of the hashkeys of every sample leaves out the reference pairs
+        none of them has.
+
+        Args:
+            ref_audio (ndarray): Reference audio signal.
+            sample_pairs_list (List[Tuple[ndarray, ndarray]]): Result of query_pairs for every sample.
+            hash_filter (HashFilter): Filter of the hashkeys of every sample, built from sample_pairs_list if None.
+
+        Returns:
+            List[Tuple[bool, int, int]]: The result of identify_pairs for every sample.
+        """
+        if self.prefilter and hash_filter is None:
+            hash_filter = HashFilter([pairs[0] for pairs in sample_pairs_list])
+        reference = self.reference_pairs(ref_audio, hash_filter)
+        results = []
+        matched = np.zeros(len(reference[0]), dtype=bool)
+        for sample_pairs in sample_pairs_list:
+            result, sample_matched = self._vote(reference, sample_pairs)
+            results.append(result)
+            matched[sample_matched] = True
+        if reference[4]:
+            self.instrumentation.count("filter_matched", int(reference[2][matched].sum()))
+        return results
+
+    def reference_pairs(self, ref_audio, hash_filter=None):
+        """
+        Fingerprint the reference audio and group its pairs by hashkey, for the vote of one or more samples.
+
+        Args:
+            ref_audio (ndarray): Reference audio signal.
+            hash_filter (HashFilter): Only the pairs whose hashkey passes the filter are grouped, the others
+                cannot get a vote. Ignored while a learning stoplist needs every hashkey of the window.
+
+        Returns:
+            Tuple: (keys, key_starts, key_counts, ref_times, filtered), the sorted distinct hashkeys, where the
+            offsets of each start in ref_times and how many there are.
+        """
+
+        instrumentation = self.instrumentation
 
         # A) Generate fingerprints for the reference audio
         # Compute STFT and convert to dB
-        D_ref = librosa.stft(ref_audio, n_fft=self.n_fft, hop_length=self.hop_length, center=False)
-        S_ref = np.abs(D_ref)
-        S_db_ref = librosa.amplitude_to_db(S_ref, ref=np.max)
+        with instrumentation.span("stft"):
+            S_db_ref = self.spectrogram_db(ref_audio)
 
         # Detect peaks and build fingerprints
-        peaks_ref = self.detect_peaks_2d(S_db_ref)
-        ref_fp = self.build_fingerprint(peaks_ref)
+        with instrumentation.span("peaks"):
+            peaks_ref = self.detect_peak_arrays(S_db_ref)
+        learn = self.stoplist is not None and self.stoplist.learn
+        filtered = hash_filter is not None and not learn
+        with instrumentation.span("hashing"):
+            ref_hashes, ref_times = self.fingerprint_arrays(peaks_ref)
+            pair_count = len(ref_hashes)
+            if filtered:
+                passed = hash_filter.contains(ref_hashes)
+                ref_hashes, ref_times = ref_hashes[passed], ref_times[passed]
+            # Group the reference pairs by hashkey, keeping the order of their offsets
+            order = np.argsort(ref_hashes, kind="stable")
+            ref_times = ref_times[order]
+            keys, key_starts, key_counts = np.unique(ref_hashes[order], return_index=True, return_counts=True)
+        instrumentation.count("peaks", len(peaks_ref[0]))
+        instrumentation.count("pairs", pair_count)
+        if filtered:
+            instrumentation.count("filter_pairs", pair_count)
+            instrumentation.count("filter_passed", len(ref_hashes))
+        if learn:
+            self.stoplist.add(dict.fromkeys(zip(*(part.tolist() for part in unpack_hashkey(keys)))))
+        return keys, key_starts, key_counts, ref_times, filtered
+
+    def _vote(self, reference, sample_pairs):
+        """
+        Vote for the offsets of the sample in the grouped reference pairs.
+        Returns ((is_match, best_count, best_offset), indices of the reference keys the sample has).
+        """
+        instrumentation = self.instrumentation
+        keys, key_starts, key_counts, ref_times, _ = reference
+
+        # B) Compare sample pairs against reference fingerprints
+        sample_hashes, sample_times = sample_pairs
+        with instrumentation.span("voting"):
+            position = np.minimum(np.searchsorted(keys, sample_hashes), max(len(keys) - 1, 0))
+            hit = keys[position] == sample_hashes if len(keys) else np.zeros(len(sample_hashes), dtype=bool)
+            position, sample_offsets = position[hit], sample_times[hit]
+            hash_hits = len(position)
+
+            # Uninformative hashkeys lose all of their votes (or part of them in "weight" mode)
+            shared = np.unique(position)
+            key_weights = np.ones(len(keys), dtype=np.float64)
+            key_weights[shared] = self.hash_weights(keys[shared], key_counts[shared])
+            weights = key_weights[position]
+            skipped = weights == 0
+            votes_skipped = int(key_counts[position[skipped]].sum())
+            hashes_skipped = int(skipped.sum())
+            position, sample_offsets, weights = position[~skipped], sample_offsets[~skipped], weights[~skipped]
+            counts = key_counts[position]
+            votes = int(counts.sum())
+
+            # Offset histogram: one vote for every reference offset of every shared hashkey
+            postings = expand_ranges(key_starts[position], counts)
+            offset_diffs = ref_times[postings] - np.repeat(sample_offsets, counts)
+            offsets, first_vote, inverse = np.unique(offset_diffs, return_index=True, return_inverse=True)
+            totals = np.bincount(inverse, weights=np.repeat(weights, counts), minlength=len(offsets))
+        instrumentation.count("hash_hits", hash_hits)
+        instrumentation.count("votes", votes)
+        instrumentation.count("votes_skipped", votes_skipped)
+        instrumentation.count("hashes_skipped", hashes_skipped)
 
-        # B) Process the sample audio
-        # Compute STFT and convert to dB
-        D_samp = librosa.stft(sample_audio, n_fft=self.n_fft, hop_length=self.hop_length, center=False)
-        S_samp = np.abs(D_samp)
-        S_db_samp = librosa.amplitude_to_db(S_samp, ref=np.max)
+        # Determine the best match from the offset histogram
+        if not len(offsets):
+            return (False,0,None), shared
+
+        # Ties go to the offset that received its first vote earliest
+        tied = np.flatnonzero(totals == totals.max())
+        best = tied[np.argmin(first_vote[tied])]
+        best_off, best_count = int(offsets[best]), totals[best]
+        # Weighted votes are fractional, report the score as a count
+        best_count = int(round(best_count))
+        is_match= (best_count>= self.min_count)
+        return (is_match, best_count, best_off), shared
 
-        # Detect peaks in the sample audio
-        peaks_samp = self.detect_peaks_2d(S_db_samp)
-
-        # Compare sample peaks against reference fingerprints
-        offset_map = defaultdict(int)
-        peaks_samp_sorted = sorted(peaks_samp, key=lambda x:x[1])
-        n_samp_peaks= len(peaks_samp_sorted)
-        
-        # Compare peaks using a two-pointer approach
-        j=0
-        for i in range(n_samp_peaks):
-            freqA, timeA, valA= peaks_samp_sorted[i]
-            if j< i+1:
-                j= i+1
-            while j< n_samp_peaks:
-                freqB, timeB, valB= peaks_samp_sorted[j]
-                dt= timeB - timeA
-                if dt> self.fan_value_frames:
-                    break
-                if dt> 0:
-                    hashkey= (freqA, freqB, dt)
-                    sample_offset= timeA
-                    if hashkey in ref_fp:
-                        ref_offsets = ref_fp[hashkey]
-                        for ref_offset in ref_offsets:
-                            offset_diff= ref_offset- sample_offset
-                            offset_map[offset_diff]+=1
-                j+=1
 
-        # Determine the best match from the offset histogram
-        if not offset_map:
-            return (False,0)
+def pack_hashkey(freqA, freqB, dt):
+    """
+    Pack a hashkey (freqA, freqB, dt) into one int64 so fingerprints can be stored in numpy arrays.
+    Frequencies use 16 bits each and dt 8 bits (fan_value_frames must stay below 256).
+    Works on integers and on integer arrays.
+    """
+    return (np.asarray(freqA, dtype=np.int64) << 24) | (np.asarray(freqB, dtype=np.int64) << 8) | np.asarray(dt, dtype=np.int64)
 
-        best_off, best_count= max(offset_map.items(), key=lambda x:x[1])
-        is_match= (best_count>= self.min_count)
-        return (is_match, best_count)
+
+def unpack_hashkey(packed):
+    """
+    Inverse of pack_hashkey, returns (freqA, freqB, dt).
+    """
+    packed = np.asarray(packed, dtype=np.int64)
+    return packed >> 24, (packed >> 8) & 0xFFFF, packed & 0xFF
+
+
+def _rank_in_group(groups, values):
+    """
+    Return, for every element, its rank by value (0 = strongest) among the elements of the same group.
+    """
+    if len(groups) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((-values, groups))
+    sorted_groups = groups[order]
+    group_start = np.r_[0, np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1]
+    group_sizes = np.diff(np.r_[group_start, len(groups)])
+    ranks_sorted = np.arange(len(groups)) - np.repeat(group_start, group_sizes)
+    ranks = np.empty(len(groups), dtype=np.int64)
+    ranks[order] = ranks_sorted
+    return ranks
+
+
+def expand_ranges(starts, counts):
+    """
+    Return the concatenation of the ranges [starts[i], starts[i] + counts[i]).
+    """
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    range_starts = np.repeat(starts - np.r_[0, np.cumsum(counts)[:-1]], counts)
+    return range_starts + np.arange(total)
+
+
+def _sorted_peak_arrays(peaks):
+    """
+    Return (freqs, times, values) arrays of peaks given as a list of tuples or as arrays, stably sorted by time.
+    """
+    if isinstance(peaks, tuple) and len(peaks) == 3 and isinstance(peaks[0], np.ndarray):
+        freqs, times, values = peaks
+    else:
+        peaks = list(peaks)
+        freqs = np.array([peak[0] for peak in peaks], dtype=np.int64)
+        times = np.array([peak[1] for peak in peaks], dtype=np.int64)
+        values = np.array([peak[2] for peak in peaks], dtype=np.float64)
+    order = np.argsort(times, kind="stable")
+    return freqs[order].astype(np.int64), times[order].astype(np.int64), values[order]
@@ -0,0 +1,97 @@
+"""
+Bandwidth-minimal audio format selection for the long download.
+
+The long audio is resampled to 16 kHz mono right after the download (librosa.load(..., sr=16000)), so a
+high bitrate rendition is mostly thrown away. AudioFormatPolicy is a yt-dlp format selector (pass it as the
+'format' option) that picks the cheapest audio-only rendition that still holds up 16 kHz fingerprinting,
+and falls back to the previous selection when no rendition qualifies.
+"""
+
+import yt_dlp
+
+
+class AudioFormatPolicy:
+    """
+    Pick the cheapest audio-only format whose sample rate and bitrate are high enough for fingerprinting.
+
+    Only renditions in the original language are considered (YouTube also lists dubbed audio tracks).
+    Formats are ranked by bitrate, then by file size; if none qualifies, the fallback selectors are tried in order.
+    After yt-dlp has called the policy, `selection` describes the chosen format and the one the baseline selector
+    would have downloaded, and bytes_saved(duration) estimates the difference.
+
+    args:
+        min_sample_rate: int, Formats with a known lower sample rate are rejected (16 kHz fingerprinting)
+        min_bitrate: float, Formats with a known lower audio bitrate (kbps) are rejected
+        codecs: Tuple[str], Accepted audio codecs (prefix of acodec)
+        fallback: Tuple[str], yt-dlp format selectors tried when no format qualifies
+        baseline: str, yt-dlp format selector used before, to compute the bytes saved
+
+    methods:
+        __call__(ctx): yt-dlp format selector interface, yields the chosen format.
+        bytes_saved(duration): Estimated (chosen_bytes, baseline_bytes, saved_bytes) for a video of `duration` seconds.
+    """
+
+    def __init__(self, min_sample_rate=16000, min_bitrate=32, codecs=("opus", "mp4a", "aac", "vorbis", "mp3"),
+                 fallback=("bestaudio[ext=m4a]", "best[ext=m4a]", "bestaudio", "best"), baseline="bestaudio[ext=m4a]/best[ext=m4a]"):
+        self.min_sample_rate = min_sample_rate
+        self.min_bitrate = min_bitrate
+        self.codecs = codecs
+        with yt_dlp.YoutubeDL({"quiet": True}) as ydl:
+            self.fallback_selectors = [ydl.build_format_selector(spec) for spec in fallback]
+            self.baseline_selector = ydl.build_format_selector(baseline)
+        self.selection = None
+
+    def acceptable(self, fmt):
+        if fmt.get("vcodec") not in (None, "none") or fmt.get("acodec") in (None, "none"):
+            return False
+        if not fmt["acodec"].startswith(self.codecs):
+            return False
+        if fmt.get("asr") and fmt["asr"] < self.min_sample_rate:
+            return False
+        bitrate = fmt.get("abr") or fmt.get("tbr")
+        return not (bitrate and bitrate < self.min_bitrate)
+
+    def __call__(self, ctx):
+        formats = list(ctx["formats"])
+        preferences = [fmt["language_preference"] for fmt in formats if fmt.get("language_preference") is not None]
+        if preferences:
+            # Keep the original audio track, dubbed tracks have a lower language preference
+            formats = [fmt for fmt in formats if fmt.get("language_preference") in (None, max(preferences))]
+        candidates = [fmt for fmt in formats if self.acceptable(fmt)]
+        chosen = None
+        if candidates:
+            chosen = min(candidates, key=lambda fmt: (fmt.get("abr") or fmt.get("tbr") or float("inf"),
+                                                      fmt.get("filesize") or fmt.get("filesize_approx") or float("inf")))
+        else:
+            for selector in self.fallback_selectors:
+                chosen = next(iter(selector(dict(ctx, formats=ctx["formats"]))), None)
+                if chosen is not None:
+                    break
+        baseline = next(iter(self.baseline_selector(dict(ctx, formats=ctx["formats"]))), None)
+        self.selection = {"chosen": chosen, "baseline": baseline, "fallback": not candidates}
+        if chosen is not None:
+            yield chosen
+
+    def bytes_saved(self, duration):
+        """
+        Return (chosen_bytes, baseline_bytes, saved_bytes), estimated from the file sizes or the bitrates;
+        values are None when they cannot be estimated.
+        """
+        if self.selection is None:
+            return None, None, None
+        chosen = _estimated_bytes(self.selection["chosen"], duration)
+        baseline = _estimated_bytes(self.selection["baseline"], duration)
+        saved = baseline - chosen if chosen is not None and baseline is not None else None
+        return chosen, baseline, saved
+
+
+def _estimated_bytes(fmt, duration):
+    if fmt is None:
+        return None
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return int(size)
+    bitrate = fmt.get("abr") or fmt.get("tbr")
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return None
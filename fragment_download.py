@@ -0,0 +1,286 @@
+"""
+Parallel fragment download engine.
+
+yt-dlp downloads a progressive YouTube m4a over one connection, which is often the slowest part of a locate.
+This engine takes the format yt-dlp selected (extract_info) and fetches it as many fragments in parallel:
+    - progressive http(s) formats with a known size are cut into byte ranges
+    - DASH formats use the fragment list yt-dlp found
+    - HLS media playlists (m3u8) are read and their segments fetched (encrypted playlists are not supported)
+The number of parallel requests is tuned while downloading: it keeps growing while the throughput grows,
+and is halved when many requests fail (the server is throttling us).
+
+Progress is reported through yt-dlp style progress hooks, so the existing tqdm hooks keep working;
+the dictionaries also carry the speed (bytes per second), the fragment retry count and the current concurrency.
+Nothing in here prints.
+"""
+
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class FragmentDownloadError(Exception):
+    """
+    A fragment could not be downloaded after all retries.
+    """
+
+
+class AdaptiveConcurrency:
+    """
+    Hill climbing on the number of parallel requests.
+
+    Every `interval` seconds the throughput is compared with the previous interval: while it improves by more than
+    `tolerance`, the concurrency keeps moving in the same direction; when it gets worse the direction is reversed.
+    When more than `error_tolerance` of the requests of an interval failed, the concurrency is halved
+    (occasional failures are only retried).
+
+    args:
+        initial: int, Starting number of parallel requests
+        minimum, maximum: int, Bounds of the number of parallel requests
+        interval: float, Seconds between two adjustments
+        tolerance: float, Relative throughput change considered significant
+        error_tolerance: float, Fraction of failed requests above which the concurrency is halved
+
+    methods:
+        update(total_bytes, requests, retries): Record the progress, adjust and return the number of parallel requests.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, interval=1.0, tolerance=0.1, error_tolerance=0.2):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.tolerance = tolerance
+        self.error_tolerance = error_tolerance
+        self.direction = 1
+        self.previous_throughput = None
+        self.last_time = time.perf_counter()
+        self.last_bytes = 0
+        self.last_requests = 0
+        self.last_retries = 0
+        self.history = []
+
+    def update(self, total_bytes, requests, retries):
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+        if elapsed < self.interval:
+            return self.limit
+        throughput = (total_bytes - self.last_bytes) / elapsed
+        failed = retries - self.last_retries
+        if failed > self.error_tolerance * max(1, requests - self.last_requests):
+            # Requests are failing: back off and probe upwards again from there
+            self.limit = max(self.minimum, self.limit // 2)
+            self.direction = 1
+            throughput = None
+        elif self.previous_throughput is not None:
+            if throughput < self.previous_throughput * (1 - self.tolerance):
+                self.direction = -self.direction
+                self.limit += self.direction
+            elif throughput > self.previous_throughput * (1 + self.tolerance):
+                self.limit += self.direction
+        else:
+            self.limit += self.direction
+        self.limit = max(self.minimum, min(self.limit, self.maximum))
+        self.previous_throughput = throughput
+        self.last_time, self.last_bytes, self.last_requests, self.last_retries = now, total_bytes, requests, retries
+        self.history.append(self.limit)
+        return self.limit
+
+
+class FragmentDownloader:
+    """
+    Download a list of fragments in parallel and write them, in order, to one file.
+
+    args:
+        initial_concurrency: int, Starting number of parallel requests
+        max_concurrency: int, Upper bound of the number of parallel requests
+        fragment_size: int, Bytes per range request when a progressive format is cut into byte ranges
+        retries: int, Attempts per fragment before the download fails
+        timeout: float, Socket timeout of each request in seconds
+        progress_hooks: List[callable(dict)], Receive yt-dlp style progress dictionaries
+
+    methods:
+        plan(info): Return the fragments of a format selected by yt-dlp, or None if it cannot be split.
+        download(fragments, path, total_bytes): Download the fragments into path, return the statistics.
+        download_info(info, path): plan + download, return the statistics or None if the format is not supported.
+    """
+
+    def __init__(self, initial_concurrency=4, max_concurrency=16, fragment_size=2 * 1024 * 1024, retries=5, timeout=30.0,
+                 progress_hooks=()):
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.fragment_size = fragment_size
+        self.retries = retries
+        self.timeout = timeout
+        self.progress_hooks = list(progress_hooks)
+        self.lock = threading.Lock()
+        self.retry_count = 0
+
+    def plan(self, info):
+        """
+        Return (fragments, total_bytes) for the format described by a yt-dlp info dictionary, or None.
+        Each fragment is a dictionary with url and headers (headers include the Range of byte range fragments).
+        """
+        if info.get("requested_formats") or info.get("is_live"):
+            # Separate video and audio streams are merged by yt-dlp, live streams have no end
+            return None
+        headers = dict(info.get("http_headers") or {})
+        protocol = info.get("protocol", "")
+        if protocol == "http_dash_segments" and info.get("fragments"):
+            base_url = info.get("fragment_base_url") or ""
+            fragments = [{"url": fragment.get("url") or urllib.parse.urljoin(base_url, fragment["path"]), "headers": headers}
+                         for fragment in info["fragments"]]
+            return fragments, None
+        if protocol in ("m3u8", "m3u8_native"):
+            urls = self.playlist_segments(info["url"], headers)
+            if urls is None:
+                return None
+            return [{"url": url, "headers": headers} for url in urls], None
+        if protocol in ("http", "https"):
+            total_bytes = info.get("filesize") or self.content_length(info["url"], headers)
+            if not total_bytes:
+                return None
+            fragments = []
+            for start in range(0, total_bytes, self.fragment_size):
+                end = min(start + self.fragment_size, total_bytes) - 1
+                fragments.append({"url": info["url"], "headers": {**headers, "Range": f"bytes={start}-{end}"},
+                                  "size": end - start + 1})
+            return fragments, total_bytes
+        return None
+
+    def content_length(self, url, headers):
+        request = urllib.request.Request(url, headers=headers, method="HEAD")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if response.headers.get("Accept-Ranges", "").lower() != "bytes":
+                    return None
+                return int(response.headers.get("Content-Length") or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def playlist_segments(self, url, headers):
+        """
+        Return the segment URLs of an HLS media playlist, or None for master or encrypted playlists.
+        """
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+            lines = response.read().decode("utf-8", "replace").splitlines()
+        urls = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith("#EXT-X-STREAM-INF") or (line.startswith("#EXT-X-KEY") and "METHOD=NONE" not in line):
+                return None
+            if line.startswith("#EXT-X-MAP"):
+                uri = line.split('URI="', 1)[1].split('"', 1)[0]
+                urls.append(urllib.parse.urljoin(url, uri))
+            elif line and not line.startswith("#"):
+                urls.append(urllib.parse.urljoin(url, line))
+        return urls or None
+
+    def fetch(self, fragment):
+        for attempt in range(self.retries):
+            try:
+                request = urllib.request.Request(fragment["url"], headers=fragment["headers"])
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    data = response.read()
+                if "size" in fragment and len(data) != fragment["size"]:
+                    raise FragmentDownloadError(f"Expected {fragment['size']} bytes, received {len(data)}")
+                return data
+            except (OSError, FragmentDownloadError) as e:
+                with self.lock:
+                    self.retry_count += 1
+                if attempt == self.retries - 1:
+                    raise FragmentDownloadError(f"{fragment['url']} : {e}") from e
+                time.sleep(min(0.5 * 2 ** attempt, 8.0))
+
+    def report(self, status):
+        for hook in self.progress_hooks:
+            hook(status)
+
+    def download(self, fragments, path, total_bytes=None):
+        """
+        Download the fragments into path and return the statistics:
+        bytes, seconds, speed (bytes per second), fragments, fragment_retries, concurrency (history of the adjustments).
+        """
+        controller = AdaptiveConcurrency(self.initial_concurrency, maximum=self.max_concurrency)
+        self.retry_count = 0
+        start_time = time.perf_counter()
+        done_bytes = 0
+        next_submit = 0
+        next_write = 0
+        completed = {}
+        running = {}
+        # Fragments are written in order, so only schedule a bounded distance ahead of the next one to write
+        window = 4 * self.max_concurrency
+        with open(path, "wb") as f, ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            try:
+                while next_write < len(fragments):
+                    while (next_submit < len(fragments) and len(running) < controller.limit
+                           and next_submit < next_write + window):
+                        running[executor.submit(self.fetch, fragments[next_submit])] = next_submit
+                        next_submit += 1
+                    finished, _ = wait(list(running), timeout=controller.interval, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        data = future.result()
+                        completed[running.pop(future)] = data
+                        done_bytes += len(data)
+                    while next_write in completed:
+                        f.write(completed.pop(next_write))
+                        next_write += 1
+                    controller.update(done_bytes, next_write + len(completed) + self.retry_count, self.retry_count)
+
+                    elapsed = time.perf_counter() - start_time
+                    if total_bytes:
+                        percent = 100.0 * done_bytes / total_bytes
+                    else:
+                        percent = 100.0 * next_write / len(fragments)
+                    self.report({
+                        "status": "downloading",
+                        "filename": path,
+                        "downloaded_bytes": done_bytes,
+                        "total_bytes": total_bytes,
+                        "_percent_str": f"{percent:5.1f}%",
+                        "speed": done_bytes / elapsed if elapsed > 0 else None,
+                        "fragment_index": next_write,
+                        "fragment_count": len(fragments),
+                        "fragment_retries": self.retry_count,
+                        "concurrency": controller.limit,
+                    })
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+
+        seconds = time.perf_counter() - start_time
+        stats = {
+            "bytes": done_bytes,
+            "seconds": seconds,
+            "speed": done_bytes / seconds if seconds > 0 else None,
+            "fragments": len(fragments),
+            "fragment_retries": self.retry_count,
+            "concurrency": controller.history,
+        }
+        self.report({"status": "finished", "filename": path, **stats})
+        return stats
+
+    def download_info(self, info, path):
+        """
+        Download the format described by a yt-dlp info dictionary into path.
+        Returns the statistics, or None if the format cannot be fetched in fragments or the download failed
+        (the caller then falls back to yt-dlp).
+        """
+        try:
+            planned = self.plan(info)
+            if planned is None:
+                return None
+            fragments, total_bytes = planned
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            return self.download(fragments, path, total_bytes)
+        except (OSError, ValueError, FragmentDownloadError):
+            if os.path.exists(path):
+                os.remove(path)
+            return None
@@ -0,0 +1,68 @@
+"""
+Bloom filter of the hashkeys of a query, tested before the reference pairs of a window are grouped for the vote.
+
+Most reference pairs have a hashkey the clip does not have, yet identify_pairs used to sort all of them. Testing
+them against a bit array of the clip hashkeys first is a few vectorized operations per pair and leaves only the
+pairs that can get a vote to be sorted. A Bloom filter has no false negatives, so the votes and the answer do not
+change; the price is the bit array (bits_per_key per distinct query hashkey) and the false positives that still
+reach the exact lookup. The filter pays off when the reference windows are much larger than the clip, and does
+nothing for a clip as long as the window.
+"""
+
+import numpy as np
+
+
+class HashFilter:
+    """
+    Bloom filter over packed hashkeys (fingerprint.pack_hashkey), built from the fingerprint of a query.
+
+    A reference window of a few minutes has tens of thousands of pairs, a 10 second clip a few thousand, so almost
+    every reference pair has a hashkey the clip does not have. FingerprintIdentifier.identify_pairs sorts and groups
+    the reference pairs by hashkey before voting; testing them against this filter first leaves out almost all of
+    the pairs that cannot get a vote, so only a few hundred are sorted. A Bloom filter never rejects a hashkey it
+    holds, the votes (and the answer) are exactly the same as without it; a few pairs pass that are not in the query
+    (false positives, at most about 1.5 percent of the misses with the defaults) and are dropped by the exact lookup.
+
+    The hashkeys of several queries can be put in one filter, which then serves all of them at once
+    (FingerprintIdentifier.identify_batch).
+
+    args:
+        hashes: ndarray or list of ndarray, Packed hashkeys of one query, or of every query of a batch
+        bits_per_key: int, Size of the bit array per distinct hashkey (rounded up to a power of two in total)
+        hash_count: int, Number of bits set per hashkey
+
+    methods:
+        contains(hashes): Boolean mask, False for the hashkeys that are certainly not in the filter.
+        nbytes(): Size of the bit array.
+    """
+
+    def __init__(self, hashes, bits_per_key=16, hash_count=2):
+        if isinstance(hashes, (list, tuple)):
+            hashes = np.concatenate([np.asarray(part, dtype=np.int64) for part in hashes]) if hashes else np.zeros(0, dtype=np.int64)
+        keys = np.unique(np.asarray(hashes, dtype=np.int64))
+        self.key_count = len(keys)
+        self.hash_count = hash_count
+        # At least 64 bits, a power of two so a bit index is the top bits of a 64 bit hash
+        self.bit_shift = np.uint64(64 - max(6, int(np.ceil(np.log2(max(1, len(keys) * bits_per_key))))))
+        bits = np.zeros(1 << (64 - int(self.bit_shift)), dtype=bool)
+        for index in self._bit_indices(keys):
+            bits[index] = True
+        self.bits = np.packbits(bits, bitorder="little")
+
+    def _bit_indices(self, keys):
+        # Double hashing: bit i of a key is h1 + i * h2, both taken from a multiplicative hash of the key
+        mixed = keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        first = mixed >> self.bit_shift
+        step = (((mixed ^ (mixed >> np.uint64(31))) * np.uint64(0xBF58476D1CE4E5B9)) >> self.bit_shift) | np.uint64(1)
+        mask = np.uint64((1 << (64 - int(self.bit_shift))) - 1)
+        return [((first + np.uint64(i) * step) & mask).astype(np.int64) for i in range(self.hash_count)]
+
+    def contains(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.int64)
+        passed = np.ones(len(hashes), dtype=bool)
+        for index in self._bit_indices(hashes):
+            passed &= ((self.bits[index >> 3] >> (index & 7).astype(np.uint8)) & 1).astype(bool)
+        return passed
+
+    def nbytes(self):
+        return self.bits.nbytes
@@ -0,0 +1,268 @@
+"""
+Importable API of HighlightLocator, for services that locate clips without the menus or a subprocess per query.
+
+    from highlightlocator import Locator, locate
+
+    result = locate("highlight.mp4", "https://www.twitch.tv/videos/123", start="1:05", end="1:20")
+    if result["found"]:
+        print(result["timestamp"], result["score"])
+
+    locator = Locator(min_count=10, scan_order="loudness")    # keep it, share it between threads
+    result = locator.locate(clip_array, "/data/vods")          # decoded clip at locator.sr, directory of originals
+
+The result is the dictionary of cli.py (found, offset_seconds, timestamp, score, window_plan, ...) plus
+"status" (found / not_found, or incomplete when the time_budget option ran out first), "timings" and "counters"
+of the call. Invalid inputs raise ValueError. With time_budget the search is anytime: it returns within the
+budget with the best match or best guess so far ("complete", "coverage", "confident", "best_guess"), and with
+checkpoint and a work_dir the next call continues the search.
+With compilation=True the clip is a whole highlight compilation and "clips" lists every clip located in it.
+The options are the ones of cli.py, with underscores: min_count, window_policy, scan_order, memory_budget,
+skip_low_information, stoplist, result_cache, no_result_cache, local_workers, time_budget, checkpoint, ...
+
+A Locator keeps what does not change between calls:
+    - the matcher is warmed up once (the first identification of a process is about 20 times slower),
+    - a stoplist file is loaded once and shared,
+    - the window plan of a clip is measured once per clip and matcher parameters,
+    - one result cache (result_cache.py) and one archive index (archive_index.py) are shared by every call.
+Every call works in its own temporary directory and records its own instrumentation, so concurrent calls
+from several threads do not interfere. Downloads still print their progress, like the menus.
+"""
+
+import argparse
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from archive_index import ArchiveIndex
+from cli import build_parser, classify_source, locate as locate_pipeline
+from fingerprint import FingerprintIdentifier
+from instrumentation import Instrumentation
+from locator import load_clip
+from main_en import download_sound_file
+from result_cache import ResultCache, clip_digest, default_cache_path
+from stoplist import HashStoplist
+from time_calculate import time_format
+from window_policy import WINDOW_POLICIES
+
+# Options of cli.py that only make sense on the command line
+_COMMAND_LINE_ONLY = ("clip", "original", "start", "end", "output", "report", "trace")
+
+
+def default_options():
+    """
+    Return the default search options (the defaults of cli.py) as a dictionary.
+    """
+    options = vars(build_parser().parse_args(["--clip", "", "--original", ""]))
+    for name in _COMMAND_LINE_ONLY:
+        del options[name]
+    return options
+
+
+def _seconds(value):
+    # Times may be given as seconds or as SS, MM:SS or HH:MM:SS strings
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return time_format.str_to_sec(value)
+
+
+class Locator:
+    """
+    Reusable, thread-safe entry point of the search.
+
+    args:
+        index: ArchiveIndex or str, Archive index (or its directory) searched by find(), optional
+        warm_up: bool, Run one small identification now, so the first call is not slower than the others
+        **options: Search options of cli.py (see default_options), used by every call unless a call overrides them
+
+    methods:
+        locate(clip, original, start, end, **options): Find the clip in an original (URL, file or directory).
+        find(clip, start, end, top): Find the clip in the archive index.
+        warm_up(): Run one small identification.
+        close(): Release the files of an archive index this Locator loaded from its directory.
+    """
+
+    def __init__(self, index=None, warm_up=True, **options):
+        self.options = self._options(default_options(), options)
+        self.sr = self.options.sr
+        self.stoplists = {}
+        self.window_plans = {}
+        self.lock = threading.Lock()
+        self.cache = None
+        if not self.options.no_result_cache and (self.options.result_cache or default_cache_path()):
+            self.cache = ResultCache(self.options.result_cache, ttl_seconds=self.options.result_cache_ttl * 24 * 3600)
+        self.index = ArchiveIndex.load(index) if isinstance(index, str) else index
+        # An index passed as an object belongs to the caller, who closes it
+        self.owns_index = isinstance(index, str)
+        if warm_up:
+            self.warm_up()
+
+    @staticmethod
+    def _options(base, options):
+        unknown = sorted(set(options) - set(base))
+        if unknown:
+            raise TypeError(f"Unknown options : {', '.join(unknown)}")
+        return argparse.Namespace(**{**base, **options})
+
+    def warm_up(self):
+        """
+        Identify one second of noise in three seconds of noise, which loads and initializes everything the
+        STFT, the peak detection and the voting use.
+        """
+        noise = np.random.default_rng(0).standard_normal(3 * self.sr).astype(np.float32)
+        analyzer = self._analyzer(self.options, None)
+        analyzer.identify(noise, noise[self.sr:2 * self.sr])
+
+    def _analyzer(self, options, instrumentation):
+        # FingerprintIdentifier only holds its parameters, so a new one per call costs nothing and keeps the
+        # instrumentation of concurrent calls apart; the stoplist file is loaded once and shared
+        stoplist = None
+        if options.stoplist:
+            with self.lock:
+                if options.stoplist not in self.stoplists:
+                    self.stoplists[options.stoplist] = HashStoplist.load(options.stoplist)
+                stoplist = self.stoplists[options.stoplist]
+        elif options.stream_stoplist is not None:
+            # A stream stoplist learns from the windows of one search, it cannot be shared
+            stoplist = HashStoplist(max_document_fraction=options.stream_stoplist)
+        return FingerprintIdentifier(
+            sr=options.sr,
+            n_fft=options.n_fft,
+            hop_length=options.hop_length,
+            peak_threshold=options.peak_threshold,
+            peak_neighborhood=options.peak_neighborhood,
+            fan_value_frames=options.fan_value_frames,
+            min_count=options.min_count,
+            max_peaks_per_frame=options.max_peaks_per_frame,
+            max_peaks_per_band=options.max_peaks_per_band,
+            max_targets_per_anchor=options.max_targets_per_anchor,
+            max_hash_occurrences=options.max_hash_occurrences,
+            stoplist=stoplist,
+            stoplist_mode=options.stoplist_mode,
+            query_seconds=options.query_seconds or None,
+            instrumentation=instrumentation,
+        )
+
+    def _plan_window(self, window_policy):
+        def plan(short_audio_array, short_voice_time, analyzer):
+            key = (clip_digest(short_audio_array), window_policy, tuple(sorted(analyzer.get_params().items())),
+                   analyzer.query_seconds)
+            with self.lock:
+                window_plan = self.window_plans.get(key)
+            if window_plan is None:
+                window_plan = WINDOW_POLICIES[window_policy]().plan(short_audio_array, short_voice_time, analyzer)
+                with self.lock:
+                    self.window_plans[key] = window_plan
+            return dict(window_plan)
+        return plan
+
+    def _inputs(self, clip, original, start, end, sr, whole=False):
+        start_time, end_time = _seconds(start), _seconds(end)
+        if start_time is not None and end_time is not None and (start_time < 0 or end_time <= start_time):
+            raise ValueError("Start time must be less than end time!")
+        if isinstance(clip, np.ndarray):
+            clip_type = "array"
+            clip = clip.astype(np.float32, copy=False)
+            if start_time is not None or end_time is not None:
+                clip = clip[int((start_time or 0) * sr):None if end_time is None else int(end_time * sr)]
+        else:
+            clip, clip_type = classify_source(clip)
+            # A section of a video needs its end, only a compilation is downloaded whole
+            if clip_type != "file" and end_time is None and not whole:
+                raise ValueError("The end of the clip range is required to download a section of a video")
+            if clip_type != "file" and end_time is not None:
+                start_time = start_time or 0
+        inputs = {"clip": clip, "clip_type": clip_type, "start_time": start_time, "end_time": end_time}
+        if original is not None:
+            inputs["original"], inputs["original_type"] = classify_source(original, allow_directory=True)
+        return inputs
+
+    def locate(self, clip, original, start=None, end=None, **options):
+        """
+        Find the clip in the original and return the result dictionary.
+        args:
+            clip: str or ndarray, Highlight URL, local media file, or the decoded clip at the sampling rate (sr option)
+            original: str, Original URL, local media file, or a directory of media files searched as a batch
+            start, end: float or str, Range of the clip in seconds (or SS, MM:SS, HH:MM:SS), the whole file if None;
+                required for URLs unless compilation is set
+            **options: Search options overriding the ones of this Locator for this call
+        """
+        args = self._options(vars(self.options), options)
+        if args.checkpoint and not args.work_dir:
+            raise ValueError("checkpoint needs a work_dir that is kept between the calls")
+        if args.time_budget is not None and args.time_budget <= 0:
+            raise ValueError(f"time_budget must be a positive number of seconds : {args.time_budget}")
+        if args.query_seconds < 0:
+            raise ValueError(f"query_seconds must not be negative : {args.query_seconds}")
+        inputs = self._inputs(clip, original, start, end, args.sr, whole=args.compilation)
+        instrumentation = Instrumentation()
+        created_work_dir = args.work_dir is None
+        # Every call gets its own working directory, parallel calls must not share the downloaded and split files
+        args.work_dir = tempfile.mkdtemp(prefix="highlightlocator_") if created_work_dir else args.work_dir
+        # The shared result cache, unless this call asks for another one
+        shared_cache = (args.result_cache, args.result_cache_ttl) == (self.options.result_cache, self.options.result_cache_ttl)
+        try:
+            result = locate_pipeline(args, inputs, instrumentation, analyzer=self._analyzer(args, instrumentation),
+                                     plan_window=self._plan_window(args.window_policy),
+                                     cache=self.cache if shared_cache else None)
+        finally:
+            if created_work_dir and not args.keep_files:
+                shutil.rmtree(args.work_dir, ignore_errors=True)
+        summary = instrumentation.report()
+        if result["found"]:
+            result["status"] = "found"
+        else:
+            result["status"] = "not_found" if result.get("complete", True) else "incomplete"
+        result["timings"] = {name: stats["total"] for name, stats in summary["spans"].items()}
+        result["timings"]["total"] = summary["wall_seconds"]
+        result["counters"] = summary["counters"]
+        return result
+
+    def find(self, clip, start=None, end=None, top=5, min_margin=2.0):
+        """
+        Find which video of the archive index contains the clip, see ArchiveIndex.query.
+        args:
+            clip: str or ndarray, Highlight URL, local media file, or the decoded clip at the sampling rate of the index
+            start, end: float or str, Range of the clip, as in locate
+            top: int, Number of candidates to return
+            min_margin: float, Required ratio between the best and the second best video
+        """
+        if self.index is None:
+            raise ValueError("This Locator has no archive index")
+        sr = self.index.analyzer.sr
+        inputs = self._inputs(clip, None, start, end, sr)
+        if inputs["clip_type"] == "array":
+            short_audio_array = inputs["clip"]
+        elif inputs["clip_type"] == "file":
+            short_audio_array, _ = load_clip(inputs["clip"], sr, inputs["start_time"], inputs["end_time"])
+        else:
+            work_dir = tempfile.mkdtemp(prefix="highlightlocator_")
+            try:
+                short_voice_path = download_sound_file(inputs["clip"], work_dir, 2, inputs["clip_type"],
+                                                       inputs["start_time"], inputs["end_time"])
+                short_audio_array, _ = load_clip(short_voice_path, sr)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        return self.index.query(short_audio_array, top=top, min_margin=min_margin)
+
+    def close(self):
+        if self.owns_index and self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+_shared_locator = None
+_shared_lock = threading.Lock()
+
+
+def locate(clip, original, start=None, end=None, **options):
+    """
+    Find the clip in the original with a Locator shared by every call of this function (warmed up on the first call).
+    See Locator.locate for the arguments.
+    """
+    global _shared_locator
+    with _shared_lock:
+        if _shared_locator is None:
+            _shared_locator = Locator()
+    return _shared_locator.locate(clip, original, start, end, **options)
@@ -0,0 +1,184 @@
+"""
+Persistent cache of the video information yt-dlp extracts, so a locate asks YouTube / Twitch only once.
+
+One locate used to call YoutubeDL.extract_info for the same video again and again: get_time_info for the duration,
+download_youtube_m4a / download_twitch_mp4 before the download and once more inside ydl.download, and
+download_youtube_section_m4a twice for the clip. Every call is a network round trip of a second or more that
+returns the same information. InfoCache keeps the raw result of one extraction (extract_info with process=False:
+the metadata and every format, before a format is selected) under the video ID, in memory and in one JSON file per
+video; download.Download selects its format and downloads from a copy of it (YoutubeDL.process_ie_result), so the
+methods of one Download, the Download objects of one run and the runs of the next hour share one extraction.
+
+Format URLs are signed and expire (YouTube ones after about 6 hours), so entries expire after ttl_seconds
+(1 hour by default), and Download extracts again once when a download from an older cached entry fails.
+Subtitles, thumbnails and the heatmap are not kept, they make up most of the size of a YouTube entry.
+
+The cache directory is ~/.cache/highlightlocator/info unless the environment variable HIGHLIGHTLOCATOR_INFO_CACHE
+gives another one; HIGHLIGHTLOCATOR_INFO_CACHE=off keeps the entries in memory only.
+Nothing in here prints.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+
+import yt_dlp
+
+from result_cache import original_identity
+
+# Environment variable holding the cache directory, or "off"
+CACHE_ENVIRONMENT_VARIABLE = "HIGHLIGHTLOCATOR_INFO_CACHE"
+
+# Parts of the information the downloads never use
+DROPPED_FIELDS = ("subtitles", "automatic_captions", "thumbnails", "heatmap")
+
+
+def default_cache_directory():
+    """
+    Return the cache directory, or None if the environment disables the files.
+    """
+    value = os.environ.get(CACHE_ENVIRONMENT_VARIABLE)
+    if value is not None and value.strip().lower() in ("", "0", "off", "no", "false"):
+        return None
+    return value or os.path.join(os.path.expanduser("~"), ".cache", "highlightlocator", "info")
+
+
+def info_key(url):
+    """
+    Return the cache key of a URL: "youtube:<video id>" or "twitch:<vod id>" (see result_cache.original_identity),
+    so the different URLs of one video share their entry.
+    """
+    return original_identity(url, "twitch" if "twitch.tv" in url else "youtube")
+
+
+def extract_raw_info(url):
+    """
+    Extract the information of a video without selecting a format, as a JSON serializable dictionary.
+    """
+    with yt_dlp.YoutubeDL({"quiet": True, "noprogress": True}) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Private keys hold callables (such as the comment extractor), they cannot be stored
+        info = {key: value for key, value in info.items() if not key.startswith("__") and key not in DROPPED_FIELDS}
+        return ydl.sanitize_info(info)
+
+
+class InfoCache:
+    """
+    Raw yt-dlp information of videos, kept in memory and on disk with a time-to-live.
+
+    args:
+        directory: str, Cache directory, default_cache_directory() if None (when that is None too, the entries are
+            only kept in memory)
+        ttl_seconds: float, Entries older than this are extracted again
+        extractor: callable(url) returning the information of a video, extract_raw_info if None
+            (a stub returning a fixed dictionary tests the cache without a network)
+
+    methods:
+        get(url): Return a copy of the information of the video, extracting it if no fresh entry is cached.
+        invalidate(url, min_age): Forget the entry of a video if it is at least min_age seconds old, return True if it was.
+        stats(): Return the hits (in memory and on disk), misses (extractions) and hit rate of this process.
+    """
+
+    def __init__(self, directory=None, ttl_seconds=3600, extractor=None):
+        self.directory = directory or default_cache_directory()
+        self.ttl_seconds = ttl_seconds
+        self.extractor = extractor or extract_raw_info
+        self.entries = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            # A missing or unreadable entry is a miss
+            return None
+        if not isinstance(entry, dict) or entry.get("key") != key:
+            return None
+        return entry
+
+    def _save(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temporary_path, path)
+
+    def _fresh(self, entry, now):
+        return entry is not None and now - entry["created"] <= self.ttl_seconds
+
+    def get(self, url):
+        key = info_key(url)
+        with self.lock:
+            now = time.time()
+            entry = self.entries.get(key)
+            if self._fresh(entry, now):
+                self.memory_hits += 1
+                return copy.deepcopy(entry["info"])
+            entry = self._load(key) if self.directory else None
+            if self._fresh(entry, now):
+                self.disk_hits += 1
+                self.entries[key] = entry
+                return copy.deepcopy(entry["info"])
+            self.misses += 1
+        # Extract outside the lock, a slow extraction must not hold up the other videos
+        info = self.extractor(url)
+        entry = {"key": key, "created": time.time(), "info": info}
+        with self.lock:
+            self.entries[key] = entry
+            if self.directory:
+                try:
+                    self._save(key, entry)
+                except OSError:
+                    # A read-only home directory only loses the entries of the next runs
+                    pass
+        return copy.deepcopy(info)
+
+    def invalidate(self, url, min_age=0.0):
+        key = info_key(url)
+        with self.lock:
+            entry = self.entries.get(key) or (self._load(key) if self.directory else None)
+            if entry is None or time.time() - entry["created"] < min_age:
+                return False
+            self.entries.pop(key, None)
+            if self.directory:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            return True
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "directory": self.directory,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_info_cache():
+    """
+    Return the InfoCache shared by every Download of this process (created on the first call).
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = InfoCache()
+        return _shared_cache
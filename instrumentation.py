@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# resource is only available on Unix, peak RSS is reported as None elsewhere
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Instrumentation:
+    """
+    Collect named timing spans and counters while the pipeline runs.
+
+    Spans measure how long each stage takes (download, split, decode, stft, peaks, hashing, voting, refine ...),
+    counters count the work done (windows, peaks, pairs, hash_hits ...).
+    The result can be written as a structured JSON report or as a Chrome trace
+    (open chrome://tracing or https://ui.perfetto.dev and load the file).
+
+    methods:
+        span(name, **args): Context manager that records how long the block takes.
+        count(name, value): Add value to the counter called name.
+        report(): Return the summary dictionary.
+        write_report(path): Write the summary as JSON.
+        write_chrome_trace(path): Write every span as a Chrome trace event.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.events.append((name, start, end, threading.get_ident(), args))
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def report(self):
+        """
+        Summarize the spans and counters.
+        real_time_factor is the number of seconds of audio searched per second of wall time,
+        it is only available when the audio_seconds counter has been set.
+        """
+        wall_seconds = time.perf_counter() - self.origin
+        spans = {}
+        for name, start, end, thread_id, args in self.events:
+            stats = spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += end - start
+            stats["max"] = max(stats["max"], end - start)
+        for stats in spans.values():
+            stats["mean"] = stats["total"] / stats["count"]
+
+        audio_seconds = self.counters.get("audio_seconds")
+        return {
+            "wall_seconds": wall_seconds,
+            "spans": spans,
+            "counters": dict(self.counters),
+            "peak_rss_mb": peak_rss_mb(),
+            "real_time_factor": audio_seconds / wall_seconds if audio_seconds and wall_seconds > 0 else None,
+        }
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": thread_id,
+                "args": args,
+            }
+            for name, start, end, thread_id, args in self.events
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+class NullInstrumentation:
+    """
+    Instrumentation with the same interface that records nothing.
+    Used as the default so the pipeline does not need to check whether instrumentation is enabled.
+    """
+
+    @contextmanager
+    def span(self, name, **args):
+        yield
+
+    def count(self, name, value=1):
+        pass
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident set size of this process in MB, or None if the platform does not report it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class RateLimitedProgress:
+    """
+    Print progress messages at most once every `interval` seconds.
+    Messages sent in between are dropped, except the ones sent with force=True.
+    args:
+        interval: float, Minimum number of seconds between two printed messages
+        write: callable, Function used to output a message (print by default)
+    """
+
+    def __init__(self, interval=1.0, write=print):
+        self.interval = interval
+        self.write = write
+        self.last_time = None
+
+    def update(self, message, force=False):
+        now = time.perf_counter()
+        if force or self.last_time is None or now - self.last_time >= self.interval:
+            self.last_time = now
+            self.write(message)
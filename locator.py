@@ -0,0 +1,505 @@
+"""
+Language independent core of the highlight search.
+The interactive menus (main.py / main_en.py) and the headless command line (cli.py) share this module,
+so nothing in here prints. Progress is reported through the optional `report` callback instead,
+and each caller prints the events in its own language.
+
+Events passed to report(event, data):
+    "window_start":  data has segment_index, seg_start, seg_end, global_start, global_end
+    "window_result": data has segment_index, seg_start, seg_end, global_start, global_end, is_match, best_count
+    "window_skipped": data has segment_index, seg_start, seg_end, global_start, global_end (low-information window)
+    "segment_end":   data has segment_index (no match in this split file)
+With a scan order (scan_order.py) window_start and window_result also carry the priority of the window,
+and the windows are not reported in time order. Windows already searched before a checkpoint (checkpoint.py)
+are not reported again.
+
+With a deadline the search is anytime: once the deadline has passed no new window is searched, and the result holds
+the best match or, without one, the best guess so far (the window position with the most votes), with the fraction
+of the long audio covered. Run again with the same checkpoint, the search continues where it stopped.
+"""
+
+import heapq
+import os
+import time
+
+import librosa
+
+from fingerprint import FingerprintIdentifier
+from hash_filter import HashFilter
+from instrumentation import NullInstrumentation
+from search_time import search_subclip
+from sliding_audio_split import SlidingWindowProcessor
+from time_calculate import time_format
+
+
+# Extensions of the local media files accepted as inputs (anything ffmpeg can decode works, the list only filters directories)
+MEDIA_EXTENSIONS = (".m4a", ".mp3", ".wav", ".flac", ".ogg", ".opus", ".aac", ".webm", ".mp4", ".mkv", ".mov", ".ts", ".flv")
+
+
+def list_media_files(directory):
+    """
+    Return the media files of a directory (not recursive), sorted by name.
+    args:
+        directory: str, Directory holding the original recordings
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(MEDIA_EXTENSIONS))
+    return [os.path.join(directory, name) for name in names if os.path.isfile(os.path.join(directory, name))]
+
+
+def segment_file_paths(output_prefix, long_voice_time, split_duration, extension="m4a"):
+    """
+    Return the paths of the split files produced by LargeAudioSplitter.split_audio_ffmpeg.
+    args:
+        output_prefix: str, Prefix path used when splitting, for example ./segment/segments
+        long_voice_time: float, Duration of the long audio in seconds
+        split_duration: int, Duration of each split file in seconds
+        extension: str, Extension of the split files
+    """
+    segment_count = int(long_voice_time // split_duration) + 1
+    return [f"{output_prefix}_{index:03d}.{extension}" for index in range(segment_count)]
+
+
+def split_long_audio(splitter, long_voice_path, long_voice_time, split_duration, output_prefix):
+    """
+    Split the long audio into files of split_duration seconds and return their paths in order.
+    The container of the source is kept so that the "-c copy" split stays valid,
+    and audio shorter than one split file is used as it is.
+    args:
+        splitter: LargeAudioSplitter, Splitter class of the caller's language
+        long_voice_path: str, Path of the long audio
+        long_voice_time: float, Duration of the long audio in seconds
+        split_duration: int, Duration of each split file in seconds
+        output_prefix: str, Prefix path for the split files, for example ./segment/segments
+    """
+    if long_voice_time < split_duration:
+        return [long_voice_path]
+    extension = os.path.splitext(long_voice_path)[1].lstrip(".") or "m4a"
+    splitter.split_audio_ffmpeg(long_voice_path, split_duration, output_prefix, extension)
+    return segment_file_paths(output_prefix, long_voice_time, split_duration, extension)
+
+
+def window_geometry(short_voice_time):
+    """
+    Return (segment_length, overlap) of the sliding window in seconds for a clip of the given duration.
+    args:
+        short_voice_time: float, Duration of the short audio in seconds
+    """
+    overlap = int(short_voice_time*2)               # Overlap area
+    if int(short_voice_time)>60:
+        segment_length = int(short_voice_time) * 6  # Segment length,The multiplier is tested and can be adjusted as needed
+    else:
+        segment_length = int(short_voice_time) *15  # Segment length,The multiplier is tested and can be adjusted as needed
+    return segment_length, overlap
+
+
+def load_clip(path, sr=16000, start_time=None, end_time=None):
+    """
+    Load the short audio from a local file, optionally trimmed to [start_time, end_time].
+    Returns the audio array and its duration in seconds.
+    args:
+        path: str, Path of the audio (or video) file
+        sr: int, Sampling rate
+        start_time: int, Start time of the clip in seconds, None loads from the beginning
+        end_time: int, End time of the clip in seconds, None loads until the end
+    """
+    offset = start_time or 0
+    duration = None if end_time is None else end_time - offset
+    short_audio_array, _ = librosa.load(path, sr=sr, offset=offset, duration=duration)
+    return short_audio_array, len(short_audio_array) / sr
+
+
+def search_long_audio(short_audio_array, short_voice_time, segment_paths, split_duration=3600, sr=16000, analyzer=None, report=None, instrumentation=None,
+                      low_information=None, geometry=None, scan_order=None, checkpoint=None, deadline=None):
+    """
+    Slide over every split file of the long audio and look for the short audio.
+    Returns a dictionary describing the result:
+        found: bool, True if a window matched
+        offset_seconds: float, Position of the short audio in the long audio (None if not found)
+        timestamp: str, offset_seconds formatted as HH:MM:SS (None if not found)
+        score: int, Best count of the matching window, or the highest best count seen if not found
+        segment_index: int, Index of the split file that matched (None if not found)
+        window: [seg_start, seg_end] of the matching window inside the split file (None if not found)
+        windows_searched: int, Number of windows compared
+        skipped_seconds: float, Seconds of low-information audio left out of the search
+        complete: bool, False if the deadline stopped the search before its end
+        coverage: float, Fraction of the long audio searched (windows resumed from the checkpoint and
+            low-information windows included; split files not decoded yet count as split_duration)
+        confident: bool, The result is a match that more searching would not change: the first match in time order,
+            a match reaching the confident count of the scan order, or the best match of a complete search
+        best_guess: {offset_seconds, timestamp, score} of the match, or without one of the window position with the
+            most votes so far (kept in the checkpoint across runs), None if no window was searched
+    args:
+        short_audio_array: ndarray, Short audio signal
+        short_voice_time: float, Duration of the short audio in seconds
+        segment_paths: List[str], Split files of the long audio in order
+        split_duration: int, Duration of each split file in seconds
+        sr: int, Sampling rate
+        analyzer: FingerprintIdentifier, Fingerprint recognizer, a default one is created if None
+        report: callable(event, data), Receives progress events, see the module docstring
+        instrumentation: Instrumentation, Receives the decode / identify / refine spans
+            and the windows / audio_seconds counters, nothing is recorded if None
+        low_information: LowInformationDetector, If given, silent and noise-only regions of every split file
+            are found first and left out of the search (the audio within short_voice_time of them is still searched)
+        geometry: (segment_length, overlap) of the sliding window in seconds, window_geometry(short_voice_time) if None
+        scan_order: LoudnessScanOrder, If given, the windows are searched in order of priority instead of from the start
+            (see scan_order.py); the window events then also carry the priority of the window
+        checkpoint: ScanCheckpoint, If given, every window without a match is recorded in it, and the windows
+            (and whole split files) it already holds are not searched again (see checkpoint.py)
+        deadline: float, time.monotonic() value after which no new window is searched, the search returns what it
+            has found so far with complete set to False
+    """
+    if instrumentation is None:
+        instrumentation = NullInstrumentation()
+    if analyzer is None:
+        analyzer = FingerprintIdentifier(sr=sr, instrumentation=instrumentation)
+    result = {
+        "found": False,
+        "offset_seconds": None,
+        "timestamp": None,
+        "score": 0,
+        "segment_index": None,
+        "window": None,
+        "windows_searched": 0,
+        "skipped_seconds": 0.0,
+        "complete": True,
+        "coverage": 0.0,
+        "confident": False,
+        "best_guess": None,
+    }
+    segment_length, overlap = geometry or window_geometry(short_voice_time)
+    if checkpoint is not None:
+        checkpoint.start_scan(split_duration, segment_length, overlap)
+    search = _WindowSearch(short_audio_array, short_voice_time, split_duration, sr, analyzer, report, instrumentation,
+                           low_information, segment_length, overlap, result, checkpoint, deadline)
+    try:
+        if scan_order is not None:
+            _prioritized_search(search, segment_paths, scan_order)
+        else:
+            _sequential_search(search, segment_paths)
+    finally:
+        if checkpoint is not None:
+            # The windows recorded since the last write are not lost when the search fails or is interrupted,
+            # and the next run starts from the best guess of this one
+            if search.best_guess is not None:
+                checkpoint.set("best_guess", search.best_guess)
+            else:
+                checkpoint.save()
+
+    result["complete"] = not search.stopped
+    segment_count = len(segment_paths)
+    if segment_count > 1 and not os.path.exists(segment_paths[-1]):
+        segment_count -= 1
+    result["coverage"] = 1.0 if result["complete"] and not result["found"] else search.coverage(segment_count)
+    if result["found"]:
+        result["best_guess"] = {name: result[name] for name in ("offset_seconds", "timestamp", "score")}
+    else:
+        result["best_guess"] = search.best_guess
+    if search.stopped:
+        search.instrumentation.count("deadline_stops")
+    return result
+
+
+def _sequential_search(search, segment_paths):
+    """
+    Search the windows of every split file from the start, return at the first match.
+    """
+    result, checkpoint = search.result, search.checkpoint
+    for segment_index, segment_path in enumerate(segment_paths):
+        # The duration reported before the split can round up to one split file that ffmpeg never wrote
+        if segment_index == len(segment_paths) - 1 and segment_index > 0 and not os.path.exists(segment_path):
+            break
+        # A split file searched to the end before the checkpoint is not decoded again
+        if checkpoint is not None and checkpoint.segment_done(segment_index):
+            search.instrumentation.count("segments_resumed")
+            search.covered_seconds += search.split_duration
+            continue
+        if search.out_of_time():
+            return result
+        long_audio_array, regions = search.load_segment(segment_index, segment_path)
+        for window in search.windows(len(long_audio_array) / search.sr):
+            outcome = search.search_window(segment_index, long_audio_array, 0, regions, window)
+            if search.stopped:
+                return result
+            if outcome is not None and outcome[0]:
+                result.update(search.refine(segment_index, long_audio_array, 0, window, outcome[1]))
+                result["confident"] = True
+                return result
+        if checkpoint is not None:
+            checkpoint.record_segment(segment_index)
+        if search.report:
+            search.report("segment_end", {"segment_index": segment_index})
+
+    return result
+
+
+class _WindowSearch:
+    """
+    The steps of search_long_audio shared by the sequential and the prioritized scan order:
+    decoding a split file, listing its windows, searching one window and refining a match.
+    Windows are (current_start, seg_start, seg_end, advance) in seconds from the start of the split file, advance is
+    the audio the window moves the search forward by. The audio passed to search_window / refine covers the split
+    file from audio_start seconds on.
+    """
+
+    def __init__(self, short_audio_array, short_voice_time, split_duration, sr, analyzer, report, instrumentation,
+                 low_information, segment_length, overlap, result, checkpoint=None, deadline=None):
+        self.short_audio_array = short_audio_array
+        self.short_voice_time = short_voice_time
+        self.split_duration = split_duration
+        self.sr = sr
+        self.analyzer = analyzer
+        self.report = report
+        self.instrumentation = instrumentation
+        self.low_information = low_information
+        self.segment_length = segment_length
+        self.overlap = overlap
+        self.result = result
+        self.checkpoint = checkpoint
+        self.deadline = deadline
+        self.stopped = False
+        # Seconds of audio covered by the visited windows, and the duration of every decoded split file
+        self.covered_seconds = 0.0
+        self.segment_seconds = {}
+        # Window position with the most votes so far, continued from the checkpoint
+        self.best_guess = checkpoint.get("best_guess") if checkpoint is not None else None
+        # The clip is fingerprinted once, not once per window
+        self.sample_pairs = analyzer.query_pairs(short_audio_array)
+        self.hash_filter = HashFilter(self.sample_pairs[0]) if analyzer.prefilter else None
+
+    def out_of_time(self):
+        """
+        Return True (and stop the search) once the deadline has passed.
+        """
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stopped = True
+        return self.stopped
+
+    def coverage(self, segment_count):
+        total = sum(self.segment_seconds.get(index, self.split_duration) for index in range(segment_count))
+        return min(1.0, self.covered_seconds / total) if total else 0.0
+
+    def decode(self, segment_index, segment_path):
+        with self.instrumentation.span("decode", segment_index=segment_index):
+            long_audio_array, _ = librosa.load(segment_path, sr=self.sr)
+        self.segment_seconds[segment_index] = len(long_audio_array) / self.sr
+        return long_audio_array
+
+    def load_segment(self, segment_index, segment_path):
+        """
+        Decode a split file and find its low-information regions, return (audio, regions).
+        """
+        long_audio_array = self.decode(segment_index, segment_path)
+        regions = []
+        if self.low_information is not None:
+            with self.instrumentation.span("low_information", segment_index=segment_index):
+                regions = self.low_information.find_regions(long_audio_array, self.sr)
+            skipped_seconds = sum(max(0, end - start - 2 * self.short_voice_time) for start, end in regions)
+            self.result["skipped_seconds"] += skipped_seconds
+            self.instrumentation.count("skipped_seconds", skipped_seconds)
+        return long_audio_array, regions
+
+    def windows(self, segment_time):
+        windows = []
+        current_start = 0
+        while current_start < segment_time:
+            # The current start time minus the overlap area represents the start point,
+            # and the current start time plus the segment length plus the overlap area gives the end point of the query time range
+            seg_start = max(current_start-self.overlap, 0)
+            seg_end   = min(current_start + self.segment_length + self.overlap, segment_time)
+            if seg_start >= seg_end:
+                break
+            windows.append((current_start, seg_start, seg_end, min(self.segment_length, segment_time - current_start)))
+            current_start += self.segment_length
+        return windows
+
+    def event(self, segment_index, seg_start, seg_end, **data):
+        return {
+            "segment_index": segment_index,
+            "seg_start": seg_start,
+            "seg_end": seg_end,
+            "global_start": segment_index*self.split_duration+seg_start,
+            "global_end": segment_index*self.split_duration+seg_end,
+            **data,
+        }
+
+    def search_window(self, segment_index, audio, audio_start, regions, window, **data):
+        """
+        Search one window, return (is_match, best_count), or None if the whole window is low-information
+        or the deadline has passed (stopped is then True). data is added to the window_start / window_result events.
+        """
+        current_start, seg_start, seg_end, advance = window
+        sr = self.sr
+        if self.checkpoint is not None:
+            best_count = self.checkpoint.window_count(segment_index, seg_start)
+            if best_count is not None:
+                # Searched without a match before the checkpoint
+                self.instrumentation.count("windows_resumed")
+                self.result["score"] = max(self.result["score"], best_count)
+                self.covered_seconds += advance
+                return False, best_count
+        if self.out_of_time():
+            return None
+        # Leave the low-information parts of the window out of the search
+        search_start, search_end, gaps = seg_start, seg_end, []
+        if regions:
+            plan = self.low_information.window_plan(regions, seg_start, seg_end, self.short_voice_time)
+            if plan is None:
+                self.covered_seconds += advance
+                self.instrumentation.count("windows_skipped")
+                if self.report:
+                    self.report("window_skipped", self.event(segment_index, seg_start, seg_end))
+                return None
+            search_start, search_end, gaps = plan
+
+        if self.report:
+            self.report("window_start", self.event(segment_index, seg_start, seg_end, **data))
+
+        window_audio_array = SlidingWindowProcessor.split_audio(audio, search_start - audio_start, search_end - audio_start, sr)
+        if gaps:
+            # Silence the skipped ranges inside the window, they produce no peaks and keep the time axis intact
+            window_audio_array = window_audio_array.copy()
+            for gap_start, gap_end in gaps:
+                window_audio_array[int((gap_start - search_start) * sr):int((gap_end - search_start) * sr)] = 0
+        with self.instrumentation.span("identify", segment_index=segment_index, seg_start=seg_start):
+            is_match, best_count, best_offset = self.analyzer.identify_pairs(window_audio_array, self.sample_pairs, self.hash_filter)
+        self.result["windows_searched"] += 1
+        self.covered_seconds += advance
+        if best_offset is not None and (self.best_guess is None or best_count > self.best_guess["score"]):
+            guess_seconds = segment_index*self.split_duration + search_start + best_offset*self.analyzer.hop_length/sr
+            self.best_guess = {"offset_seconds": float(guess_seconds), "timestamp": time_format.sec_to_time(int(guess_seconds)),
+                               "score": int(best_count)}
+        self.instrumentation.count("windows")
+        self.instrumentation.count("audio_seconds", advance)
+        self.result["score"] = max(self.result["score"], best_count)
+        if self.checkpoint is not None and not is_match:
+            self.checkpoint.record_window(segment_index, seg_start, best_count)
+        if self.report:
+            self.report("window_result", self.event(segment_index, seg_start, seg_end, is_match=is_match, best_count=best_count, **data))
+        return is_match, best_count
+
+    def refine(self, segment_index, audio, audio_start, window, best_count):
+        """
+        Find the exact position of the clip in a matching window, return the result fields of the match.
+        """
+        _, seg_start, seg_end, _ = window
+        with self.instrumentation.span("refine"):
+            # Refine on the untouched window, the clip may begin in audio that was left out of the vote
+            full_window_array = SlidingWindowProcessor.split_audio(audio, seg_start - audio_start, seg_end - audio_start, self.sr)
+            offset_in_seg = search_subclip.find_offset(full_window_array, self.sr, self.short_audio_array, 10)
+        global_offset_sec = segment_index*self.split_duration+seg_start + offset_in_seg
+        return {
+            "found": True,
+            "offset_seconds": float(global_offset_sec),
+            "timestamp": time_format.sec_to_time(int(global_offset_sec)),
+            "score": best_count,
+            "segment_index": segment_index,
+            "window": [seg_start, seg_end],
+        }
+
+
+def _prioritized_search(search, segment_paths, scan_order):
+    """
+    Search the windows of every split file in order of priority (scan_order.window_priorities):
+        1) Decode every split file once, compute the priority of its windows and keep the audio of the highest
+           priority windows, scan_order.cache_seconds in total. The last split file stays decoded.
+        2) Search the kept windows, highest priority first.
+        3) Search the other windows split file by split file (the one still decoded first, then by their best
+           priority), highest priority first.
+    Every window is searched once unless a match reaches the confident count, which stops the search.
+    Weaker matches are kept and the one with the highest score is returned. The deadline is checked before
+    every split file is decoded and before every window, so step 1 alone can use up a short one.
+    A split file whose windows were all searched without a match is recorded in the checkpoint, a resumed search
+    does not decode it again.
+    """
+    result, checkpoint = search.result, search.checkpoint
+    sr = search.sr
+    confident_count = scan_order.confident_count or search.analyzer.min_count
+    segments = []
+    cache = []
+    cached_seconds = 0.0
+    loaded_index, loaded_audio = None, None
+    for segment_index, segment_path in enumerate(segment_paths):
+        # The duration reported before the split can round up to one split file that ffmpeg never wrote
+        if segment_index == len(segment_paths) - 1 and segment_index > 0 and not os.path.exists(segment_path):
+            break
+        # A split file searched to the end before the checkpoint is not decoded again, it has no windows left
+        if checkpoint is not None and checkpoint.segment_done(segment_index):
+            search.instrumentation.count("segments_resumed")
+            search.covered_seconds += search.split_duration
+            segments.append((segment_path, [], [], []))
+            continue
+        if search.out_of_time():
+            break
+        loaded_audio = None
+        long_audio_array, regions = search.load_segment(segment_index, segment_path)
+        windows = search.windows(len(long_audio_array) / sr)
+        with search.instrumentation.span("scan_order", segment_index=segment_index):
+            priorities = scan_order.window_priorities(long_audio_array, sr, windows)
+        segments.append((segment_path, regions, windows, priorities))
+        for window_index, (window, priority) in enumerate(zip(windows, priorities)):
+            seconds = window[2] - window[1]
+            if cached_seconds + seconds > scan_order.cache_seconds and (not cache or cache[0][0] >= priority):
+                continue
+            # Keep a copy, so the split file itself can be released
+            audio = long_audio_array[int(window[1] * sr):int(window[2] * sr)].copy()
+            heapq.heappush(cache, (priority, -segment_index, -window_index, audio))
+            cached_seconds += seconds
+            while cached_seconds > scan_order.cache_seconds and len(cache) > 1:
+                _, evicted_segment, evicted_window, _ = heapq.heappop(cache)
+                evicted = segments[-evicted_segment][2][-evicted_window]
+                cached_seconds -= evicted[2] - evicted[1]
+        loaded_index, loaded_audio = segment_index, long_audio_array
+
+    searched = set()
+    matched_segments = set()
+    best_match = None
+
+    def visit(segment_index, window_index, audio, audio_start):
+        # Search one window, return True if the search can stop
+        nonlocal best_match
+        searched.add((segment_index, window_index))
+        _, regions, windows, priorities = segments[segment_index]
+        window = windows[window_index]
+        outcome = search.search_window(segment_index, audio, audio_start, regions, window, priority=priorities[window_index])
+        if outcome is None or not outcome[0]:
+            return search.stopped
+        matched_segments.add(segment_index)
+        if best_match is None or outcome[1] > best_match["score"]:
+            best_match = search.refine(segment_index, audio, audio_start, window, outcome[1])
+        return outcome[1] >= confident_count
+
+    stop = search.stopped
+    for priority, segment_index, window_index, audio in sorted(cache, key=lambda item: (-item[0], -item[1], -item[2])):
+        window = segments[-segment_index][2][-window_index]
+        if visit(-segment_index, -window_index, audio, window[1]):
+            stop = True
+            break
+    cache = None
+
+    if not stop:
+        order = sorted(range(len(segments)), key=lambda index: (index != loaded_index, -max(segments[index][3], default=-100.0), index))
+        for segment_index in order:
+            segment_path, regions, windows, priorities = segments[segment_index]
+            remaining = [index for index in range(len(windows)) if (segment_index, index) not in searched]
+            if remaining and search.out_of_time():
+                break
+            if remaining:
+                audio = loaded_audio if segment_index == loaded_index else search.decode(segment_index, segment_path)
+                for window_index in sorted(remaining, key=lambda index: (-priorities[index], index)):
+                    if visit(segment_index, window_index, audio, 0):
+                        stop = True
+                        break
+            if stop:
+                break
+            # Matching windows are not recorded, a split file holding one is searched again on resume
+            if checkpoint is not None and windows and segment_index not in matched_segments:
+                checkpoint.record_segment(segment_index)
+            if search.report:
+                search.report("segment_end", {"segment_index": segment_index})
+            if segment_index == loaded_index:
+                loaded_audio = None
+
+    if best_match is not None:
+        result.update(best_match)
+        result["confident"] = best_match["score"] >= confident_count or not search.stopped
+    return result
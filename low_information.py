@@ -0,0 +1,92 @@
+"""
+Cheap pre-pass that marks the low-information regions of a long audio: silence, AFK screens with only
+a noise floor and near-constant noise. These regions produce no useful fingerprint, so the sliding
+window search can leave them out instead of running STFT, peak detection and matching over them.
+"""
+
+import librosa
+import numpy as np
+
+
+class LowInformationDetector:
+    """
+    Find the low-information regions of an audio signal.
+
+    A frame is low-information if its RMS level is below silence_db (dBFS), or if its spectrum is flat
+    like noise (spectral flatness above flatness_threshold; music and speech are far below it).
+    Only runs of such frames lasting at least min_seconds become regions.
+
+    args:
+        frame_seconds: float, Analysis frame length in seconds
+        silence_db: float, Frames quieter than this level (dBFS) are silent
+        flatness_threshold: float, Frames flatter than this are noise
+        min_seconds: float, Shorter low-information runs are kept as normal audio
+
+    methods:
+        find_regions(audio, sr): Return the low-information regions as [(start_sec, end_sec), ...].
+        window_plan(regions, seg_start, seg_end, guard): Decide how a sliding window should be searched.
+    """
+
+    def __init__(self, frame_seconds=0.5, silence_db=-50.0, flatness_threshold=0.5, min_seconds=5.0):
+        self.frame_seconds = frame_seconds
+        self.silence_db = silence_db
+        self.flatness_threshold = flatness_threshold
+        self.min_seconds = min_seconds
+
+    def find_regions(self, audio, sr):
+        frame_length = max(1, int(self.frame_seconds * sr))
+        frame_count = len(audio) // frame_length
+        if frame_count == 0:
+            return []
+        frames = audio[:frame_count * frame_length].reshape(frame_count, frame_length)
+
+        # Energy: RMS level of each frame in dBFS
+        rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+        rms_db = 20 * np.log10(rms + 1e-10)
+
+        # Spectral flatness of short FFT frames, averaged over the analysis frame they fall in
+        n_fft = 512
+        flatness = librosa.feature.spectral_flatness(y=audio[:frame_count * frame_length], n_fft=n_fft,
+                                                     hop_length=n_fft, center=False)[0]
+        owner = np.minimum(np.arange(len(flatness)) * n_fft // frame_length, frame_count - 1)
+        frame_flatness = np.bincount(owner, weights=flatness, minlength=frame_count) / np.maximum(
+            np.bincount(owner, minlength=frame_count), 1)
+
+        low = (rms_db < self.silence_db) | (frame_flatness > self.flatness_threshold)
+
+        # Turn runs of low-information frames into regions
+        regions = []
+        edges = np.flatnonzero(np.diff(np.r_[0, low.astype(np.int8), 0]))
+        for run_start, run_end in zip(edges[::2], edges[1::2]):
+            start = run_start * self.frame_seconds
+            end = run_end * self.frame_seconds
+            if end - start >= self.min_seconds:
+                regions.append((start, end))
+        return regions
+
+    def window_plan(self, regions, seg_start, seg_end, guard):
+        """
+        Decide how to search the window [seg_start, seg_end].
+        Each region is first shrunk by `guard` seconds on both sides, so the audio right next to a skipped region
+        (where a clip may start or end) is always searched.
+        Returns None if the whole window can be skipped, otherwise (search_start, search_end, gaps) where
+        search_start/search_end trim the skipped ends and gaps are the skipped ranges left inside the window.
+        args:
+            regions: List[Tuple[float, float]], Result of find_regions
+            seg_start, seg_end: float, Window in seconds
+            guard: float, Seconds kept searchable on each side of a region (use the clip length)
+        """
+        gaps = []
+        for start, end in regions:
+            start, end = max(start + guard, seg_start), min(end - guard, seg_end)
+            if start < end:
+                gaps.append((start, end))
+        if not gaps:
+            return seg_start, seg_end, []
+        if gaps[0][0] <= seg_start:
+            seg_start = gaps.pop(0)[1]
+        if gaps and gaps[-1][1] >= seg_end:
+            seg_end = gaps.pop()[0]
+        if seg_start >= seg_end:
+            return None
+        return seg_start, seg_end, gaps
@@ -1,3 +1,4 @@
+import os
 import pathlib
 import librosa
 import warnings
@@ -5,10 +6,15 @@ import re
 import shutil
 import time
 
+from checkpoint import ScanCheckpoint
+from compilation import index_originals, locate_compilation
 from download_en import Download
 from fingerprint import FingerprintIdentifier
-from search_time import search_subclip
-from sliding_audio_split import SlidingWindowProcessor
+from instrumentation import RateLimitedProgress, peak_rss_mb
+from locator import list_media_files, load_clip, search_long_audio, split_long_audio
+from resource_governor import ResourceGovernor
+from result_cache import ResultCache, cache_key, original_identity, search_params
+from window_policy import FixedWindowPolicy
 from time_calculate import time_format
 from split_audio_large_segments_en import LargeAudioSplitter
 from convert_to_m4a_en import Mp4ToM4aConverter
@@ -16,6 +22,9 @@ from convert_to_m4a_en import Mp4ToM4aConverter
 class RangeError(Exception):
     pass
 
+# Progress of an interrupted search, the downloaded and split files are kept with it
+CHECKPOINT_PATH = "./checkpoint.json"
+
 def download_sound_file(url, output_path, process_type, url_type,start_time=None, end_time=None):
     """
     Download the audio file based on the URL and process type.
@@ -108,22 +117,27 @@ def get_valid_number(prompt, default=None, min_value=None, max_value=None):
         except RangeError as e:
             print(f"Invalid input:{e}")
 
-def get_url(prompt):
+def get_url(prompt, allow_directory=False):
     """
-    Prompt the user to enter the URL and re-prompt if the input is invalid.
-    Finally, return the URL and the type of URL (twitch or youtube).
+    Prompt the user to enter the URL or a local path and re-prompt if the input is invalid.
+    Finally, return the URL (or path) and its type (twitch, youtube, file or directory).
     args:
         prompt: str, Message to prompt the user
+        allow_directory: bool, Also accept a directory, whose media files are searched one after another
     """
     while True:
-        url = input(prompt)
-        # Check if the URL is from YouTube or Twitch. If it isn't, ask the user to re-enter.
+        url = input(prompt).strip().strip('"\'')
+        # Check if the URL is from YouTube or Twitch, or a local file. If it isn't, ask the user to re-enter.
         if is_valid_twitch_url(url):
             return url.split('&')[0], "twitch"
         elif is_valid_youtube_url(url):
             return url.split('&')[0], "youtube"
+        elif os.path.isfile(url):
+            return url, "file"
+        elif allow_directory and os.path.isdir(url) and list_media_files(url):
+            return url, "directory"
         else:
-            print("Invalid input. Please re-enter a valid URL.")    
+            print("Invalid input. Please re-enter a valid URL or an existing file path.")    
 
 def is_valid_twitch_url(url):
     """
@@ -149,123 +163,252 @@ def is_valid_youtube_url(url):
     )
     return bool(youtube_regex.match(url))
 
+# Per-window lines are rate limited so that printing does not slow down the search, a match is always printed
+search_progress = RateLimitedProgress(interval=1.0)
+
+def report_search_progress(event, data):
+    """
+    Print the progress events of locator.search_long_audio.
+    args:
+        event: str, Event name (window_start, window_result or segment_end)
+        data: dict, Event details
+    """
+    if event == "window_result":
+        is_match, best_count = data["is_match"], data["best_count"]
+        search_progress.update(f"Query time range : {time_format.sec_to_time(data['global_start'])} ~ {time_format.sec_to_time(data['global_end'])} , Match : {is_match}, Best count : {best_count}", force=is_match)
+        if is_match:
+            print("This fragment matches\n")
+    elif event == "segment_end":
+        # If no match is found, output a message
+        print("No matching segment found in this split file, loading the next segment...")
+
+def search_original(short_audio_array, short_voice_time, long_voice_path, long_voice_time, set_sr, anlyzer, window_plan, checkpoint=None):
+    """
+    Split one original (long) audio file and slide the short audio over it.
+    Returns the result dictionary of locator.search_long_audio.
+    args:
+        short_audio_array: ndarray, Short audio signal
+        short_voice_time: float, Duration of the short audio in seconds
+        long_voice_path: str, Path of the long audio
+        long_voice_time: float, Duration of the long audio in seconds
+        set_sr: int, Sampling rate
+        anlyzer: FingerprintIdentifier, Fingerprint recognizer shared by every window
+        window_plan: dict, Sliding window chosen by the window policy (see window_policy.py)
+        checkpoint: ScanCheckpoint, Progress of this search, the split files and searched windows it holds are reused
+    """
+    # One hour split files, unless the container has a memory limit: the split files and the sliding window are then
+    # chosen to fit it. The free memory of a machine changes from run to run, the split files would change with it
+    governor = ResourceGovernor(cpu_count=1, sr=set_sr, source_sr=librosa.get_samplerate(long_voice_path))
+    plan = None
+    geometry = (window_plan["segment_length"], window_plan["overlap"])
+    if governor.budget_source in ("cgroup v2", "cgroup v1"):
+        # A resumed search keeps its plan, a new one could change the split files and the windows
+        plan = checkpoint.get("memory_plan") if checkpoint else None
+        if plan is None:
+            plan = governor.plan(short_voice_time, long_voice_time, geometry=geometry)
+            if checkpoint:
+                checkpoint.set("memory_plan", plan)
+        print(f"Memory plan : split files of {plan['split_duration']} seconds, window of {plan['segment_length']} seconds, predicted peak {plan['predicted_peak_mb']:.0f} MB (budget {plan['memory_budget_mb']:.0f} MB, {plan['budget_source']})")
+        if not plan["fits"]:
+            print(f"Warning : even the smallest split files and window are predicted to use {plan['predicted_peak_mb']:.0f} MB, more than the memory budget of {plan['memory_budget_mb']:.0f} MB")
+        geometry = (plan["segment_length"], plan["overlap"])
+    split_duration = plan["split_duration"] if plan is not None else 3600
+    # The output files will be saved in the 'segment' folder, with each segment automatically numbered.
+    segment_paths = checkpoint.segments(split_duration) if checkpoint else None
+    if segment_paths is None:
+        segment_paths = split_long_audio(LargeAudioSplitter, long_voice_path, long_voice_time, split_duration, "./segment/segments")
+        if checkpoint:
+            checkpoint.record_segments(segment_paths, split_duration)
+
+    # 2) ~ 5) Sliding detection over every split file, progress is printed by report_search_progress
+    result = search_long_audio(short_audio_array, short_voice_time, segment_paths, split_duration, set_sr, anlyzer, report_search_progress,
+                               geometry=geometry, checkpoint=checkpoint)
+    actual_peak_mb = peak_rss_mb()
+    if actual_peak_mb is not None and plan is not None:
+        print(f"Peak memory : {actual_peak_mb:.0f} MB (predicted {plan['predicted_peak_mb']:.0f} MB)")
+    elif actual_peak_mb is not None:
+        print(f"Peak memory : {actual_peak_mb:.0f} MB")
+    return result
+
 def process_audio(short_voice_url, long_voice_url, start_time, end_time,short_url_source,long_url_source):
     """
     Segment detection using a "sliding window" approach:
-    1) Download: short audio (trimmed from start_time to end_time) & long audio
+    1) Download: short audio (trimmed from start_time to end_time) & long audio, local files are used as they are
     2) Generate short fingerprint
     3) Set segment_length, step_size => sliding window
     4) Segment the long audio [seg_start, seg_end], and calculate fingerprint
     5) fingerprint => compare => if determined to contain, find_offset => return time
+    When the long audio is a directory, every media file in it is searched in turn.
+    A match found by an earlier query is answered from the result cache (result_cache.py) without searching again.
+    The progress is checkpointed (checkpoint.py): an interrupted search keeps its files and resumes where it stopped.
     args:
-        short_voice_url: str, Short audio URL
-        long_voice_url: str, Long audio URL
+        short_voice_url: str, Short audio URL or local file
+        long_voice_url: str, Long audio URL, local file or directory
         start_time: int, Short audio start time
         end_time: int, Short audio end time
-        short_url_resource: str, Short audio source (twitch or youtube)
-        long_url_resource: str, Long audio source (twitch or youtube)
+        short_url_resource: str, Short audio source (twitch, youtube or file)
+        long_url_resource: str, Long audio source (twitch, youtube, file or directory)
     """
     # Record the start time of the process
     process_start_time=time.time()
     # Set the output path for the downloaded audio files
     download_file_output_path="./audio"
+    downloaded = False
+    checkpoint = None
     try:
-        # 1) Download the short audio and get its duration
-        short_voice_path = download_sound_file(short_voice_url, download_file_output_path, 2,short_url_source ,start_time, end_time)
-        short_voice_time = librosa.get_duration(path=short_voice_path)
-
-        # Download the long audio and get its duration
-        long_voice_time = Download(long_voice_url, download_file_output_path).get_time_info()
-        long_voice_path = download_sound_file(long_voice_url, download_file_output_path, 1,long_url_source)
-
-        # Load the file and get the audio array
+        # 1) Download the short audio, a local file is trimmed while loading it
         set_sr=16000
-        short_audio_array, _ = librosa.load(short_voice_path, sr=set_sr)
-
-        # Divide the original audio file into several large files, with each file being one hour long.
-        split_duration = 3600
-        spilt_segment_index_start=0 
-        spilt_segment_index_end=(long_voice_time//split_duration)+1
-        # The output files will be saved in the 'segment' folder, with each segment automatically numbered.
-        LargeAudioSplitter.split_audio_ffmpeg(long_voice_path, split_duration, "./segment/segments")
-
-        # The fingerprint recognizer only needs to be initialized once, so it should be placed outside the loop
-        anlyzer = FingerprintIdentifier()          
-
-        while spilt_segment_index_start<spilt_segment_index_end:
-
-            spilt_long_voice_path=f"./segment/segments_{spilt_segment_index_start:03d}.m4a"
-
-            long_audio_array, _ = librosa.load(spilt_long_voice_path, sr=set_sr)
-            spilt_long_voice_time = librosa.get_duration(path=spilt_long_voice_path)
-
-            # 2) Set sliding detection parameters
-            overlap = int(short_voice_time*2)               # Overlap area
-            if int(short_voice_time)>60:              
-                segment_length = int(short_voice_time) * 6  # Segment length,The multiplier is tested and can be adjusted as needed
+        if short_url_source == "file":
+            short_audio_array, short_voice_time = load_clip(short_voice_url, set_sr, start_time, end_time)
+        else:
+            downloaded = True
+            short_voice_path = download_sound_file(short_voice_url, download_file_output_path, 2,short_url_source ,start_time, end_time)
+            short_audio_array, short_voice_time = load_clip(short_voice_path, set_sr)
+
+        # The fingerprint recognizer only needs to be initialized once, so it is shared by every window
+        anlyzer = FingerprintIdentifier()
+        # Matches of earlier queries are answered from the result cache, without downloading the original again
+        result_cache = ResultCache()
+        cache_params = search_params(anlyzer)
+        window_plan = None
+
+        # Local files are searched without downloading, a directory file by file
+        long_voice_paths = list_media_files(long_voice_url) if long_url_source == "directory" else [long_voice_url]
+
+        found_any = False
+        for long_voice_path in long_voice_paths:
+            if long_url_source == "directory":
+                print(f"\nSearching the original file : {long_voice_path}")
+            identity = original_identity(long_voice_path, "file" if long_url_source == "directory" else long_url_source)
+            result_key = cache_key(short_audio_array, identity, cache_params)
+            result = result_cache.get(result_key)
+            if result is not None:
+                print(f"Cached result (stored {result['cache_age_seconds'] / 86400:.1f} days ago), Best count : {result['score']}")
             else:
-                segment_length = int(short_voice_time) *15  # Segment length,The multiplier is tested and can be adjusted as needed
-            seg_index = 0                                   # Segment index
-            current_start = 0                               # Current start time
-           
-
-            # 3) Start sliding detection
-
-            while current_start < spilt_long_voice_time:
-                # Set the query time range, ensuring it does not exceed the audio range
-                # The current start time minus the overlap area represents the start point, 
-                # and the current start time plus the segment length plus the overlap area gives the end point of the query time range
-                seg_start = max(current_start-overlap, 0)
-                seg_end   = min(current_start + segment_length + overlap, spilt_long_voice_time)
-                if seg_start >= seg_end:
+                checkpoint = ScanCheckpoint(CHECKPOINT_PATH, result_key)
+                if checkpoint.resumed:
+                    print("Resuming the interrupted search of this original")
+                if long_url_source in ("file", "directory"):
+                    long_voice_time = librosa.get_duration(path=long_voice_path)
+                elif checkpoint.original() is not None:
+                    # Downloaded completely before the interruption
+                    downloaded = True
+                    long_voice_path, long_voice_time = checkpoint.original()
+                else:
+                    # Download the long audio and get its duration
+                    downloaded = True
+                    long_voice_time = Download(long_voice_url, download_file_output_path).get_time_info()
+                    long_voice_path = download_sound_file(long_voice_url, download_file_output_path, 1,long_url_source)
+                    checkpoint.record_original(long_voice_path, long_voice_time)
+                if window_plan is None:
+                    # A resumed search keeps its window plan, a new measurement could move the windows
+                    window_plan = checkpoint.get("window_plan")
+                if window_plan is None:
+                    # The original multipliers of the clip duration, like the command line without --window-policy
+                    window_plan = FixedWindowPolicy().plan(short_audio_array, short_voice_time, anlyzer)
+                checkpoint.set("window_plan", window_plan)
+                result = search_original(short_audio_array, short_voice_time, long_voice_path, long_voice_time, set_sr, anlyzer, window_plan, checkpoint)
+                result_cache.put(result_key, result)
+                checkpoint.clear()
+                # Remove the split files of this original before the next one is split
+                if pathlib.Path("./segment").exists():
+                    shutil.rmtree("./segment")
+            if result["found"]:
+                found_any = True
+                print(f"Final corresponding time = {result['timestamp']}")
+                # A batch keeps going, the clip may appear in several originals
+                if long_url_source != "directory":
                     break
 
-                print(f"Query time range : {time_format.sec_to_time(spilt_segment_index_start*split_duration+seg_start)} ~ {time_format.sec_to_time(spilt_segment_index_start*split_duration+seg_end)} ")
-
-                # Apply sliding window processing to the segmented files generated earlier.
-                spilt_long_audio_array=SlidingWindowProcessor.split_audio(long_audio_array, seg_start, seg_end, 16000)
-
-                # 4) Compare to determine if the segment contains the short audio
-                is_match, best_count = anlyzer.identify(spilt_long_audio_array, short_audio_array)
-                print(f"Match : {is_match}, Best count : {best_count}")
-
-                # 5) If a match is found, calculate the offset and return the time
-                if is_match:
-                    print("This fragment matches\n")
-                    offset_in_seg = search_subclip.find_offset(spilt_long_audio_array, set_sr,short_audio_array, 10)
-                    # Calculate the time relative to the entire audio
-                    global_offset_sec = spilt_segment_index_start*split_duration+seg_start + offset_in_seg
-                    result = time_format.sec_to_time(int(global_offset_sec))
-                    print(f"Final corresponding time = {result}")
-                    # Record the end time of the process
-                    process_end_time=time.time()
-                    # If the segment contains the short audio, exit the loop
-                    # Return the processing time
-                    return round(process_end_time-process_start_time,2)
-                else:
-                    print("This fragment does not match")
-
-                # Update the start time and segment index
-                current_start += segment_length
-                seg_index += 1
-            # If no match is found, output a message
-            print("No matching segment found in this split file, loading the next segment...")
-            # Delete the downloaded audio files
-            
-            spilt_segment_index_start+=1
+        if found_any:
+            # Record the end time of the process
+            process_end_time=time.time()
+            # Return the processing time
+            return round(process_end_time-process_start_time,2)
 
         print("No matching segments found in the entire video")
         
     except Exception as e:
         print(f"An error occurred during processing:{str(e)}")
     finally:
+        if checkpoint is not None and not checkpoint.cleared:
+            # Interrupted: keep the downloaded and split files, the next run of this query resumes from them
+            checkpoint.save()
+            print(f"The search was interrupted, its progress is kept in {CHECKPOINT_PATH} : run the same query again to resume it")
+        else:
+            # Only the downloaded files are deleted, local inputs are never touched
+            need_delete_dir = download_file_output_path
+            if downloaded and pathlib.Path(need_delete_dir).exists():
+                shutil.rmtree(need_delete_dir)
+            need_delete_dir = "./segment"
+            if pathlib.Path(need_delete_dir).exists():
+                shutil.rmtree(need_delete_dir)
+            
+def process_compilation(compilation_url, long_voice_url, compilation_url_source, long_url_source):
+    """
+    Locate every clip of a highlight compilation in one pass (compilation.py):
+    1) Download the whole compilation, a local file is used as it is
+    2) Fingerprint every original once into an index, one split file at a time
+    3) Match the whole compilation against the index and print one line per clip
+    args:
+        compilation_url: str, Compilation URL or local file
+        long_voice_url: str, Long audio URL, local file or directory
+        compilation_url_source: str, Compilation source (twitch, youtube or file)
+        long_url_source: str, Long audio source (twitch, youtube, file or directory)
+    """
+    process_start_time=time.time()
+    download_file_output_path="./audio"
+    downloaded = False
+    try:
+        set_sr=16000
+        if compilation_url_source == "file":
+            compilation_array, _ = load_clip(compilation_url, set_sr)
+        else:
+            downloaded = True
+            compilation_path = download_sound_file(compilation_url, download_file_output_path, 1, compilation_url_source)
+            compilation_array, _ = load_clip(compilation_path, set_sr)
+
+        anlyzer = FingerprintIdentifier()
+        long_voice_paths = list_media_files(long_voice_url) if long_url_source == "directory" else [long_voice_url]
+
+        def originals():
+            for video_id in long_voice_paths:
+                if long_url_source == "directory":
+                    print(f"\nFingerprinting the original : {video_id}")
+                long_voice_path = video_id
+                if long_url_source in ("file", "directory"):
+                    long_voice_time = librosa.get_duration(path=long_voice_path)
+                else:
+                    long_voice_time = Download(long_voice_url, download_file_output_path).get_time_info()
+                    long_voice_path = download_sound_file(long_voice_url, download_file_output_path, 1,long_url_source)
+                segment_paths = split_long_audio(LargeAudioSplitter, long_voice_path, long_voice_time, 3600, "./segment/segments")
+                yield video_id, (librosa.load(path, sr=set_sr)[0] for path in segment_paths)
+                # Remove the split files of this original before the next one is split
+                if pathlib.Path("./segment").exists():
+                    shutil.rmtree("./segment")
+
+        # A URL original is downloaded into the same folder as the compilation
+        downloaded = downloaded or long_url_source not in ("file", "directory")
+        result = locate_compilation(index_originals(anlyzer, originals()), [compilation_array])
+        for clip in result["clips"]:
+            print(f"{clip['compilation_timestamp']} - {time_format.sec_to_time(int(clip['compilation_end']))} of the compilation = {clip['original_timestamp']} of {clip['video_id']} (count : {clip['score']})")
+        if result["clips"]:
+            print(f"{len(result['clips'])} clips found, {result['matched_seconds']:.0f} of {result['compilation_seconds']:.0f} seconds of the compilation matched")
+            return round(time.time()-process_start_time,2)
+
+        print("No clip of the compilation was found in the original video")
+
+    except Exception as e:
+        print(f"An error occurred during processing:{str(e)}")
+    finally:
+        # Only the downloaded files are deleted, local inputs are never touched
         need_delete_dir = download_file_output_path
-        if pathlib.Path(short_voice_path).exists():
+        if downloaded and pathlib.Path(need_delete_dir).exists():
             shutil.rmtree(need_delete_dir)
         need_delete_dir = "./segment"
         if pathlib.Path(need_delete_dir).exists():
             shutil.rmtree(need_delete_dir)
-            
+
 def filter_warning():
     """
     Filter out specific warnings to avoid cluttering the output.
@@ -285,14 +428,16 @@ def main_menu():
     while True:
         print("Please select a function:")
         print("1. Find the position of the highlight video in the original video")
-        print("2. Exit")
+        print("2. Find every clip of a highlight compilation in the original video")
+        print("3. Exit")
         choice = input("Please select : ")
         if choice == '1':
             print("Search function selected.\n")
             # Get the URL of the short and long audio files
             # The URL type is also returned (twitch or youtube)
-            short_url,short_url_source = get_url("Please enter the highlight video URL  (YouTube or Twitch) : ")
-            long_url,long_url_source = get_url("Please enter the original video (live stream) URL (YouTube or Twitch) : ")
+            # Local files are also accepted, and a directory of originals is searched file by file
+            short_url,short_url_source = get_url("Please enter the highlight video URL  (YouTube or Twitch) or file path : ")
+            long_url,long_url_source = get_url("Please enter the original video (live stream) URL (YouTube or Twitch), file or directory path : ", allow_directory=True)
             print("Highlight video source :",short_url_source)
             print("Original video source :",long_url_source)
 
@@ -304,6 +449,17 @@ def main_menu():
             print(f"Processing time : {process_time} seconds")
             print("Query completed.\n")
         elif choice == '2':
+            print("Compilation function selected.\n")
+            # The whole compilation is used, no time range is asked
+            compilation_url,compilation_url_source = get_url("Please enter the highlight compilation URL  (YouTube or Twitch) or file path : ")
+            long_url,long_url_source = get_url("Please enter the original video (live stream) URL (YouTube or Twitch), file or directory path : ", allow_directory=True)
+            print("Highlight compilation source :",compilation_url_source)
+            print("Original video source :",long_url_source)
+
+            process_time=process_compilation(compilation_url, long_url, compilation_url_source, long_url_source)
+            print(f"Processing time : {process_time} seconds")
+            print("Query completed.\n")
+        elif choice == '3':
             print("Goodbye!")
             break
         else:
@@ -0,0 +1,40 @@
+"""
+Choice of the part of a long clip that votes (FingerprintIdentifier query_seconds).
+
+Every pair of the clip is looked up and voted with in every window, so a 3 minute clip costs 18 times the voting
+of a 10 second one, while a fraction of it already gives far more votes than min_count. Not every part of a clip is
+worth the same: silence and speech pauses have few pairs, and a repeated chorus or a background loop has pairs whose
+hashkey comes back again and again, which are the ones a wrong window shares too. Every pair of the clip scores
+1 / (occurrences of its hashkey in the clip), times the stoplist weight of the hashkey if there is a stoplist, and
+the region of the clip with the highest total score (dense and distinctive) is the one that votes.
+
+The pairs keep their time in the clip, so the offset the vote finds is still the start of the whole clip.
+"""
+
+import numpy as np
+
+
+def best_query_region(hashes, times, region_frames, key_weights=None):
+    """
+    Return (first_frame, end_frame) of the region of region_frames frames whose pairs have the highest total
+    distinctiveness, the earliest one on a tie. The whole clip if it is not longer than region_frames.
+    args:
+        hashes: ndarray, Packed hashkeys of the clip pairs (fingerprint_arrays)
+        times: ndarray, Anchor frames of the clip pairs
+        region_frames: int, Length of the region in frames
+        key_weights: callable(keys) returning a weight per distinct hashkey (sorted), 1 for every key if None
+    """
+    times = np.asarray(times, dtype=np.int64)
+    if len(times) == 0:
+        return 0, region_frames
+    keys, inverse, occurrences = np.unique(hashes, return_inverse=True, return_counts=True)
+    key_scores = 1.0 / occurrences
+    if key_weights is not None:
+        key_scores = key_scores * key_weights(keys)
+    frame_scores = np.bincount(times, weights=key_scores[inverse])
+    if len(frame_scores) <= region_frames:
+        return 0, max(region_frames, len(frame_scores))
+    totals = np.r_[0.0, np.cumsum(frame_scores)]
+    region_scores = totals[region_frames:] - totals[:-region_frames]
+    first_frame = int(np.argmax(region_scores))
+    return first_frame, first_frame + region_frames
@@ -0,0 +1,221 @@
+"""
+Memory budget aware sizing of the search.
+
+The pipeline used to split the original into one hour files whatever the machine: decoding one hour of 44.1 kHz
+stereo audio peaks at about 1.8 GB (librosa decodes at the native rate before resampling), which is too much for
+small containers and leaves big machines idle. ResourceGovernor takes a memory budget (or detects the cgroup
+limit of the container) and chooses the split duration, the sliding window length and the number of parallel
+workers so that the predicted peak RSS stays within the budget. The prediction is reported next to the measured
+peak RSS so the model can be checked on every run.
+
+The memory model (calibrated with librosa 0.10 and the numpy STFT of fingerprint.py):
+    decoding a file:  seconds * source_sr * (source_channels + 1) * 4 bytes (native samples plus the mono mix)
+    decoded audio:    seconds * sr * 4 bytes, held while its windows are searched
+    one window:       seconds * sr / hop_length * (n_fft / 2 + 1) * STFT_BYTES_PER_BIN (spectrogram, dB and peak filter)
+"""
+
+import os
+
+from locator import window_geometry
+
+# Bytes per spectrogram bin held while a window is identified (complex STFT, magnitude in dB, maximum filter)
+STFT_BYTES_PER_BIN = 20
+
+# Budget sources that limit the whole process; the available (or free) memory already leaves out what it holds
+LIMIT_SOURCES = ("argument", "cgroup v2", "cgroup v1")
+
+# Split durations the governor chooses from, in seconds
+SPLIT_DURATIONS = (300, 600, 900, 1200, 1800, 3600, 7200, 10800, 14400, 21600)
+
+
+def _read_first_line(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def _meminfo_available_mb():
+    # MemAvailable counts the page cache the kernel can drop, MemFree (SC_AVPHYS_PAGES) does not
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def detect_memory_limit_mb():
+    """
+    Return (limit_mb, source): the cgroup memory limit of this process (v2, then v1), else the available memory
+    (MemAvailable of /proc/meminfo, or the free memory where there is no /proc/meminfo).
+    source is "cgroup v2", "cgroup v1", "available memory", "free memory", or None when nothing could be detected.
+    """
+    value = _read_first_line("/sys/fs/cgroup/memory.max")
+    if value and value != "max":
+        return int(value) / (1024 * 1024), "cgroup v2"
+    value = _read_first_line("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    # cgroup v1 reports "no limit" as a huge number close to the maximum int64
+    if value and int(value) < 2 ** 60:
+        return int(value) / (1024 * 1024), "cgroup v1"
+    available_mb = _meminfo_available_mb()
+    if available_mb is not None:
+        return available_mb, "available memory"
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") / (1024 * 1024), "free memory"
+    except (AttributeError, ValueError, OSError):
+        return None, None
+
+
+def detect_cpu_count():
+    """
+    Return the number of CPUs this process may use: the cgroup CPU quota if there is one, else the CPU affinity.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count() or 1
+    quota = None
+    value = _read_first_line("/sys/fs/cgroup/cpu.max")
+    if value and not value.startswith("max"):
+        limit, period = value.split()[:2]
+        quota = int(limit) / int(period)
+    else:
+        limit = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+    if quota is not None:
+        count = min(count, max(1, int(quota)))
+    return max(1, count)
+
+
+def current_rss_mb():
+    """
+    Return the current resident set size of this process in MB, or None if it cannot be read (Linux only).
+    """
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class ResourceGovernor:
+    """
+    Choose the split duration, the sliding window and the parallelism that fit a memory budget.
+
+    args:
+        memory_budget_mb: float, Memory the process may use, None detects the cgroup limit (or the available memory)
+        cpu_count: int, CPUs available for parallel workers, None detects them
+        sr, n_fft, hop_length: Fingerprinting parameters (see FingerprintIdentifier)
+        source_sr: int, Sampling rate of the downloaded audio (YouTube m4a is 44.1 kHz, opus 48 kHz)
+        source_channels: int, Channels of the downloaded audio
+        headroom: float, Fraction of the budget kept free for the allocator, ffmpeg and everything not modelled
+        windows_per_job: int, Sliding windows per job of a parallel (distributed) scan
+
+    methods:
+        plan(short_voice_time, long_voice_time, baseline_mb, geometry): Return the plan dictionary.
+        decode_mb(seconds), audio_mb(seconds), window_mb(seconds): Memory model of the pipeline stages.
+    """
+
+    def __init__(self, memory_budget_mb=None, cpu_count=None, sr=16000, n_fft=2048, hop_length=512, source_sr=48000,
+                 source_channels=2, headroom=0.15, windows_per_job=8):
+        self.budget_source = "argument"
+        if memory_budget_mb is None:
+            memory_budget_mb, self.budget_source = detect_memory_limit_mb()
+        self.memory_budget_mb = memory_budget_mb
+        self.cpu_count = cpu_count or detect_cpu_count()
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.source_sr = source_sr
+        self.source_channels = source_channels
+        self.headroom = headroom
+        self.windows_per_job = windows_per_job
+
+    def decode_mb(self, seconds):
+        return seconds * self.source_sr * (self.source_channels + 1) * 4 / (1024 * 1024)
+
+    def audio_mb(self, seconds):
+        return seconds * self.sr * 4 / (1024 * 1024)
+
+    def window_mb(self, seconds):
+        frames = seconds * self.sr / self.hop_length
+        return frames * (self.n_fft // 2 + 1) * STFT_BYTES_PER_BIN / (1024 * 1024) + self.audio_mb(seconds)
+
+    def sequential_peak_mb(self, baseline_mb, split_duration, window_seconds):
+        # The previous split file is still held while the next one is decoded
+        return baseline_mb + self.audio_mb(split_duration) + max(self.decode_mb(split_duration), self.window_mb(window_seconds))
+
+    def parallel_peak_mb(self, baseline_mb, workers, job_seconds, window_seconds):
+        # Every worker decodes only the range of its job, then identifies its windows one by one
+        per_worker = self.decode_mb(job_seconds) + self.audio_mb(job_seconds) + self.window_mb(window_seconds)
+        return baseline_mb + workers * per_worker
+
+    def plan(self, short_voice_time, long_voice_time, baseline_mb=None, geometry=None):
+        """
+        Return the plan for a clip of short_voice_time seconds searched in an original of long_voice_time seconds:
+            split_duration: int, Duration of each split file in seconds
+            segment_length, overlap: float, Sliding window geometry (the requested one unless it does not fit)
+            workers: int, Number of parallel workers (1 means the sequential search)
+            predicted_peak_mb: float, Predicted peak RSS of the search
+            fits: bool, False if even the smallest plan is predicted to exceed the budget
+            memory_budget_mb, budget_source, baseline_mb, cpu_count: The inputs of the plan
+        args:
+            short_voice_time: float, Duration of the short audio in seconds
+            long_voice_time: float, Duration of the long audio in seconds
+            baseline_mb: float, Memory already used by the process, None reads the current RSS
+            geometry: (segment_length, overlap) chosen by a window policy, window_geometry(short_voice_time) if None
+        """
+        if baseline_mb is None:
+            baseline_mb = current_rss_mb() or 0.0
+        usable_mb = None if self.memory_budget_mb is None else self.memory_budget_mb * (1 - self.headroom)
+        if usable_mb is not None and self.budget_source not in LIMIT_SOURCES:
+            # The peaks are RSS including the baseline, which the available memory does not include
+            usable_mb += baseline_mb
+        segment_length, overlap = geometry or window_geometry(short_voice_time)
+
+        # Shrink the window until one window fits next to the smallest split file
+        minimum_length = max(int(short_voice_time) * 2, 30)
+        while usable_mb is not None and segment_length > minimum_length and \
+                self.sequential_peak_mb(baseline_mb, SPLIT_DURATIONS[0], segment_length + 2 * overlap) > usable_mb:
+            segment_length = max(minimum_length, int(segment_length * 0.8))
+        window_seconds = segment_length + 2 * overlap
+
+        # The longest split that fits, a split at least as long as the original means no split at all
+        split_duration = SPLIT_DURATIONS[0]
+        for candidate in SPLIT_DURATIONS:
+            if usable_mb is not None and self.sequential_peak_mb(baseline_mb, candidate, window_seconds) > usable_mb:
+                break
+            split_duration = candidate
+            if candidate > long_voice_time:
+                break
+        predicted_peak_mb = self.sequential_peak_mb(baseline_mb, min(split_duration, long_voice_time), window_seconds)
+
+        # Parallel workers when there are CPUs and memory for more than one
+        workers = 1
+        job_seconds = self.windows_per_job * segment_length + 2 * overlap
+        job_count = -(-long_voice_time // (self.windows_per_job * segment_length))
+        for candidate in range(2, min(self.cpu_count, int(job_count)) + 1):
+            if usable_mb is not None and self.parallel_peak_mb(baseline_mb, candidate, job_seconds, window_seconds) > usable_mb:
+                break
+            workers = candidate
+        if workers > 1:
+            predicted_peak_mb = self.parallel_peak_mb(baseline_mb, workers, job_seconds, window_seconds)
+
+        return {
+            "split_duration": split_duration,
+            "segment_length": segment_length,
+            "overlap": overlap,
+            "workers": workers,
+            "predicted_peak_mb": predicted_peak_mb,
+            "fits": usable_mb is None or predicted_peak_mb <= usable_mb,
+            "memory_budget_mb": self.memory_budget_mb,
+            "budget_source": self.budget_source,
+            "baseline_mb": baseline_mb,
+            "cpu_count": self.cpu_count,
+        }
@@ -0,0 +1,247 @@
+"""
+Persistent cache of search results for repeated (clip, original) queries.
+
+The same highlight is often looked up more than once (by different editors, or again after a crash), and every
+lookup used to repeat the whole download and scan of the original. ResultCache stores the result of a search
+under a key made of
+    - a content hash of the decoded clip audio (the same section of the same video decodes to the same samples),
+    - the identity of the original: the YouTube / Twitch video ID, or the path, size and modification time of a local file,
+    - the parameters of the matcher (FingerprintIdentifier.get_params plus the search options that change the answer),
+so a repeated query returns the stored timestamp and score before the original is downloaded.
+
+Only matches are stored: a miss is searched again, the original may have grown since (a VOD of a stream that was
+still live) or the clip range may have been wrong. Entries expire after ttl_seconds, and the least recently used
+ones are evicted above max_entries. The cache is one JSON file, written atomically, so a crash cannot corrupt it;
+every read-modify-write holds a lock of the process and a lock on the file, so concurrent writers do not lose entries.
+
+The cache file is ~/.cache/highlightlocator/results.json unless the environment variable HIGHLIGHTLOCATOR_RESULT_CACHE
+gives another path; HIGHLIGHTLOCATOR_RESULT_CACHE=off disables it (the command line also has --no-result-cache).
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the lock of this module still serializes the caches of one process
+    fcntl = None
+
+# Environment variable holding the path of the cache file, or "off"
+CACHE_ENVIRONMENT_VARIABLE = "HIGHLIGHTLOCATOR_RESULT_CACHE"
+
+# Result fields stored in the cache, everything else describes one run (timings, plans, memory)
+CACHED_FIELDS = ("found", "offset_seconds", "timestamp", "score", "segment_index", "window", "original_seconds")
+
+# Search options of a default search (cli.py without options, the interactive menus), so they share their entries
+DEFAULT_SEARCH_OPTIONS = {
+    "window_policy": "fixed",
+    "scan_order": "time",
+    "confident_count": None,
+    "skip_low_information": False,
+    "stoplist": None,
+    "stream_stoplist": None,
+    "query_seconds": 0,
+}
+
+# Shared by every ResultCache of the process, several instances may use the same file
+_FILE_LOCK = threading.Lock()
+
+_YOUTUBE_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/live/|/embed/)([A-Za-z0-9_-]{11})")
+_TWITCH_ID = re.compile(r"twitch\.tv/videos/(\d+)")
+
+
+def default_cache_path():
+    """
+    Return the path of the cache file, or None if the cache is disabled by the environment.
+    """
+    value = os.environ.get(CACHE_ENVIRONMENT_VARIABLE)
+    if value is not None and value.strip().lower() in ("", "0", "off", "no", "false"):
+        return None
+    return value or os.path.join(os.path.expanduser("~"), ".cache", "highlightlocator", "results.json")
+
+
+def clip_digest(short_audio_array):
+    """
+    Return the SHA-256 content hash of the decoded clip samples.
+    """
+    return hashlib.sha256(np.ascontiguousarray(short_audio_array, dtype=np.float32).tobytes()).hexdigest()
+
+
+def original_identity(source, source_type):
+    """
+    Return a string identifying the original: "youtube:<video id>", "twitch:<vod id>" or
+    "file:<absolute path>:<size>:<modification time>" (a replaced or edited file gets a new identity).
+    args:
+        source: str, URL or path of the original
+        source_type: str, youtube, twitch or file (see cli.classify_source)
+    """
+    if source_type == "youtube":
+        match = _YOUTUBE_ID.search(source)
+        if match:
+            return f"youtube:{match.group(1)}"
+    elif source_type == "twitch":
+        match = _TWITCH_ID.search(source)
+        if match:
+            return f"twitch:{match.group(1)}"
+    elif source_type == "file":
+        status = os.stat(source)
+        return f"file:{os.path.abspath(source)}:{status.st_size}:{status.st_mtime_ns}"
+    # A URL without a recognizable ID (a channel page, a clip URL) is identified by the URL itself
+    return f"{source_type}:{source}"
+
+
+def search_params(analyzer, **options):
+    """
+    Return the matcher parameters and the search options that can change the answer (DEFAULT_SEARCH_OPTIONS
+    updated with options), the part of the cache key that does not depend on the clip and the original.
+    """
+    return {**analyzer.get_params(), **DEFAULT_SEARCH_OPTIONS, **options}
+
+
+def cache_key(short_audio_array, original, params):
+    """
+    Return the cache key of a query.
+    args:
+        short_audio_array: ndarray, Decoded clip
+        original: str, Result of original_identity
+        params: dict, Result of search_params
+    """
+    text = json.dumps({"clip": clip_digest(short_audio_array), "original": original, "params": params}, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Search results stored in a JSON file, with time-to-live and least recently used eviction.
+
+    args:
+        path: str, Cache file, default_cache_path() if None (when that is None too, the cache is disabled:
+            get finds nothing and put stores nothing)
+        ttl_seconds: float, Entries older than this are expired (default 30 days)
+        max_entries: int, The least recently used entries are evicted above this count
+
+    methods:
+        get(key): Return the stored result of a key (with "cache_age_seconds"), or None.
+        put(key, result): Store the result of a search if it is a match, return True if it was stored.
+        clear(): Remove every entry.
+        stats(): Return the number of entries, hits, misses and evictions of this process.
+    """
+
+    def __init__(self, path=None, ttl_seconds=30 * 24 * 3600, max_entries=1000):
+        self.path = path or default_cache_path()
+        self.enabled = self.path is not None
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            # A missing or unreadable cache is an empty cache
+            return {}
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # The lock of the module serializes the threads, the lock file the processes
+        with _FILE_LOCK:
+            if fcntl is None:
+                yield
+                return
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                lock_file = open(f"{self.path}.lock", "a")
+            except OSError:
+                # A read-only directory cannot be written anyway
+                yield
+                return
+            with lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self, entries):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": entries}, f)
+        os.replace(temporary_path, self.path)
+
+    def _evict(self, entries, now):
+        expired = [key for key, entry in entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del entries[key]
+        overflow = len(entries) - self.max_entries
+        if overflow > 0:
+            for key in sorted(entries, key=lambda key: entries[key]["last_used"])[:overflow]:
+                del entries[key]
+        removed = len(expired) + max(0, overflow)
+        self.evictions += removed
+        return removed
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._locked():
+            now = time.time()
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None or now - entry["created"] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = now
+            try:
+                self._save(entries)
+            except OSError:
+                pass
+            return dict(entry["result"], cache_age_seconds=now - entry["created"])
+
+    def put(self, key, result):
+        if not self.enabled or not result.get("found"):
+            return False
+        with self._locked():
+            now = time.time()
+            entries = self._load()
+            entries[key] = {
+                "created": now,
+                "last_used": now,
+                "result": {field: result.get(field) for field in CACHED_FIELDS},
+            }
+            self._evict(entries, now)
+            try:
+                self._save(entries)
+            except OSError:
+                # A read-only home directory must not fail the search that was just completed
+                return False
+            return True
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._locked():
+            self._save({})
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "entries": len(self._load()) if self.enabled else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
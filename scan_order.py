@@ -0,0 +1,80 @@
+"""
+Scan orders of the sliding window search.
+
+By default locator.search_long_audio searches the windows from the start of the stream forward, so a clip
+from late in a stream takes the longest to find. Highlights tend to fall in loud, busy moments, so
+LoudnessScanOrder computes a cheap loudness and onset density profile of every window (one pass over the
+decoded samples, no STFT) and the search visits the windows with the highest priority first.
+Every window is still searched once if nothing confident is found earlier (see locator._prioritized_search).
+"""
+
+import numpy as np
+
+
+class LoudnessScanOrder:
+    """
+    Priority of a window = loudness of its loud frames (dBFS) + onset_weight_db * onsets per second.
+
+    The loudness is the given percentile of the frame levels, so a window is not penalised by a few quiet
+    seconds; an onset is a frame at least onset_db louder than the one before (a hit, a shout, a burst of noise).
+
+    args:
+        frame_seconds: float, Length of the frames of the loudness envelope
+        percentile: float, Percentile of the frame levels used as the loudness of a window
+        onset_db: float, Level rise between two frames counted as an onset
+        onset_weight_db: float, dB of priority per onset per second
+        cache_seconds: float, Seconds of window audio kept from the profiling pass and searched first
+            (their split files do not have to be decoded again)
+        confident_count: int, A match with at least this score stops the search (default analyzer.min_count);
+            weaker matches are kept and the best one is returned once every window has been searched
+
+    methods:
+        envelope(audio, sr): Return the level of every frame in dBFS.
+        window_priorities(audio, sr, windows): Return the priority of every window of a split file.
+    """
+
+    name = "loudness"
+
+    def __init__(self, frame_seconds=0.05, percentile=90, onset_db=6.0, onset_weight_db=2.0, cache_seconds=1800,
+                 confident_count=None):
+        self.frame_seconds = frame_seconds
+        self.percentile = percentile
+        self.onset_db = onset_db
+        self.onset_weight_db = onset_weight_db
+        self.cache_seconds = cache_seconds
+        self.confident_count = confident_count
+
+    def envelope(self, audio, sr):
+        frame = max(1, int(self.frame_seconds * sr))
+        frame_count = len(audio) // frame
+        if frame_count == 0:
+            return np.zeros(0)
+        frames = audio[:frame_count * frame].reshape(frame_count, frame).astype(np.float64)
+        return 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    def window_priorities(self, audio, sr, windows):
+        """
+        args:
+            audio: ndarray, Decoded split file
+            sr: int, Sampling rate
+            windows: List[Tuple], (current_start, seg_start, seg_end, advance) of every window, in seconds
+        """
+        levels = self.envelope(audio, sr)
+        onsets = np.concatenate([[0], np.cumsum(np.diff(levels) >= self.onset_db)]) if len(levels) else levels
+        priorities = []
+        for _, seg_start, seg_end, _ in windows:
+            first = int(seg_start / self.frame_seconds)
+            last = max(first + 1, min(len(levels), int(seg_end / self.frame_seconds)))
+            if first >= len(levels):
+                priorities.append(-100.0)
+                continue
+            loudness = np.percentile(levels[first:last], self.percentile)
+            onset_rate = (onsets[last - 1] - onsets[first]) / max(seg_end - seg_start, 1e-9)
+            priorities.append(float(loudness + self.onset_weight_db * onset_rate))
+        return priorities
+
+
+SCAN_ORDERS = {
+    "time": None,
+    LoudnessScanOrder.name: LoudnessScanOrder,
+}
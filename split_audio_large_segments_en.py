@@ -1,7 +1,7 @@
 import subprocess
 import os
 class LargeAudioSplitter:
-    def split_audio_ffmpeg(input_file, segment_duration, output_prefix):
+    def split_audio_ffmpeg(input_file, segment_duration, output_prefix, extension="m4a"):
         """
         Split the audio file using FFmpeg and save the segments.
 
@@ -9,6 +9,7 @@ class LargeAudioSplitter:
             input_file (str): Path to the input audio file.
             segment_duration (int): Duration of each segment (in seconds).
             output_prefix (str): Prefix path for the output segment files.
+            extension (str): Extension (container) of the output segment files.
 
         Returns:
             None
@@ -23,10 +24,11 @@ class LargeAudioSplitter:
             "ffmpeg",
             "-loglevel", "quiet",
             "-i", input_file,
+            "-vn",                  # Local originals can be videos, only the audio is searched
             "-f", "segment",
             "-segment_time", str(segment_duration),
             "-c", "copy",
-            f"{output_prefix}_%03d.m4a"
+            f"{output_prefix}_%03d.{extension}"
         ]
         subprocess.run(cmd, check=True)
         print(f"The audio file has been successfully divided into {segment_duration} second segments. Files are saved as: {output_prefix}_xxx.wav\n")
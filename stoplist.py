@@ -0,0 +1,96 @@
+"""
+Stoplist of popular fingerprint hashkeys, the audio counterpart of the stop words of a text search engine.
+
+A stream with a background loop, an alert sound or a long silent stretch repeats the same hashkeys in almost every
+window. A clip that contains them gets votes in every one of those windows, so a wrong window can reach min_count
+on chance votes alone, and every lookup of such a hashkey is work that does not move the answer. HashStoplist
+counts in how many reference windows each hashkey occurs; FingerprintIdentifier then drops the votes of the popular
+ones (stoplist_mode "skip") or keeps them with a lower weight ("weight").
+
+The statistics are learned while a stream is searched, or once over an archive and saved as JSON. A learning
+stoplist knows little in the first windows (nothing is popular before min_documents), and a true match made of
+popular hashkeys only, such as a clip of the recurring music itself, loses its votes in skip mode: weight mode
+keeps part of them, at the cost of some of the chance votes it was meant to remove.
+"""
+
+import json
+import threading
+from collections import Counter
+
+
+class HashStoplist:
+    """
+    Track how often each fingerprint hashkey (freqA, freqB, dt) occurs and mark the popular ones.
+
+    Repeated background music, alert sounds and the noise floor of silent stretches produce the same
+    hashkeys over and over. They carry almost no information about the position of a clip,
+    but every occurrence costs a vote in FingerprintIdentifier.identify.
+
+    The popularity of a hashkey is the fraction of reference fingerprints ("documents") that contain it:
+        - per stream: pass a learning stoplist to the FingerprintIdentifier, every reference window it
+          fingerprints is added before voting, so the statistics grow as the stream is searched
+        - per archive: add the fingerprints of many streams once, save() the stoplist and load() it later
+          with learn=False
+
+    args:
+        max_document_fraction: float, A hashkey found in more than this fraction of the documents is popular.
+        min_documents: int, No hashkey is popular before this many documents have been added.
+        learn: bool, If True, FingerprintIdentifier adds each reference window it fingerprints.
+
+    methods:
+        add(fingerprint): Count the hashkeys of one fingerprint (dict hashkey -> offsets).
+        is_popular(hashkey): True if the hashkey is above the cutoff.
+        weight(hashkey): Vote weight in [0, 1], 1 for rare hashkeys and lower the more popular it is.
+        save(path) / load(path): Store the counts as JSON.
+    """
+
+    def __init__(self, max_document_fraction=0.5, min_documents=4, learn=True):
+        self.max_document_fraction = max_document_fraction
+        self.min_documents = min_documents
+        self.learn = learn
+        self.document_counts = Counter()
+        self.documents = 0
+        self.lock = threading.Lock()
+
+    def add(self, fingerprint):
+        with self.lock:
+            self.document_counts.update(fingerprint.keys())
+            self.documents += 1
+
+    def cutoff(self):
+        """
+        Return the number of documents above which a hashkey is popular, or None while there are too few documents.
+        """
+        if self.documents < self.min_documents:
+            return None
+        return self.max_document_fraction * self.documents
+
+    def is_popular(self, hashkey):
+        cutoff = self.cutoff()
+        return cutoff is not None and self.document_counts.get(hashkey, 0) > cutoff
+
+    def weight(self, hashkey):
+        cutoff = self.cutoff()
+        count = self.document_counts.get(hashkey, 0)
+        if cutoff is None or count <= cutoff:
+            return 1.0
+        return cutoff / count
+
+    def save(self, path):
+        data = {
+            "max_document_fraction": self.max_document_fraction,
+            "min_documents": self.min_documents,
+            "documents": self.documents,
+            "counts": [[*hashkey, count] for hashkey, count in self.document_counts.items()],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path, learn=False):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        stoplist = cls(data["max_document_fraction"], data["min_documents"], learn)
+        stoplist.documents = data["documents"]
+        stoplist.document_counts = Counter({tuple(row[:3]): row[3] for row in data["counts"]})
+        return stoplist
@@ -4,6 +4,7 @@ class time_format:
     methods:
         sec_to_time(sec): Convert seconds to hours, minutes, and seconds.
         time_to_sec(hour, minute, second): Convert hours, minutes, and seconds to seconds.
+        str_to_sec(text): Convert "SS", "MM:SS" or "HH:MM:SS" to seconds.
     """
     def sec_to_time(sec):
         m, s = divmod(sec, 60)
@@ -11,6 +12,12 @@ class time_format:
         return "%02d:%02d:%02d" % (h, m, s)
     def time_to_sec(hour, minute, second):
         return int(hour) * 3600 + int(minute) * 60 + int(second)
+    def str_to_sec(text):
+        parts = str(text).strip().split(":")
+        if not 1 <= len(parts) <= 3:
+            raise ValueError(f"Invalid time format : {text}")
+        parts = [0] * (3 - len(parts)) + parts
+        return time_format.time_to_sec(*parts)
         
     
 
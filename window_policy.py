@@ -0,0 +1,136 @@
+"""
+Window planning policies of the sliding window search.
+
+A policy chooses the geometry of the sliding window (locator.search_long_audio, distributed.plan_jobs):
+the window advances by segment_length seconds and reaches overlap seconds into its neighbours on both sides.
+Every policy has the same interface:
+
+    plan(short_audio_array, short_voice_time, analyzer) -> dict with at least
+        policy: str, Name of the policy
+        segment_length: int, Seconds the window advances by
+        overlap: int, Seconds added on both sides of the window
+
+and the other keys describe how the plan was chosen, so the callers can log it.
+
+FixedWindowPolicy keeps the original multipliers (locator.window_geometry).
+AutoWindowPolicy measures the cost of one window and the fingerprint density of the clip and picks the
+shortest window whose overhead is within a tolerance, unless the chance votes expected in such a window
+would come too close to the match threshold.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from fingerprint import FingerprintIdentifier
+from locator import window_geometry
+
+# Mean best count of a window that does not contain the clip, per sqrt(query hashes * window seconds).
+# Fitted on the benchmark fixtures (0.0022 to 0.0050 for clips of 5 to 60 seconds, windows of 30 to 960 seconds).
+CHANCE_VOTE_RATE = 0.0035
+
+
+class FixedWindowPolicy:
+    """
+    The original geometry: segment_length is 15 times the clip (6 times above 60 seconds), overlap twice the clip.
+
+    methods:
+        plan(short_audio_array, short_voice_time, analyzer): Return the plan dictionary.
+    """
+
+    name = "fixed"
+
+    def plan(self, short_audio_array, short_voice_time, analyzer=None):
+        segment_length, overlap = window_geometry(short_voice_time)
+        return {"policy": self.name, "segment_length": segment_length, "overlap": overlap}
+
+
+class AutoWindowPolicy:
+    """
+    Choose the window from the measured cost per window and the fingerprint density of the clip.
+
+    The overlap only has to hold the whole clip (plus a guard), then every position of the clip lies entirely
+    inside one window. A window of segment_length seconds searches segment_length + 2 * overlap seconds of audio
+    and has a fixed cost on top, both measured by identifying a reference made of the reversed clip. The cost
+    bound is the shortest segment_length whose extra work stays within overhead_tolerance of the audio it
+    advances by. The accuracy bound is the longest window in which the expected chance votes of a clip with
+    this many query hashes stay below chance_fraction * min_count. The accuracy bound wins when they conflict.
+
+    args:
+        overhead_tolerance: float, Extra work allowed per window, as a fraction of the audio it advances by
+        chance_fraction: float, Fraction of min_count the expected chance votes of a window may reach
+        guard_seconds: int, Seconds of overlap added to the clip duration
+        min_length: int, Shortest segment_length, default the clip duration (at least 10 seconds)
+        max_length: int, Longest segment_length
+        calibration_seconds: Tuple[int, int], Lengths of the two windows timed to measure the cost
+
+    methods:
+        plan(short_audio_array, short_voice_time, analyzer): Return the plan dictionary.
+    """
+
+    name = "auto"
+
+    def __init__(self, overhead_tolerance=0.2, chance_fraction=0.5, guard_seconds=2, min_length=None, max_length=3600,
+                 calibration_seconds=(30, 120)):
+        self.overhead_tolerance = overhead_tolerance
+        self.chance_fraction = chance_fraction
+        self.guard_seconds = guard_seconds
+        self.min_length = min_length
+        self.max_length = max_length
+        self.calibration_seconds = calibration_seconds
+
+    def measure_cost(self, short_audio_array, analyzer, sample_pairs):
+        """
+        Return (seconds_per_window, seconds_per_audio_second) of analyzer.identify_pairs, measured on two windows
+        made of the reversed clip (same spectral density as the clip, without its hashes in order).
+        """
+        short_length, long_length = self.calibration_seconds
+        reference = np.tile(short_audio_array[::-1], int(math.ceil(long_length * analyzer.sr / max(1, len(short_audio_array)))))
+        timings = []
+        for seconds in (short_length, short_length, long_length):
+            start = time.perf_counter()
+            analyzer.identify_pairs(reference[:int(seconds * analyzer.sr)], sample_pairs)
+            timings.append(time.perf_counter() - start)
+        # The first run only warms up the caches
+        per_second = max((timings[2] - timings[1]) / (long_length - short_length), 1e-6)
+        per_window = max(0.0, timings[1] - per_second * short_length)
+        return per_window, per_second
+
+    def plan(self, short_audio_array, short_voice_time, analyzer):
+        sample_pairs = analyzer.query_pairs(short_audio_array)
+        query_hashes = len(sample_pairs[0])
+        # Only the pairs of query_seconds of a longer clip vote
+        voted_seconds = min(short_voice_time, analyzer.query_seconds or short_voice_time)
+        overlap = int(math.ceil(short_voice_time)) + self.guard_seconds
+        min_length = self.min_length or max(int(math.ceil(short_voice_time)), 10)
+
+        # Time a plain copy of the analyzer, so the calibration neither feeds a learning stoplist nor the counters
+        per_window, per_second = self.measure_cost(short_audio_array, FingerprintIdentifier(**analyzer.get_params()), sample_pairs)
+        cost_length = (per_window / per_second + 2 * overlap) / self.overhead_tolerance
+        accuracy_length = None
+        if query_hashes:
+            accuracy_window = (self.chance_fraction * analyzer.min_count / (CHANCE_VOTE_RATE * math.sqrt(query_hashes))) ** 2
+            accuracy_length = accuracy_window - 2 * overlap
+        upper = self.max_length if accuracy_length is None else min(accuracy_length, self.max_length)
+        segment_length = int(max(min_length, min(cost_length, upper)))
+        window_seconds = segment_length + 2 * overlap
+        return {
+            "policy": self.name,
+            "segment_length": segment_length,
+            "overlap": overlap,
+            "query_hashes": query_hashes,
+            "hash_density": query_hashes / voted_seconds if voted_seconds else 0.0,
+            "seconds_per_window": per_window,
+            "seconds_per_audio_second": per_second,
+            "cost_length": cost_length,
+            "accuracy_length": accuracy_length,
+            "overhead": (per_window + per_second * 2 * overlap) / (per_second * segment_length),
+            "expected_chance_votes": CHANCE_VOTE_RATE * math.sqrt(query_hashes * window_seconds),
+        }
+
+
+WINDOW_POLICIES = {
+    FixedWindowPolicy.name: FixedWindowPolicy,
+    AutoWindowPolicy.name: AutoWindowPolicy,
+}